@@ -1,10 +1,14 @@
 import streamlit as st
-import anthropic
 import os
 from dotenv import load_dotenv
 import json
-import base64
-from pathlib import Path
+import time
+from collections import OrderedDict
+from result_cache import ResultCache, default_cache_path
+from image_asset import ImageAsset
+import http_client
+from request_hedging import HedgingPolicy
+from visual_product_analyzer import VisualProductAnalyzer
 
 load_dotenv()
 
@@ -379,24 +383,122 @@ tab1, tab2, tab3, tab4 = st.tabs([
     "🌍 Multilingual"
 ])
 
-# Helper function to encode image
-def encode_image(uploaded_file):
-    """Encode uploaded file to base64"""
-    uploaded_file.seek(0)
-    bytes_data = uploaded_file.read()
-    image_data = base64.standard_b64encode(bytes_data).decode("utf-8")
-    
-    suffix = Path(uploaded_file.name).suffix.lower()
-    media_types = {
-        '.jpg': 'image/jpeg',
-        '.jpeg': 'image/jpeg',
-        '.png': 'image/png',
-        '.gif': 'image/gif',
-        '.webp': 'image/webp'
-    }
-    media_type = media_types.get(suffix, 'image/jpeg')
-    
-    return image_data, media_type
+@st.cache_resource
+def get_result_cache():
+    """Result cache shared by every session of this server process"""
+    return ResultCache(default_cache_path())
+
+@st.cache_resource
+def get_client():
+    """One API client (and keep-alive connection pool) for every session and rerun"""
+    return http_client.get_client(api_key=api_key)
+
+@st.cache_resource
+def get_hedging_policy():
+    """Races requests slow to produce a first token against a duplicate"""
+    return HedgingPolicy(max_hedge_rate=0.05)
+
+@st.cache_resource
+def get_analyzer():
+    return VisualProductAnalyzer(cache=get_result_cache(), client=get_client(), hedging=get_hedging_policy())
+
+# Results this session has shown, so they survive reruns
+SESSION_RESULT_LIMIT = 32
+
+def remember(key, compute):
+    """
+    Result for a key from this session or compute(), kept in session_state
+    (oldest dropped past SESSION_RESULT_LIMIT). The analyzer's own cache is
+    shared by every session, so compute() is cheap for results seen before.
+    """
+    results = st.session_state.setdefault("results", OrderedDict())
+    if key not in results:
+        results[key] = compute()
+    results.move_to_end(key)
+    while len(results) > SESSION_RESULT_LIMIT:
+        results.popitem(last=False)
+    return results[key]
+
+def recall(key):
+    """Result this session already computed for a key, if any"""
+    return st.session_state.get("results", {}).get(key)
+
+def consume_stream(stream, on_item):
+    """
+    Run one of the analyzer's stream_* generators, calling on_item with
+    every item it yields. Leaves (time to first output, time to
+    completion) in session_state["last_timing"]; returns the stream's
+    result, or its last item for streams that do not return one.
+    """
+    start = time.perf_counter()
+    first_output = None
+    item = None
+    while True:
+        try:
+            item = next(stream)
+        except StopIteration as done:
+            result = item if done.value is None else done.value
+            break
+        if first_output is None:
+            first_output = time.perf_counter() - start
+        on_item(item)
+    st.session_state["last_timing"] = (first_output or 0.0, time.perf_counter() - start)
+    return result
+
+def show_timing(key):
+    """Caption with the latency of the request that produced a result"""
+    timing = st.session_state.setdefault("timings", {}).get(key)
+    if timing:
+        st.caption(f"⚡ First output in {timing[0]:.2f}s · complete in {timing[1]:.2f}s")
+
+def remember_streamed(key, compute):
+    """remember() that also keeps the timing of a freshly streamed result"""
+    st.session_state.pop("last_timing", None)
+    result = remember(key, compute)
+    if "last_timing" in st.session_state:
+        st.session_state.setdefault("timings", {})[key] = st.session_state.pop("last_timing")
+    return result
+
+def render_analysis(analysis, final=True):
+    """Analysis cards; partial analyses skip the JSON view and download"""
+    # Normalize keys
+    analysis_lower = {k.lower().replace(" ", "_"): v for k, v in analysis.items()}
+    
+    # Display results in cards
+    if "suggested_title" in analysis_lower:
+        st.markdown(f"""
+        <div class="result-card">
+            <h4>📌 Suggested Title</h4>
+            <p>{analysis_lower['suggested_title']}</p>
+        </div>
+        """, unsafe_allow_html=True)
+    
+    if "suggested_description" in analysis_lower:
+        st.markdown(f"""
+        <div class="result-card">
+            <h4>📝 Description</h4>
+            <p>{analysis_lower['suggested_description']}</p>
+        </div>
+        """, unsafe_allow_html=True)
+    
+    if analysis_lower.get("key_selling_points"):
+        st.markdown("#### 🎯 Key Selling Points")
+        for point in analysis_lower['key_selling_points']:
+            st.markdown(f'<div class="feature-item">✓ {point}</div>', unsafe_allow_html=True)
+    
+    if not final:
+        return
+    
+    with st.expander("📋 View Full Analysis (JSON)"):
+        st.json(analysis)
+    
+    st.download_button(
+        "💾 Download Analysis",
+        json.dumps(analysis, indent=2),
+        file_name="product_analysis.json",
+        mime="application/json",
+        use_container_width=True
+    )
 
 # Tab 1: Product Analysis
 with tab1:
@@ -417,94 +519,31 @@ with tab1:
             st.markdown("#### Ready to analyze")
             st.markdown("Click the button below to start AI analysis of your product image.")
             
+            image = ImageAsset(uploaded_file)
+            result_key = ("analysis", image.content_hash)
+            
+            def analyze():
+                def show_partial(partial):
+                    with live.container():
+                        render_analysis(partial, final=False)
+                
+                analysis = consume_stream(get_analyzer().stream_analyze_product_image(image), show_partial)
+                live.empty()
+                return analysis
+            
             if st.button("🚀 Analyze Product", key="analyze_btn", use_container_width=True):
-                with st.spinner("🔮 AI is analyzing your image..."):
-                    try:
-                        image_data, media_type = encode_image(uploaded_file)
-                        client = anthropic.Anthropic(api_key=api_key)
-                        
-                        prompt = """Analyze this product image and provide detailed information in JSON format.
-
-Extract:
-1. Product Type and Category
-2. Key Features (visible attributes)
-3. Colors (all visible colors)
-4. Materials (if identifiable)
-5. Condition Assessment
-6. Suggested Title (engaging product title)
-7. Suggested Description (2-3 sentences)
-8. Key Selling Points (3-5 bullet points)
-9. Target Audience
-
-Format as valid JSON."""
-
-                        message = client.messages.create(
-                            model="claude-sonnet-4-20250514",
-                            max_tokens=2000,
-                            messages=[{
-                                "role": "user",
-                                "content": [
-                                    {
-                                        "type": "image",
-                                        "source": {
-                                            "type": "base64",
-                                            "media_type": media_type,
-                                            "data": image_data,
-                                        },
-                                    },
-                                    {"type": "text", "text": prompt}
-                                ],
-                            }],
-                        )
-                        
-                        response_text = message.content[0].text
-                        if "```json" in response_text:
-                            response_text = response_text.split("```json")[1].split("```")[0].strip()
-                        elif "```" in response_text:
-                            response_text = response_text.split("```")[1].split("```")[0].strip()
-                        
-                        analysis = json.loads(response_text)
-                        
-                        st.success("✨ Analysis Complete!")
-                        
-                        # Normalize keys
-                        analysis_lower = {k.lower().replace(" ", "_"): v for k, v in analysis.items()}
-                        
-                        # Display results in cards
-                        if "suggested_title" in analysis_lower:
-                            st.markdown(f"""
-                            <div class="result-card">
-                                <h4>📌 Suggested Title</h4>
-                                <p>{analysis_lower['suggested_title']}</p>
-                            </div>
-                            """, unsafe_allow_html=True)
-                        
-                        if "suggested_description" in analysis_lower:
-                            st.markdown(f"""
-                            <div class="result-card">
-                                <h4>📝 Description</h4>
-                                <p>{analysis_lower['suggested_description']}</p>
-                            </div>
-                            """, unsafe_allow_html=True)
-                        
-                        if "key_selling_points" in analysis_lower:
-                            st.markdown("#### 🎯 Key Selling Points")
-                            for point in analysis_lower['key_selling_points']:
-                                st.markdown(f'<div class="feature-item">✓ {point}</div>', unsafe_allow_html=True)
-                        
-                        with st.expander("📋 View Full Analysis (JSON)"):
-                            st.json(analysis)
-                        
-                        st.download_button(
-                            "💾 Download Analysis",
-                            json.dumps(analysis, indent=2),
-                            file_name="product_analysis.json",
-                            mime="application/json",
-                            use_container_width=True
-                        )
-                        
-                    except Exception as e:
-                        st.error(f"❌ Error: {str(e)}")
+                # Fields render as soon as they are generated
+                live = st.empty()
+                try:
+                    remember_streamed(result_key, analyze)
+                    st.success("✨ Analysis Complete!")
+                except Exception as e:
+                    st.error(f"❌ Error: {str(e)}")
+            
+            analysis = recall(result_key)
+            if analysis is not None:
+                show_timing(result_key)
+                render_analysis(analysis)
 
 # Tab 2: Compare Images
 with tab2:
@@ -526,58 +565,35 @@ with tab2:
             st.image(image2, caption="Image B", use_column_width=True)
     
     if image1 and image2:
+        asset1 = ImageAsset(image1)
+        asset2 = ImageAsset(image2)
+        result_key = ("comparison", asset1.content_hash, asset2.content_hash)
+        
+        def compare():
+            chunks = []
+            
+            def show_text(chunk):
+                chunks.append(chunk)
+                live.markdown("".join(chunks) + "▌")
+            
+            comparison = consume_stream(get_analyzer().stream_compare_product_images(asset1, asset2), show_text)
+            live.empty()
+            return comparison
+        
         if st.button("🔄 Compare Images", key="compare_btn", use_container_width=True):
-            with st.spinner("🔮 Comparing images..."):
-                try:
-                    image1_data, media_type1 = encode_image(image1)
-                    image2_data, media_type2 = encode_image(image2)
-                    
-                    client = anthropic.Anthropic(api_key=api_key)
-                    
-                    prompt = """Compare these two product images and provide:
-
-1. **Similarities** - What's the same between both images
-2. **Differences** - What's different between them
-3. **Quality Assessment** - Which image is better for e-commerce and why
-4. **Recommendations** - Suggested improvements for each
-
-Be specific and detailed. Format with clear headers."""
-
-                    message = client.messages.create(
-                        model="claude-sonnet-4-20250514",
-                        max_tokens=1500,
-                        messages=[{
-                            "role": "user",
-                            "content": [
-                                {"type": "text", "text": "Image A:"},
-                                {
-                                    "type": "image",
-                                    "source": {
-                                        "type": "base64",
-                                        "media_type": media_type1,
-                                        "data": image1_data,
-                                    },
-                                },
-                                {"type": "text", "text": "Image B:"},
-                                {
-                                    "type": "image",
-                                    "source": {
-                                        "type": "base64",
-                                        "media_type": media_type2,
-                                        "data": image2_data,
-                                    },
-                                },
-                                {"type": "text", "text": prompt}
-                            ],
-                        }],
-                    )
-                    
-                    st.success("✨ Comparison Complete!")
-                    st.markdown("---")
-                    st.markdown(message.content[0].text)
-                    
-                except Exception as e:
-                    st.error(f"❌ Error: {str(e)}")
+            # The comparison renders as it is generated
+            live = st.empty()
+            try:
+                remember_streamed(result_key, compare)
+                st.success("✨ Comparison Complete!")
+            except Exception as e:
+                st.error(f"❌ Error: {str(e)}")
+        
+        comparison = recall(result_key)
+        if comparison is not None:
+            show_timing(result_key)
+            st.markdown("---")
+            st.markdown(comparison)
 
 # Tab 3: OCR
 with tab3:
@@ -593,57 +609,41 @@ with tab3:
             st.image(uploaded_file, caption="📸 Uploaded Image", use_column_width=True)
         
         with col2:
+            image = ImageAsset(uploaded_file)
+            result_key = ("ocr", image.content_hash)
+            
+            def extract():
+                chunks = []
+                
+                def show_text(chunk):
+                    chunks.append(chunk)
+                    live.text("".join(chunks))
+                
+                text = consume_stream(get_analyzer().stream_extract_text_from_image(image), show_text)
+                live.empty()
+                return text
+            
             if st.button("🔤 Extract Text", key="ocr_btn", use_container_width=True):
-                with st.spinner("🔮 Extracting text..."):
-                    try:
-                        image_data, media_type = encode_image(uploaded_file)
-                        client = anthropic.Anthropic(api_key=api_key)
-                        
-                        prompt = """Extract ALL text visible in this image.
-
-Maintain formatting and structure where possible.
-Include:
-- Product names and brand names
-- Instructions and warnings
-- Specifications and ingredients
-- Any other visible text
-
-Output as clean, structured plain text."""
-
-                        message = client.messages.create(
-                            model="claude-sonnet-4-20250514",
-                            max_tokens=2000,
-                            messages=[{
-                                "role": "user",
-                                "content": [
-                                    {
-                                        "type": "image",
-                                        "source": {
-                                            "type": "base64",
-                                            "media_type": media_type,
-                                            "data": image_data,
-                                        },
-                                    },
-                                    {"type": "text", "text": prompt}
-                                ],
-                            }],
-                        )
-                        
-                        extracted_text = message.content[0].text
-                        
-                        st.success("✨ Text Extracted!")
-                        st.text_area("Extracted Text:", extracted_text, height=300)
-                        
-                        st.download_button(
-                            "💾 Download Text",
-                            extracted_text,
-                            file_name="extracted_text.txt",
-                            mime="text/plain",
-                            use_container_width=True
-                        )
-                        
-                    except Exception as e:
-                        st.error(f"❌ Error: {str(e)}")
+                # Text appears as it is extracted
+                live = st.empty()
+                try:
+                    remember_streamed(result_key, extract)
+                    st.success("✨ Text Extracted!")
+                except Exception as e:
+                    st.error(f"❌ Error: {str(e)}")
+            
+            extracted_text = recall(result_key)
+            if extracted_text is not None:
+                show_timing(result_key)
+                st.text_area("Extracted Text:", extracted_text, height=300)
+                
+                st.download_button(
+                    "💾 Download Text",
+                    extracted_text,
+                    file_name="extracted_text.txt",
+                    mime="text/plain",
+                    use_container_width=True
+                )
 
 # Tab 4: Multilingual
 with tab4:
@@ -662,99 +662,65 @@ with tab4:
             st.image(uploaded_file, caption="📸 Uploaded Image", use_column_width=True)
         
         with col2:
+            image = ImageAsset(uploaded_file)
+            # Each language is also cached on its own by the analyzer
+            result_key = ("multilingual", image.content_hash, tuple(selected_codes))
+            
             if st.button("🌍 Generate Descriptions", key="multilingual_btn", use_container_width=True):
                 with st.spinner("🔮 Generating multilingual content..."):
                     try:
-                        image_data, media_type = encode_image(uploaded_file)
-                        client = anthropic.Anthropic(api_key=api_key)
-                        
-                        languages_str = ", ".join(selected_codes)
-                        
-                        prompt = f"""Analyze this product image and provide information in these languages: {languages_str}
-
-For EACH language, provide:
-1. title - Product title optimized for that market
-2. description - 2-3 sentences, culturally appropriate
-3. features - 3-5 key feature bullet points
-
-Format as JSON with lowercase language codes as keys (e.g., "en", "es", "fr").
-Use lowercase keys for title, description, and features.
-Ensure cultural appropriateness and natural phrasing."""
-
-                        message = client.messages.create(
-                            model="claude-sonnet-4-20250514",
-                            max_tokens=3000,
-                            messages=[{
-                                "role": "user",
-                                "content": [
-                                    {
-                                        "type": "image",
-                                        "source": {
-                                            "type": "base64",
-                                            "media_type": media_type,
-                                            "data": image_data,
-                                        },
-                                    },
-                                    {"type": "text", "text": prompt}
-                                ],
-                            }],
-                        )
-                        
-                        response_text = message.content[0].text
-                        if "```json" in response_text:
-                            response_text = response_text.split("```json")[1].split("```")[0].strip()
-                        elif "```" in response_text:
-                            response_text = response_text.split("```")[1].split("```")[0].strip()
-                        
-                        multilingual_data = json.loads(response_text)
-                        
+                        # One cached request per language: adding a language only generates that one
+                        remember(result_key, lambda: get_analyzer().analyze_product_multilingual(
+                            image, selected_codes, per_language=True
+                        ))
                         st.success("✨ Descriptions Generated!")
-                        
-                        # Normalize keys
-                        normalized_data = {k.lower(): v for k, v in multilingual_data.items()}
-                        
-                        # Display each language in styled cards
-                        for lang_code in selected_codes:
-                            if lang_code.lower() in normalized_data:
-                                lang_name = [k for k, v in language_codes.items() if v == lang_code][0]
-                                flag = language_flags.get(lang_name, "🌐")
-                                
-                                data = normalized_data[lang_code.lower()]
-                                data_lower = {k.lower(): v for k, v in data.items()}
-                                
-                                with st.expander(f"{flag} {lang_name}", expanded=True):
-                                    if "title" in data_lower:
-                                        st.markdown(f"""
-                                        <div class="result-card">
-                                            <h4>📌 Title</h4>
-                                            <p>{data_lower['title']}</p>
-                                        </div>
-                                        """, unsafe_allow_html=True)
-                                    
-                                    if "description" in data_lower:
-                                        st.markdown(f"""
-                                        <div class="result-card">
-                                            <h4>📝 Description</h4>
-                                            <p>{data_lower['description']}</p>
-                                        </div>
-                                        """, unsafe_allow_html=True)
-                                    
-                                    features = data_lower.get('features') or data_lower.get('key_features', [])
-                                    if features:
-                                        st.markdown("**Features:**")
-                                        for feature in features:
-                                            st.markdown(f'<div class="feature-item">✓ {feature}</div>', unsafe_allow_html=True)
-                        
-                        st.download_button(
-                            "💾 Download All Descriptions",
-                            json.dumps(multilingual_data, indent=2, ensure_ascii=False),
-                            file_name="multilingual_descriptions.json",
-                            mime="application/json",
-                            use_container_width=True
-                        )
-                        
                     except Exception as e:
                         st.error(f"❌ Error: {str(e)}")
+            
+            multilingual_data = recall(result_key)
+            if multilingual_data is not None:
+                # Normalize keys
+                normalized_data = {k.lower(): v for k, v in multilingual_data.items()}
+                
+                # Display each language in styled cards
+                for lang_code in selected_codes:
+                    if lang_code.lower() in normalized_data:
+                        lang_name = [k for k, v in language_codes.items() if v == lang_code][0]
+                        flag = language_flags.get(lang_name, "🌐")
+                        
+                        data = normalized_data[lang_code.lower()]
+                        data_lower = {k.lower(): v for k, v in data.items()}
+                        
+                        with st.expander(f"{flag} {lang_name}", expanded=True):
+                            if "title" in data_lower:
+                                st.markdown(f"""
+                                <div class="result-card">
+                                    <h4>📌 Title</h4>
+                                    <p>{data_lower['title']}</p>
+                                </div>
+                                """, unsafe_allow_html=True)
+                            
+                            if "description" in data_lower:
+                                st.markdown(f"""
+                                <div class="result-card">
+                                    <h4>📝 Description</h4>
+                                    <p>{data_lower['description']}</p>
+                                </div>
+                                """, unsafe_allow_html=True)
+                            
+                            features = data_lower.get('features') or data_lower.get('key_features', [])
+                            if features:
+                                st.markdown("**Features:**")
+                                for feature in features:
+                                    st.markdown(f'<div class="feature-item">✓ {feature}</div>', unsafe_allow_html=True)
+                
+                st.download_button(
+                    "💾 Download All Descriptions",
+                    json.dumps(multilingual_data, indent=2, ensure_ascii=False),
+                    file_name="multilingual_descriptions.json",
+                    mime="application/json",
+                    use_container_width=True
+                )
 
 # Footer
 st.markdown("""
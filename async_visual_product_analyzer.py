@@ -0,0 +1,167 @@
+import asyncio
+import inspect
+import time
+from typing import AsyncIterator, Dict, Iterable, List, Optional
+
+from http_client import get_async_client
+from image_asset import ImageAsset
+from image_preprocessor import ImagePreprocessor
+from metrics import MetricsRegistry
+from result_cache import ResultCache
+from structured_output import StructuredOutputError
+from visual_product_analyzer import BaseVisualProductAnalyzer, ImageInput, TASK_METHODS
+
+
+class AsyncVisualProductAnalyzer(BaseVisualProductAnalyzer):
+    """
+    asyncio counterpart of VisualProductAnalyzer built on anthropic.AsyncAnthropic.
+
+    A semaphore caps the number of requests (and encoded payloads) in flight,
+    so a single process can keep hundreds of requests going without one OS
+    thread per request.
+    """
+
+    def __init__(
+        self,
+        cache: Optional[ResultCache] = None,
+        preprocessor: Optional[ImagePreprocessor] = None,
+        max_concurrency: int = 32,
+        metrics: Optional[MetricsRegistry] = None,
+    ):
+        super().__init__(cache=cache, preprocessor=preprocessor, metrics=metrics)
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    @property
+    def client(self):
+        """
+        The running event loop's shared client, so one analyzer can be used
+        from several asyncio.run() calls
+        """
+        return get_async_client(max_connections=self.max_concurrency)
+
+    async def _send(self, spec: Dict):
+        async with self._semaphore:
+            request = await asyncio.to_thread(self._build_request, spec)
+            retries = errors = 0
+            start = time.perf_counter()
+            try:
+                raw = await self.client.messages.with_raw_response.create(**request)
+                retries = getattr(raw, "retries_taken", 0)
+                message = raw.parse()
+                # Legacy raw responses parse synchronously, newer ones are awaitable
+                return await message if inspect.isawaitable(message) else message
+            except Exception:
+                errors = 1
+                raise
+            finally:
+                self._observe(
+                    spec, requests=1, errors=errors, retries=retries, request_seconds=time.perf_counter() - start
+                )
+
+    async def _run(self, spec: Dict):
+        """
+        Serve a request from the cache, or send it and store the result on a miss
+        """
+        # Hashing and preprocessing touch the disk and the CPU; keep them off the event loop
+        key = await asyncio.to_thread(self._cache_key, spec)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        try:
+            result = self._parse_response(spec, await self._send(spec))
+        except StructuredOutputError as e:
+            repair = self._repair_spec(spec, e.text)
+            result = self._parse_response(repair, await self._send(repair))
+
+        if key is not None:
+            self.cache.put(key, result)
+        return result
+
+    async def analyze_product_image(self, image_path: ImageInput, product_category: str = None) -> Dict:
+        """
+        Analyze a product image and extract structured information
+        """
+        return await self._run(self._analysis_spec(image_path, product_category))
+
+    async def compare_product_images(self, image1_path: ImageInput, image2_path: ImageInput) -> str:
+        """
+        Compare two product images (useful for A/B testing, quality control)
+        """
+        return await self._run(self._comparison_spec(image1_path, image2_path))
+
+    async def extract_text_from_image(self, image_path: ImageInput) -> str:
+        """
+        OCR - Extract text from product packaging, labels, etc.
+        """
+        return await self._run(self._ocr_spec(image_path))
+
+    async def generate_alt_text(self, image_path: ImageInput, context: str = None) -> str:
+        """
+        Generate accessibility alt text for images
+        """
+        return await self._run(self._alt_text_spec(image_path, context))
+
+    async def full_analysis(self, image_path: ImageInput, product_category: str = None, context: str = None) -> Dict:
+        """
+        Product analysis, alt text and OCR from a single request
+        """
+        return await self._run(self._full_analysis_spec(image_path, product_category, context))
+
+    async def analyze_product_multilingual(
+        self,
+        image_path: ImageInput,
+        target_languages: List[str],
+        per_language: bool = False,
+        from_analysis: bool = False,
+    ) -> Dict:
+        """
+        Analyze product and generate descriptions in multiple languages.
+        per_language and from_analysis work as in VisualProductAnalyzer.
+        """
+        if not per_language:
+            return await self._run(self._multilingual_spec(image_path, target_languages))
+        image = ImageAsset.coerce(image_path)
+        base_analysis = await self.analyze_product_image(image) if from_analysis else None
+        results = await asyncio.gather(*(
+            self._run(self._language_spec(image, language, base_analysis)) for language in target_languages
+        ))
+        return dict(zip(target_languages, results))
+
+    async def analyze_many(
+        self, images: Iterable[ImageInput], task: str = "analysis", **kwargs
+    ) -> AsyncIterator[Dict]:
+        """
+        Run one task over many images, yielding results in completion order.
+
+        Images are pulled from the iterable lazily, with at most twice the
+        concurrency limit scheduled at once. Each item is
+        {"image", "status": "success", "result"} or {"image", "status": "error", "error"}.
+        """
+        method = getattr(self, TASK_METHODS[task])
+
+        async def run(image):
+            try:
+                return {"image": image, "status": "success", "result": await method(image, **kwargs)}
+            except Exception as e:
+                return {"image": image, "status": "error", "error": str(e)}
+
+        window = self.max_concurrency * 2
+        pending = set()
+        remaining = iter(images)
+        try:
+            while True:
+                for image in remaining:
+                    pending.add(asyncio.create_task(run(image)))
+                    if len(pending) >= window:
+                        break
+                if not pending:
+                    return
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for finished in done:
+                    yield finished.result()
+        finally:
+            for task_handle in pending:
+                task_handle.cancel()
@@ -1,114 +1,746 @@
+import argparse
+import csv
+import hashlib
 import os
+import shutil
+import time
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from collections import deque
 import json
-from typing import List, Dict
+from typing import Iterable, Iterator, List, Dict, Optional
 from tqdm import tqdm
-from visual_product_analyzer import VisualProductAnalyzer
+from result_cache import ResultCache, default_cache_path
+from image_preprocessor import ImagePreprocessor
+from image_asset import ImageAsset
+from rate_limiter import AdaptiveScheduler
+from message_batches import MessageBatchRunner
+from run_journal import RunJournal
+from result_store import ResultStore
+from columnar_export import FORMATS, ColumnarWriter
+from image_scanner import iter_prefetched, scan_images
+from image_dedupe import ImageDeduplicator
+from http_client import connection_stats
+from model_cascade import ModelCascade
+from run_budget import EXPECTED_OUTPUT_TOKENS, BudgetGovernor, project_run
+from visual_product_analyzer import ImageInput, VisualProductAnalyzer
 
 
+# Per-image call metrics (see metrics.CALL_METRICS) reported in the summary
+METRIC_COLUMNS = [
+    ("Requests", "requests"),
+    ("Retries", "retries"),
+    ("Input Tokens", "input_tokens"),
+    ("Output Tokens", "output_tokens"),
+    ("Cache Write Tokens", "cache_creation_input_tokens"),
+    ("Cache Read Tokens", "cache_read_input_tokens"),
+    ("Payload Bytes", "payload_bytes"),
+    ("Read Seconds", "read_seconds"),
+    ("Encode Seconds", "encode_seconds"),
+    ("Request Seconds", "request_seconds"),
+    ("Parse Seconds", "parse_seconds"),
+]
+
+SUMMARY_HEADER = [
+    "Image", "Status", "Product Type", "Category",
+    "Suggested Title", "Confidence", "Bytes Saved", "Est. Tokens Saved", "Duplicate Of", "Answered By"
+] + [header for header, _ in METRIC_COLUMNS]
+
 class BatchImageProcessor:
-    def __init__(self):
-        self.analyzer = VisualProductAnalyzer()
+    def __init__(
+        self,
+        cache: Optional[ResultCache] = None,
+        preprocessor: Optional[ImagePreprocessor] = None,
+        scheduler: Optional[AdaptiveScheduler] = None,
+        deduplicator: Optional[ImageDeduplicator] = None,
+        budget: Optional[BudgetGovernor] = None,
+        cascade: Optional[ModelCascade] = None,
+        store: Optional[ResultStore] = None,
+        columnar: Optional[ColumnarWriter] = None,
+    ):
+        # Unchanged images are served from the cache on re-runs
+        self.cache = cache if cache is not None else ResultCache(default_cache_path())
+        # Images are downsized to the model's effective resolution before upload
+        self.preprocessor = preprocessor if preprocessor is not None else ImagePreprocessor()
+        # Concurrency adapts to the org's rate limits instead of a fixed worker count
+        self.scheduler = scheduler if scheduler is not None else AdaptiveScheduler()
+        self.analyzer = VisualProductAnalyzer(
+            cache=self.cache, preprocessor=self.preprocessor, scheduler=self.scheduler, cascade=cascade
+        )
+        # Optional: near-duplicate images reuse their canonical image's analysis
+        self.deduplicator = deduplicator
+        # Optional: token/dollar ceiling that stops or downscales the run
+        self.budget = budget
+        # Optional: queryable SQLite copy of every result
+        self.store = store
+        # Optional: Parquet/Arrow files of newly processed results, for analytics
+        self.columnar = columnar
+    
+    def process_directory(self, directory_path: str, output_dir: str = "processed", full_analysis: bool = False, **scan_options):
+        """
+        Process all images in a directory.
+        With full_analysis=True each image also gets alt text and OCR, all
+        from a single request.
+        
+        Returns every result as a list; use iter_process_directory to
+        consume results as they complete without holding them all.
+        """
+        return list(self.iter_process_directory(directory_path, output_dir, full_analysis, **scan_options))
+    
+    def estimate_directory(
+        self,
+        directory_path: str,
+        output_dir: Optional[str] = None,
+        full_analysis: bool = False,
+        seconds_per_request: float = 8.0,
+        **scan_options,
+    ) -> Dict:
+        """
+        Pre-flight projection of a process_directory run: requests, tokens,
+        cost and wall-clock time. Only image headers are read. Images the
+        run journal in output_dir already shows as complete (same size and
+        mtime) are left out; cached results are not, so it is an upper bound.
+        """
+        task = "full_analysis" if full_analysis else "analysis"
+        journal = RunJournal(Path(output_dir) / "journal.jsonl") if output_dir and os.path.isdir(output_dir) else None
+        projected = {"images": 0, "complete": 0, "unreadable": 0, "input_tokens": 0, "output_tokens": 0}
+        try:
+            for image_path in scan_images(directory_path, **scan_options):
+                projected["images"] += 1
+                if journal is not None and self._journaled_complete(journal, image_path, task):
+                    projected["complete"] += 1
+                    continue
+                try:
+                    usage = self._projected_usage(ImageAsset(image_path), full_analysis)
+                except Exception:
+                    projected["unreadable"] += 1
+                    continue
+                projected["input_tokens"] += usage["input_tokens"]
+                projected["output_tokens"] += usage["output_tokens"]
+        finally:
+            if journal is not None:
+                journal.close()
+        
+        requests = projected["images"] - projected["complete"] - projected["unreadable"]
+        rate_limits = {kind: bucket.capacity for kind, bucket in self.scheduler.buckets.items()}
+        return {
+            "images": projected["images"],
+            "complete": projected["complete"],
+            "unreadable": projected["unreadable"],
+            **project_run(
+                self.analyzer.model,
+                requests,
+                projected["input_tokens"],
+                projected["output_tokens"],
+                seconds_per_request,
+                self.scheduler.max_concurrency,
+                rate_limits,
+            ),
+        }
+    
+    @classmethod
+    def _own_output(cls, entry: Dict, image_path: str) -> bool:
+        """
+        Whether a journal entry's output file is named for this image
+        """
+        return Path(entry["output"]).name == cls.output_file(image_path, "").name
+    
+    @classmethod
+    def _journaled_complete(cls, journal: RunJournal, image_path: str, task: str) -> bool:
+        """
+        Whether the journal has a successful result for an unchanged
+        (same size and mtime) image, without hashing it
+        """
+        entry = journal.latest.get(image_path)
+        if entry is None or entry["status"] != "success" or entry.get("task") != task:
+            return False
+        stat = os.stat(image_path)
+        return (
+            entry.get("size") == stat.st_size
+            and entry.get("mtime_ns") == stat.st_mtime_ns
+            and entry.get("output") is not None
+            and cls._own_output(entry, image_path)
+            and Path(entry["output"]).exists()
+        )
+    
+    def _spec(self, image: ImageAsset, full_analysis: bool) -> Dict:
+        if full_analysis:
+            return self.analyzer._full_analysis_spec(image)
+        return self.analyzer._analysis_spec(image)
+    
+    def _projected_usage(self, image: ImageAsset, full_analysis: bool) -> Dict:
+        """
+        Expected input and output tokens for one image, from its header
+        """
+        spec = self._spec(image, full_analysis)
+        return {
+            "input_tokens": self.analyzer.estimate_input_tokens(spec),
+            "output_tokens": EXPECTED_OUTPUT_TOKENS[spec["task"]],
+        }
+    
+    def _admit(self, image: ImageAsset, full_analysis: bool) -> bool:
+        """
+        Reserve an image's projected usage with the budget governor;
+        images answered from the cache cost nothing and are not reserved
+        """
+        if self.budget is None:
+            return True
+        try:
+            if self.analyzer.is_cached(self._spec(image, full_analysis)):
+                return True
+            usage = self._projected_usage(image, full_analysis)
+        except Exception:
+            # Unreadable images fail without spending anything
+            return True
+        return self.budget.admit(image.path, usage, self.analyzer.model)
     
-    def process_directory(self, directory_path: str, output_dir: str = "processed"):
+    def iter_process_directory(
+        self,
+        directory_path: str,
+        output_dir: str = "processed",
+        full_analysis: bool = False,
+        include: Optional[List[str]] = None,
+        exclude: Optional[List[str]] = None,
+        max_depth: Optional[int] = None,
+        max_in_flight: Optional[int] = None,
+    ) -> Iterator[Dict]:
         """
-        Process all images in a directory
+        Process all images in a directory, yielding results in completion order.
+        
+        Images are discovered lazily by a background scanner (filtered by
+        include/exclude globs and max_depth), and at most max_in_flight
+        images are queued or being processed at once, so work starts
+        immediately and memory stays flat regardless of catalog size.
+        Each result is appended to output_dir/summary_report.csv and
+        output_dir/results.jsonl as soon as it finishes.
+        
+        Progress is journaled to output_dir/journal.jsonl; re-running the
+        same command skips completed images, retries failed ones and
+        reprocesses images whose content changed.
+        
+        With a budget governor, the run switches to its downscale profile
+        near the ceiling (for this run only) and stops submitting images
+        once the ceiling is reached; the images left over are processed by
+        a re-run. Images refused while others are in flight are retried
+        once those finish.
         """
         # Create output directory
         os.makedirs(output_dir, exist_ok=True)
         
-        # Get all image files
-        image_extensions = {'.jpg', '.jpeg', '.png', '.webp', '.gif'}
-        image_files = [
-            f for f in Path(directory_path).rglob('*')
-            if f.suffix.lower() in image_extensions
-        ]
+        max_in_flight = max_in_flight or self.scheduler.max_concurrency * 2
+        images = iter_prefetched(
+            scan_images(directory_path, include=include, exclude=exclude, max_depth=max_depth),
+            maxsize=max_in_flight * 4,
+        )
+        journal = RunJournal(Path(output_dir) / "journal.jsonl")
+        counts = {"processed": 0, "skipped": 0, "deferred": 0}
+        task = "full_analysis" if full_analysis else "analysis"
+        profile = self.preprocessor.profiles.get(task)
+        totals = {}
+        started = time.perf_counter()
         
-        print(f"Found {len(image_files)} images to process")
+        summary_file = Path(output_dir) / "summary_report.csv"
+        # Threads only bound the ceiling; the scheduler decides how many are active
+        executor = ThreadPoolExecutor(max_workers=self.scheduler.max_concurrency)
+        try:
+            with open(summary_file, "w", newline='') as summary, \
+                    open(Path(output_dir) / "results.jsonl", "w") as results_jsonl, \
+                    tqdm(desc="Processing images", unit="img") as progress:
+                writer = csv.writer(summary)
+                writer.writerow(SUMMARY_HEADER)
+                
+                futures = {}
+                # Images the budget deferred, and those due to be tried again
+                deferred, retry = [], deque()
+                
+                def submit_more():
+                    while len(futures) < max_in_flight:
+                        if self.budget is not None and self.budget.stopped:
+                            return
+                        if retry:
+                            img = retry.popleft()
+                        elif deferred:
+                            # Let in-flight images settle the budget first
+                            return
+                        else:
+                            img = next(images, None)
+                            if img is None:
+                                return
+                        future = executor.submit(self._process_journaled, img, output_dir, full_analysis, journal)
+                        futures[future] = img
+                
+                submit_more()
+                while futures:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        img = futures.pop(future)
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            print(f"Error processing {img}: {e}")
+                            result = {"image": img, "status": "error", "error": str(e)}
+                        if result["status"] == "deferred":
+                            if self.budget.stopped:
+                                counts["deferred"] += 1
+                                progress.update(1)
+                            else:
+                                deferred.append(img)
+                            continue
+                        skipped = result.pop("skipped", False)
+                        if self.budget is not None and not skipped:
+                            model = (result.get("answered_by") or {}).get("model") or self.analyzer.model
+                            self.budget.record(img, result.get("metrics") or {}, model)
+                            if self.budget.should_downscale():
+                                self.preprocessor.profiles[task] = self.budget.downscale_profile
+                                print(f"\n⚠️  Budget {self.budget.downscale_at:.0%} used, switching to a lower-resolution profile")
+                        if deferred and not skipped:
+                            retry.extend(deferred)
+                            deferred.clear()
+                        counts["skipped" if skipped else "processed"] += 1
+                        if self.store is not None:
+                            # Rows from earlier runs keep their metrics
+                            self.store.add(result, replace=not skipped)
+                        if self.columnar is not None and not skipped:
+                            self.columnar.write(result)
+                        for field, value in (result.get("metrics") or {}).items():
+                            totals[field] = totals.get(field, 0) + value
+                        progress.update(1)
+                        
+                        writer.writerow(self.summary_row(result))
+                        summary.flush()
+                        results_jsonl.write(json.dumps(result) + "\n")
+                        results_jsonl.flush()
+                        yield result
+                    if deferred and not futures:
+                        # Nothing is reserved any more, so admit() now decides for good
+                        retry.extend(deferred)
+                        deferred.clear()
+                    submit_more()
+                counts["deferred"] += len(deferred) + len(retry)
+                writer.writerow(self.total_row(totals, counts["processed"] + counts["skipped"]))
+        finally:
+            images.close()
+            executor.shutdown(wait=True, cancel_futures=True)
+            # The downscale profile applies to this run only
+            if profile is None:
+                self.preprocessor.profiles.pop(task, None)
+            else:
+                self.preprocessor.profiles[task] = profile
+            journal.compact()
+            journal.close()
+            if self.store is not None:
+                self.store.flush()
+            if self.columnar is not None:
+                self.columnar.flush()
         
-        # Process with progress bar
-        results = []
+        elapsed = time.perf_counter() - started
+        self.write_run_summary(output_dir, counts, totals, elapsed)
         
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            futures = {
-                executor.submit(self.process_single_image, str(img), output_dir): img
-                for img in image_files
-            }
+        print(f"\nProcessed {counts['processed']} images ({counts['skipped']} already complete)")
+        if self.budget is not None and self.budget.stopped:
+            budget = self.budget.stats()
+            print(
+                f"⛔ Budget reached ({budget['tokens']} tokens, ${budget['cost']:.2f}); "
+                f"remaining images left unprocessed, re-run with a higher budget to resume"
+            )
+        print(f"✅ Summary report saved to {summary_file}")
+        print(
+            f"Run: {totals.get('requests', 0)} requests, {totals.get('retries', 0)} retries, "
+            f"{totals.get('input_tokens', 0)} input / {totals.get('output_tokens', 0)} output tokens, "
+            f"{totals.get('payload_bytes', 0) / 1e6:.1f} MB sent in {elapsed:.1f}s"
+        )
+        stats = self.cache.stats()
+        print(f"Cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)")
+        sched = self.scheduler.stats()
+        print(
+            f"Scheduler: {sched['throttled']} throttled, {sched['transient_errors']} transient errors, "
+            f"{sched['retries']} retries, final concurrency {sched['concurrency']}"
+        )
+        prep = self.preprocessor.stats()
+        print(f"Preprocessing: {prep['bytes_saved'] / 1e6:.1f} MB and ~{prep['tokens_saved']} image tokens saved")
+        usage = self.analyzer.usage_stats()
+        print(f"Prompt cache: {usage['cache_read_input_tokens']} input tokens read, {usage['cache_creation_input_tokens']} written")
+        print(
+            f"Structured output: {usage['structured_results']} tool results, {usage['repaired_results']} repaired, "
+            f"{usage['repair_requests']} repair requests, {usage['parse_failures']} parse failures "
+            f"({usage['parse_failure_rate']:.1%})"
+        )
+        if self.analyzer.cascade is not None:
+            cascade = self.analyzer.cascade.stats()
+            print(
+                f"Cascade: {cascade['fast_answer_rate']:.0%} answered by a fast tier, "
+                f"escalations {cascade['escalations']}, ~${cascade['cost_saved']:.2f} and "
+                f"~{cascade['seconds_saved']:.0f}s of request time saved (net of escalated attempts)"
+            )
+        connections = connection_stats()
+        print(f"Connections: {connections['connections_opened']} opened for {connections['requests']} requests ({connections['reuse_rate']:.0%} reused)")
+    
+    def _process_journaled(self, image_path: str, output_dir: str, full_analysis: bool, journal: RunJournal) -> Dict:
+        """
+        Process a single image unless the journal shows it is already done,
+        and append the outcome to the run journal
+        """
+        task = "full_analysis" if full_analysis else "analysis"
+        needs_processing, fingerprint = journal.check(image_path, task)
+        entry = journal.latest.get(image_path)
+        if not needs_processing and not self._own_output(entry, image_path):
+            # Written under the old stem-only naming, maybe by a same-named image
+            needs_processing = True
+        if not needs_processing:
+            if self.deduplicator is not None and entry.get("phash") and not entry.get("duplicate_of"):
+                self.deduplicator.register_completed(image_path, int(entry["phash"], 16))
+            result = self._result_from_journal(entry, image_path, full_analysis)
+            result["skipped"] = True
+            return result
+        
+        image = ImageAsset(image_path)
+        if self.deduplicator is None:
+            if not self._admit(image, full_analysis):
+                # Not journaled, so it is retried or picked up by a re-run
+                return {"image": image_path, "status": "deferred"}
+            result = self.process_single_image(image, output_dir, full_analysis)
+            journal.record(
+                image_path,
+                fingerprint,
+                task,
+                result["status"],
+                output=str(self.output_file(image_path, output_dir)) if result["status"] == "success" else None,
+                error=result.get("error"),
+            )
+            return result
+        
+        try:
+            image_hash = self.deduplicator.compute_hash(image)
+        except Exception as e:
+            return {"image": image_path, "status": "error", "error": f"Could not hash image: {e}"}
+        
+        canonical = self.deduplicator.claim(image_path, image_hash)
+        success = False
+        try:
+            result = None
+            # A canonical image that takes too long is not worth waiting for
+            if canonical is not None and self.deduplicator.wait(canonical, self.deduplicator.wait_seconds):
+                # Near-duplicate of an analyzed image: reuse its analysis
+                result = self._result_from_journal(journal.latest.get(canonical), image_path, full_analysis)
+                if result["status"] == "success":
+                    source = Path(journal.latest[canonical]["output"])
+                    # output_file is unique per path, so a same-named duplicate
+                    # in another folder never overwrites the canonical's file
+                    target = self.output_file(image_path, output_dir)
+                    if source.resolve() != target.resolve():
+                        shutil.copyfile(source, target)
+                    result["duplicate_of"] = canonical
+                else:
+                    result = None
+            if result is None:
+                if not self._admit(image, full_analysis):
+                    return {"image": image_path, "status": "deferred"}
+                result = self.process_single_image(image, output_dir, full_analysis)
             
-            for future in tqdm(futures, desc="Processing images"):
-                try:
-                    result = future.result()
-                    results.append(result)
-                except Exception as e:
-                    print(f"Error processing {futures[future]}: {e}")
+            journal.record(
+                image_path,
+                fingerprint,
+                task,
+                result["status"],
+                output=str(self.output_file(image_path, output_dir)) if result["status"] == "success" else None,
+                error=result.get("error"),
+                phash=f"{image_hash:016x}",
+                duplicate_of=result.get("duplicate_of"),
+            )
+            success = result["status"] == "success"
+            return result
+        finally:
+            if canonical is None:
+                # Only after journaling, so waiting duplicates can find the output;
+                # on an error or deferral they stop waiting and process themselves
+                self.deduplicator.resolve(image_path, success)
+    
+    def _result_from_journal(self, entry: Optional[Dict], image_path: str, full_analysis: bool) -> Dict:
+        """
+        Result row for an image completed by an earlier run, read back from its output file
+        """
+        if entry is None or entry["status"] != "success":
+            error = entry.get("error") if entry else "Not processed"
+            return {"image": image_path, "status": "error", "error": error}
+        try:
+            with open(entry["output"]) as f:
+                output = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            return {"image": image_path, "status": "error", "error": str(e)}
+        result = {"image": image_path, "status": "success"}
+        if full_analysis:
+            result.update(output)
+        else:
+            result["analysis"] = output
+        if entry.get("duplicate_of"):
+            result["duplicate_of"] = entry["duplicate_of"]
+        return result
+    
+    @staticmethod
+    def output_file(image_path: str, output_dir: str) -> Path:
+        """
+        Per-image JSON file: the image's stem plus a short hash of its
+        absolute path, so shoes/001.jpg and bags/001.jpg do not collide
+        """
+        path_hash = hashlib.sha256(os.path.abspath(str(image_path)).encode("utf-8")).hexdigest()[:8]
+        return Path(output_dir) / f"{Path(image_path).stem}-{path_hash}.json"
+    
+    def process_directory_batch_api(self, directory_path: str, output_dir: str = "processed", full_analysis: bool = False):
+        """
+        Process all images in a directory through the Message Batches API.
+        Cheaper but not interactive; re-running the same command after a
+        crash resumes from the state file in output_dir.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        
+        image_files = self.find_images(directory_path)
+        print(f"Found {len(image_files)} images to process")
+        
+        runner = MessageBatchRunner(
+            self.analyzer,
+            Path(output_dir) / "batch_state.json",
+            task="full_analysis" if full_analysis else "analysis",
+        )
+        results = runner.run(image_files, output_dir)
         
-        # Create summary report
         self.create_summary_report(results, output_dir)
+        if self.store is not None:
+            for result in results:
+                self.store.add(result)
+            self.store.flush()
         
         return results
     
-    def process_single_image(self, image_path: str, output_dir: str) -> Dict:
+    def find_images(self, directory_path: str, **scan_options) -> List[Path]:
+        """
+        All image files under a directory
+        """
+        return [Path(f) for f in scan_images(directory_path, **scan_options)]
+    
+    def process_single_image(self, image_path: ImageInput, output_dir: str, full_analysis: bool = False) -> Dict:
         """
         Process a single image and save results
         """
+        image = ImageAsset.coerce(image_path)
+        image_path = image.path
+        # Discard measurements of earlier work on this thread
+        self.analyzer.pop_call_metrics()
+        if self.analyzer.cascade is not None:
+            self.analyzer.cascade.pop_last_answer()
         try:
-            analysis = self.analyzer.analyze_product_image(image_path)
+            self.preprocessor.pop_last_report()
+            if full_analysis:
+                output = self.analyzer.full_analysis(image)
+                analysis = output["analysis"]
+            else:
+                analysis = output = self.analyzer.analyze_product_image(image)
+            # None when the result came from the cache and nothing was uploaded
+            preprocessing = self.preprocessor.pop_last_report()
             
             # Save individual result
-            output_file = Path(output_dir) / f"{Path(image_path).stem}.json"
+            output_file = self.output_file(image_path, output_dir)
             with open(output_file, "w") as f:
-                json.dump(analysis, f, indent=2)
+                json.dump(output, f, indent=2)
             
-            return {
+            result = {
                 "image": image_path,
                 "status": "success",
-                "analysis": analysis
+                "analysis": analysis,
+                "preprocessing": preprocessing,
+                "metrics": self.analyzer.pop_call_metrics(),
             }
+            if self.analyzer.cascade is not None:
+                # None when the result came from the cache
+                result["answered_by"] = self.analyzer.cascade.pop_last_answer()
+            if full_analysis:
+                result["alt_text"] = output["alt_text"]
+                result["extracted_text"] = output["extracted_text"]
+            return result
         except Exception as e:
             return {
                 "image": image_path,
                 "status": "error",
-                "error": str(e)
+                "error": str(e),
+                "metrics": self.analyzer.pop_call_metrics(),
             }
     
     def create_summary_report(self, results: List[Dict], output_dir: str):
         """
         Create a summary CSV of all processed images
         """
-        import csv
-        
         summary_file = Path(output_dir) / "summary_report.csv"
         
         with open(summary_file, "w", newline='') as f:
             writer = csv.writer(f)
-            writer.writerow([
-                "Image", "Status", "Product Type", "Category",
-                "Suggested Title", "Confidence"
-            ])
+            writer.writerow(SUMMARY_HEADER)
             
+            totals = {}
             for result in results:
-                if result["status"] == "success":
-                    analysis = result["analysis"]
-                    writer.writerow([
-                        result["image"],
-                        "Success",
-                        analysis.get("product_type", ""),
-                        analysis.get("category", ""),
-                        analysis.get("suggested_title", ""),
-                        analysis.get("confidence_score", 0)
-                    ])
-                else:
-                    writer.writerow([
-                        result["image"],
-                        "Error",
-                        "",
-                        "",
-                        "",
-                        0
-                    ])
+                writer.writerow(self.summary_row(result))
+                for field, value in (result.get("metrics") or {}).items():
+                    totals[field] = totals.get(field, 0) + value
+            writer.writerow(self.total_row(totals, len(results)))
         
         print(f"\n✅ Summary report saved to {summary_file}")
-# Usage:
-# processor = BatchImageProcessor()
-# processor.process_directory("./product_images", "./analysis_output")
+    
+    @classmethod
+    def export_results(cls, results: Iterable[Dict], output_dir: str) -> int:
+        """
+        Write results, e.g. from ResultStore.query, in the layout of a
+        run's output directory: a JSON file per analyzed image,
+        results.jsonl and summary_report.csv. Returns the number written.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        totals = {}
+        exported = 0
+        with open(Path(output_dir) / "summary_report.csv", "w", newline='') as summary, \
+                open(Path(output_dir) / "results.jsonl", "w") as results_jsonl:
+            writer = csv.writer(summary)
+            writer.writerow(SUMMARY_HEADER)
+            for result in results:
+                if result["status"] == "success":
+                    output = result["analysis"]
+                    if "alt_text" in result:
+                        output = {
+                            "analysis": result["analysis"],
+                            "alt_text": result["alt_text"],
+                            "extracted_text": result["extracted_text"],
+                        }
+                    with open(cls.output_file(result["image"], output_dir), "w") as f:
+                        json.dump(output, f, indent=2)
+                writer.writerow(cls.summary_row(result))
+                results_jsonl.write(json.dumps(result) + "\n")
+                for field, value in (result.get("metrics") or {}).items():
+                    totals[field] = totals.get(field, 0) + value
+                exported += 1
+            writer.writerow(cls.total_row(totals, exported))
+        return exported
+    
+    @classmethod
+    def summary_row(cls, result: Dict) -> List:
+        """
+        One summary CSV row for a result
+        """
+        metrics = [cls._metric_cell(result.get("metrics") or {}, field) for _, field in METRIC_COLUMNS]
+        if result["status"] == "success":
+            analysis = result["analysis"]
+            preprocessing = result.get("preprocessing") or {}
+            return [
+                result["image"],
+                "Success",
+                analysis.get("product_type", ""),
+                analysis.get("category", ""),
+                analysis.get("suggested_title", ""),
+                analysis.get("confidence_score", 0),
+                preprocessing.get("bytes_saved", 0),
+                preprocessing.get("tokens_saved", 0),
+                result.get("duplicate_of", ""),
+                (result.get("answered_by") or {}).get("model", ""),
+            ] + metrics
+        return [
+            result["image"],
+            "Error",
+            "",
+            "",
+            "",
+            0,
+            0,
+            0,
+            "",
+            "",
+        ] + metrics
+    
+    @classmethod
+    def total_row(cls, totals: Dict, images: int) -> List:
+        """
+        Last summary CSV row: call metrics summed over the run
+        """
+        return ["TOTAL", f"{images} images", "", "", "", "", "", "", "", ""] + [
+            cls._metric_cell(totals, field) for _, field in METRIC_COLUMNS
+        ]
+    
+    @staticmethod
+    def _metric_cell(metrics: Dict, field: str):
+        value = metrics.get(field, 0)
+        return round(value, 4) if field.endswith("_seconds") else int(value)
+    
+    def write_run_summary(self, output_dir: str, counts: Dict, totals: Dict, elapsed: float):
+        """
+        Save run_summary.json with the run's totals, and the process's
+        metrics registry as metrics.prom and metrics.json
+        """
+        images = counts["processed"] + counts["skipped"]
+        summary = {
+            "images": images,
+            "processed": counts["processed"],
+            "skipped": counts["skipped"],
+            "deferred": counts["deferred"],
+            "seconds": round(elapsed, 3),
+            "images_per_second": round(images / elapsed, 3) if elapsed else 0.0,
+            "totals": {field: self._metric_cell(totals, field) for _, field in METRIC_COLUMNS},
+            "usage": self.analyzer.usage_stats(),
+            "scheduler": self.scheduler.stats(),
+            "connections": connection_stats(),
+        }
+        if self.budget is not None:
+            summary["budget"] = self.budget.stats()
+        if self.analyzer.cascade is not None:
+            summary["cascade"] = self.analyzer.cascade.stats()
+        with open(Path(output_dir) / "run_summary.json", "w") as f:
+            json.dump(summary, f, indent=2)
+        self.analyzer.metrics.write(output_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze every product image in a directory")
+    parser.add_argument("directory", help="directory of product images")
+    parser.add_argument("output", nargs="?", default="processed", help="output directory")
+    parser.add_argument("--full-analysis", action="store_true", help="also get alt text and OCR for each image")
+    parser.add_argument("--dry-run", action="store_true", help="only project tokens, cost and time")
+    parser.add_argument("--seconds-per-request", type=float, default=8.0, help="typical request latency, for --dry-run")
+    parser.add_argument("--max-tokens", type=float, help="stop once this many tokens are spent")
+    parser.add_argument("--max-cost", type=float, help="stop once this many dollars are spent")
+    parser.add_argument(
+        "--downscale-at", type=float,
+        help="switch to a lower-resolution profile once this fraction of the budget is used"
+    )
+    parser.add_argument(
+        "--cascade", action="store_true",
+        help="answer with a fast model first, escalating to the larger model when needed"
+    )
+    parser.add_argument("--min-confidence", type=float, default=0.7, help="escalate analyses below this confidence")
+    parser.add_argument("--store", help="also save results to this SQLite result store")
+    parser.add_argument("--columnar", metavar="DIR", help="also stream results into Parquet/Arrow files in DIR")
+    parser.add_argument("--columnar-format", choices=list(FORMATS), default="parquet")
+    args = parser.parse_args()
+    
+    budget = None
+    if args.max_tokens or args.max_cost:
+        budget = BudgetGovernor(max_tokens=args.max_tokens, max_cost=args.max_cost, downscale_at=args.downscale_at)
+    cascade = ModelCascade(min_confidence=args.min_confidence) if args.cascade else None
+    store = ResultStore(args.store) if args.store else None
+    columnar = ColumnarWriter(args.columnar, format=args.columnar_format) if args.columnar else None
+    processor = BatchImageProcessor(budget=budget, cascade=cascade, store=store, columnar=columnar)
+    
+    if args.dry_run:
+        estimate = processor.estimate_directory(
+            args.directory, args.output, args.full_analysis, seconds_per_request=args.seconds_per_request
+        )
+        print(f"🔍 {estimate['images']} images, {estimate['complete']} already complete, {estimate['unreadable']} unreadable")
+        print(
+            f"Projected: {estimate['requests']} requests, {estimate['input_tokens']} input / "
+            f"{estimate['output_tokens']} output tokens, ${estimate['cost']:.2f}, ~{estimate['seconds'] / 60:.1f} min"
+        )
+        return
+    
+    try:
+        processor.process_directory(args.directory, args.output, args.full_analysis)
+    finally:
+        if store is not None:
+            store.close()
+        if columnar is not None:
+            columnar.close()
+
+
+if __name__ == "__main__":
+    main()
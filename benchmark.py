@@ -0,0 +1,300 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from benchmark_prompt_cache import synthetic_images
+from mock_anthropic_server import add_server_arguments, server_from_args
+
+
+IMAGE_SIZES = {"small": (640, 480), "medium": (1600, 1200), "large": (4000, 3000)}
+SCENARIOS = ["process_directory", "cli", "async", "batch_api"]
+
+# Metrics where a higher value is a regression; throughput is the reverse
+LOWER_IS_BETTER = ["p50_seconds", "p95_seconds", "p99_seconds", "peak_rss_bytes", "bytes_uploaded"]
+
+
+def write_image_set(directory: Path, count: int, size: str, seed: int = 0) -> List[str]:
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for image in synthetic_images(count, seed=seed, size=IMAGE_SIZES[size], noise=64):
+        path = directory / image.name
+        path.write_bytes(image.raw_bytes)
+        paths.append(str(path))
+    return paths
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def peak_rss_bytes() -> Optional[int]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+# Scenarios run in a worker process so each gets its own peak RSS. Each
+# returns (seconds per image, failed images).
+
+def run_process_directory(paths: List[str], image_dir: Path, work_dir: Path):
+    from batch_image_processor import BatchImageProcessor
+
+    latencies = []
+
+    class TimedProcessor(BatchImageProcessor):
+        def process_single_image(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return super().process_single_image(*args, **kwargs)
+            finally:
+                latencies.append(time.perf_counter() - start)
+
+    results = TimedProcessor().process_directory(str(image_dir), str(work_dir / "output"))
+    return latencies, sum(1 for result in results if result["status"] != "success")
+
+
+def run_cli(paths: List[str], image_dir: Path, work_dir: Path):
+    import visual_product_analyzer
+
+    latencies = []
+    failures = 0
+    os.chdir(work_dir)
+    for path in paths:
+        sys.argv = ["visual_product_analyzer.py", path]
+        start = time.perf_counter()
+        visual_product_analyzer.main()
+        latencies.append(time.perf_counter() - start)
+        # The CLI reports errors instead of raising; it saves a file on success
+        if not Path(f"analysis_{Path(path).stem}.json").exists():
+            failures += 1
+    return latencies, failures
+
+
+def run_async(paths: List[str], image_dir: Path, work_dir: Path):
+    from async_visual_product_analyzer import AsyncVisualProductAnalyzer
+    from image_preprocessor import ImagePreprocessor
+    from result_cache import ResultCache, default_cache_path
+
+    latencies = []
+
+    class TimedAnalyzer(AsyncVisualProductAnalyzer):
+        async def analyze_product_image(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await super().analyze_product_image(*args, **kwargs)
+            finally:
+                latencies.append(time.perf_counter() - start)
+
+    async def run():
+        analyzer = TimedAnalyzer(
+            cache=ResultCache(default_cache_path()), preprocessor=ImagePreprocessor(), max_concurrency=32
+        )
+        return [item async for item in analyzer.analyze_many(paths, task="analysis")]
+
+    results = asyncio.run(run())
+    return latencies, sum(1 for result in results if result["status"] != "success")
+
+
+def run_batch_api(paths: List[str], image_dir: Path, work_dir: Path):
+    from batch_image_processor import BatchImageProcessor
+    from message_batches import MessageBatchRunner
+
+    # As process_directory_batch_api, polling often enough for a short benchmark
+    processor = BatchImageProcessor()
+    output_dir = work_dir / "output"
+    output_dir.mkdir(parents=True, exist_ok=True)
+    runner = MessageBatchRunner(processor.analyzer, output_dir / "batch_state.json", task="analysis", poll_interval=0.5)
+    start = time.perf_counter()
+    results = runner.run(paths, str(output_dir))
+    # Every image waits for the whole batch
+    turnaround = time.perf_counter() - start
+    return [turnaround] * len(paths), sum(1 for result in results if result["status"] != "success")
+
+
+RUNNERS = {
+    "process_directory": run_process_directory,
+    "cli": run_cli,
+    "async": run_async,
+    "batch_api": run_batch_api,
+}
+
+
+def run_worker(scenario: str, image_dir: str, work_dir: str):
+    """
+    Run one scenario and print its measurements as one line of JSON
+    """
+    paths = sorted(str(path) for path in Path(image_dir).iterdir())
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        latencies, failures = RUNNERS[scenario](paths, Path(image_dir), Path(work_dir))
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        "images": len(paths),
+        "failures": failures,
+        "seconds": elapsed,
+        "latencies": latencies,
+        "peak_rss_bytes": peak_rss_bytes(),
+    }))
+
+
+def run_scenario(server, scenario: str, image_dir: Path, work_dir: Path, verbose: bool = False) -> Dict:
+    """
+    Run a scenario in a fresh process against the mock server and
+    summarise it
+    """
+    work_dir.mkdir(parents=True, exist_ok=True)
+    env = dict(
+        os.environ,
+        ANTHROPIC_BASE_URL=server.base_url,
+        ANTHROPIC_API_KEY="benchmark",
+        # A fresh result cache, so every image is really requested
+        VPA_CACHE_PATH=str(work_dir / "cache.sqlite"),
+    )
+    before = server.stats()
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--worker", scenario, str(image_dir), str(work_dir)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=None if verbose else subprocess.DEVNULL,
+        text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"{scenario} worker exited with status {completed.returncode}")
+    measured = json.loads(completed.stdout.strip().splitlines()[-1])
+    after = server.stats()
+
+    statuses = {
+        status: count - before["statuses"].get(status, 0)
+        for status, count in after["statuses"].items()
+        if count - before["statuses"].get(status, 0)
+    }
+    latencies = measured["latencies"]
+    return {
+        "images": measured["images"],
+        "failures": measured["failures"],
+        "seconds": round(measured["seconds"], 3),
+        "throughput_images_per_second": round(measured["images"] / measured["seconds"], 3),
+        **{
+            f"{label}_seconds": round(percentile(latencies, fraction), 3) if latencies else None
+            for label, fraction in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99))
+        },
+        "peak_rss_bytes": measured["peak_rss_bytes"],
+        "bytes_uploaded": after["bytes_received"] - before["bytes_received"],
+        "bytes_downloaded": after["bytes_sent"] - before["bytes_sent"],
+        "responses": {str(status): count for status, count in sorted(statuses.items())},
+    }
+
+
+def run_benchmark(args: argparse.Namespace) -> Dict:
+    report = {
+        "config": {
+            "images": args.images,
+            "sizes": args.sizes,
+            "scenarios": args.scenarios,
+            "latency": args.latency,
+            "rate_limit_rate": args.rate_limit_rate,
+            "overloaded_rate": args.overloaded_rate,
+            "rate_limits": {"requests": args.rpm, "input_tokens": args.input_tpm, "output_tokens": args.output_tpm},
+            "response_chars": args.response_chars,
+        },
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory(prefix="vpa_benchmark_") as root, \
+            server_from_args(args, record_requests=False) as server:
+        root = Path(root)
+        for size in args.sizes:
+            image_dir = root / "images" / size
+            write_image_set(image_dir, args.images, size)
+            for scenario in args.scenarios:
+                name = f"{scenario}/{size}"
+                print(f"⏱️  {name}...", flush=True)
+                report["results"][name] = run_scenario(server, scenario, image_dir, root / "runs" / size / scenario, args.verbose)
+    return report
+
+
+def compare(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """
+    Regressions of more than tolerance (a fraction) against a baseline
+    report, one message each
+    """
+    regressions = []
+    for name, result in report["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            continue
+        if result["throughput_images_per_second"] < base["throughput_images_per_second"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput {result['throughput_images_per_second']} < "
+                f"baseline {base['throughput_images_per_second']} images/s"
+            )
+        for metric in LOWER_IS_BETTER:
+            value, base_value = result.get(metric), base.get(metric)
+            if value is not None and base_value and value > base_value * (1 + tolerance):
+                regressions.append(f"{name}: {metric} {value} > baseline {base_value}")
+    return regressions
+
+
+def main():
+    if len(sys.argv) == 5 and sys.argv[1] == "--worker":
+        run_worker(*sys.argv[2:])
+        return
+
+    parser = argparse.ArgumentParser(description="End-to-end throughput benchmark against a local mock API")
+    parser.add_argument("--images", type=int, default=50, help="synthetic images per size")
+    parser.add_argument("--sizes", nargs="+", choices=list(IMAGE_SIZES), default=["small", "large"])
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--baseline", help="JSON report to compare against; exits 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed regression, as a fraction")
+    parser.add_argument("--verbose", action="store_true", help="show the scenarios' own progress output")
+    add_server_arguments(parser)
+    parser.set_defaults(batch_delay=1.0, latency="lognormal:0.3,0.4", stream_delay=0.0)
+    args = parser.parse_args()
+
+    report = run_benchmark(args)
+
+    print("\nThroughput Benchmark")
+    print("=" * 60)
+    for name, row in report["results"].items():
+        rss = f"{row['peak_rss_bytes'] / 1e6:.0f} MB" if row["peak_rss_bytes"] else "n/a"
+        print(
+            f"{name}: {row['throughput_images_per_second']} images/s, "
+            f"p50 {row['p50_seconds']:.2f}s / p95 {row['p95_seconds']:.2f}s / p99 {row['p99_seconds']:.2f}s, "
+            f"peak RSS {rss}, {row['bytes_uploaded'] / 1e6:.1f} MB uploaded, "
+            f"{row['failures']} failed, responses {row['responses']}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Report saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"❌ {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"✅ No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import argparse
+import io
+import os
+import random
+import sys
+import time
+from typing import Dict, List, Tuple
+
+from PIL import Image
+
+from image_asset import ImageAsset
+from mock_anthropic_server import MockAnthropicServer, cacheable_prefix, min_cacheable_tokens, prefix_tokens
+
+
+def synthetic_images(
+    count: int, seed: int = 0, size: Tuple[int, int] = (640, 480), noise: float = 0.0
+) -> List[ImageAsset]:
+    """
+    Random product-like images, so benchmarks need no fixtures. noise adds
+    sensor-like grain, which makes the JPEGs as large as real photos.
+    """
+    rng = random.Random(seed)
+    images = []
+    width, height = size
+    for i in range(count):
+        img = Image.new("RGB", size, tuple(rng.randrange(256) for _ in range(3)))
+        img.paste(tuple(rng.randrange(256) for _ in range(3)), (width // 4, height // 4, width * 3 // 4, height * 3 // 4))
+        if noise:
+            grain = Image.effect_noise(size, noise).convert("RGB")
+            img = Image.blend(img, grain, 0.25)
+        buffer = io.BytesIO()
+        img.save(buffer, format="JPEG", quality=85)
+        images.append(ImageAsset(buffer.getvalue(), name=f"synthetic_{i}.jpg"))
+    return images
+
+
+def run_benchmark(images: List[ImageAsset]) -> Dict:
+    """
+    Run the cacheable tasks against a stub server and check that every
+    request of a task carries a byte-identical cacheable prefix. Also
+    reports each prefix's size against the model's minimum cacheable
+    length; shorter prefixes are not cached and save nothing.
+    """
+    with MockAnthropicServer() as server:
+        os.environ["ANTHROPIC_BASE_URL"] = server.base_url
+        os.environ.setdefault("ANTHROPIC_API_KEY", "benchmark")
+        # Imported late so the client picks up the stub server's URL
+        from visual_product_analyzer import VisualProductAnalyzer
+
+        analyzer = VisualProductAnalyzer()
+        categories = ["Kitchen", "Apparel", None]
+        language_sets = [["en", "es"], ["fr", "de", "it"], ["ja"]]
+        tasks = {
+            "analysis": lambda i, image: analyzer.analyze_product_image(image, categories[i % len(categories)]),
+            "full_analysis": lambda i, image: analyzer.full_analysis(image, categories[i % len(categories)]),
+            "multilingual": lambda i, image: analyzer.analyze_product_multilingual(image, language_sets[i % len(language_sets)]),
+        }
+
+        report = {"tasks": {}, "prefix_identical": True}
+        for task, run in tasks.items():
+            before = analyzer.usage_stats()
+            first_request = len(server.requests)
+            start = time.perf_counter()
+            for i, image in enumerate(images):
+                run(i, image)
+            elapsed = time.perf_counter() - start
+
+            prefixes = {cacheable_prefix(body) for body in server.requests[first_request:]}
+            after = analyzer.usage_stats()
+            identical = len(prefixes) == 1 and None not in prefixes
+            report["prefix_identical"] &= identical
+            tokens = max((prefix_tokens(prefix) for prefix in prefixes if prefix), default=0)
+            minimum = min_cacheable_tokens(analyzer.model)
+            report["tasks"][task] = {
+                "requests": after["requests"] - before["requests"],
+                "distinct_prefixes": len(prefixes),
+                "prefix_identical": identical,
+                "prefix_tokens": tokens,
+                "min_cacheable_tokens": minimum,
+                "cacheable": tokens >= minimum,
+                "cache_write_tokens": after["cache_creation_input_tokens"] - before["cache_creation_input_tokens"],
+                "cache_read_tokens": after["cache_read_input_tokens"] - before["cache_read_input_tokens"],
+                "uncached_input_tokens": after["input_tokens"] - before["input_tokens"],
+                "seconds": round(elapsed, 3),
+            }
+        report["usage"] = analyzer.usage_stats()
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that cacheable prompt prefixes stay byte-identical")
+    parser.add_argument("--images", type=int, default=20, help="number of synthetic images per task")
+    args = parser.parse_args()
+
+    report = run_benchmark(synthetic_images(args.images))
+
+    print("Prompt Cache Benchmark")
+    print("=" * 60)
+    for task, row in report["tasks"].items():
+        status = "✅" if row["prefix_identical"] else "❌"
+        print(
+            f"{status} {task}: {row['requests']} requests, {row['distinct_prefixes']} distinct prefix(es), "
+            f"{row['cache_write_tokens']} tokens written / {row['cache_read_tokens']} read from cache, "
+            f"{row['seconds']}s"
+        )
+        if not row["cacheable"]:
+            print(
+                f"   ⚠️  prefix is ~{row['prefix_tokens']} tokens, under the {row['min_cacheable_tokens']}-token "
+                f"minimum: not cached"
+            )
+    print(f"Cache read ratio: {report['usage']['cache_read_ratio']:.0%} of input tokens")
+    if not report["prefix_identical"]:
+        print("❌ Cacheable prefix changed between calls")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
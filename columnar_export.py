@@ -0,0 +1,213 @@
+import queue
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+from metrics import CALL_METRICS
+from structured_output import ProductAnalysis
+
+
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+# Result fields outside the analysis, stored as string columns
+RESULT_FIELDS = ["image", "status", "error", "alt_text", "extracted_text", "duplicate_of", "answered_by"]
+
+# Call metrics that are not whole numbers
+FLOAT_METRICS = {name for name in CALL_METRICS if name.endswith("_seconds")} | {"cost"}
+
+_FLUSH = object()
+_CLOSE = object()
+
+
+def result_schema():
+    """
+    Arrow schema of a result row: result fields, every ProductAnalysis
+    field (list fields as list<string>) and the per-image call metrics
+    """
+    fields = [pa.field(name, pa.string()) for name in RESULT_FIELDS]
+    for name, field_type in ProductAnalysis.__annotations__.items():
+        if field_type is float:
+            fields.append(pa.field(name, pa.float64()))
+        elif field_type == List[str]:
+            fields.append(pa.field(name, pa.list_(pa.string())))
+        else:
+            fields.append(pa.field(name, pa.string()))
+    for name in CALL_METRICS:
+        fields.append(pa.field(name, pa.float64() if name in FLOAT_METRICS else pa.int64()))
+    return pa.schema(fields)
+
+
+def result_row(result: Dict) -> Dict:
+    """
+    Flatten a result (as yielded by iter_process_directory) into a row
+    """
+    row = {name: result.get(name) for name in RESULT_FIELDS}
+    row["image"] = str(result["image"])
+    row["answered_by"] = (result.get("answered_by") or {}).get("model")
+    analysis = result.get("analysis") or {}
+    for name in ProductAnalysis.__annotations__:
+        row[name] = analysis.get(name)
+    metrics = result.get("metrics") or {}
+    for name in CALL_METRICS:
+        value = metrics.get(name)
+        row[name] = value if value is None or name in FLOAT_METRICS else int(value)
+    return row
+
+
+class ColumnarWriter:
+    """
+    Streams results into Parquet or Arrow IPC files in a directory.
+
+    write() only queues a row; a background thread groups rows into row
+    groups (record batches for Arrow) of row_group_size and starts a new
+    file, results-00000.parquet, results-00001.parquet, ..., once the
+    current one reaches max_file_bytes. Requires pyarrow.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        format: str = "parquet",
+        row_group_size: int = 10000,
+        max_file_bytes: int = 256 * 1024 * 1024,
+        compression: str = "zstd",
+        max_queued: int = 50000,
+    ):
+        if pa is None:
+            raise ImportError("Parquet/Arrow export needs pyarrow: pip install pyarrow")
+        if format not in FORMATS:
+            raise ValueError(f"Unknown format {format!r}; expected one of {', '.join(FORMATS)}")
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.format = format
+        self.row_group_size = row_group_size
+        self.max_file_bytes = max_file_bytes
+        self.compression = compression
+        self.schema = result_schema()
+
+        # Continue numbering after files from earlier runs
+        existing = [path.stem.split("-")[-1] for path in self.directory.glob(f"results-*{FORMATS[format]}")]
+        self._file_index = max((int(index) + 1 for index in existing if index.isdigit()), default=0)
+        self._sink = None
+        self._writer = None
+        self._rows: List[Dict] = []
+        self._error: Optional[BaseException] = None
+        self._stats = {"rows": 0, "row_groups": 0, "files": 0, "bytes": 0}
+        self._lock = threading.Lock()
+        # Bounded, so a stalled disk slows producers instead of filling memory
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._thread = threading.Thread(target=self._run, name="columnar-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, result: Dict):
+        self._raise_error()
+        self._queue.put(result_row(result))
+
+    def flush(self):
+        """
+        Write queued rows, including a partial row group, and wait for it
+        """
+        self._raise_error()
+        if not self._thread.is_alive():
+            return
+        done = threading.Event()
+        self._queue.put((_FLUSH, done))
+        done.wait()
+        self._raise_error()
+
+    def close(self):
+        """
+        Write everything queued and close the current file
+        """
+        if self._thread.is_alive():
+            done = threading.Event()
+            self._queue.put((_CLOSE, done))
+            done.wait()
+            self._thread.join()
+        self._raise_error()
+
+    def __enter__(self) -> "ColumnarWriter":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._stats)
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise RuntimeError(f"Columnar writer failed: {self._error}") from self._error
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if isinstance(item, tuple) and item[0] in (_FLUSH, _CLOSE):
+                marker, done = item
+                try:
+                    if self._error is None:
+                        self._write_rows()
+                        if marker is _CLOSE:
+                            self._close_file()
+                except Exception as e:
+                    self._error = e
+                done.set()
+                if marker is _CLOSE:
+                    return
+                continue
+            if self._error is not None:
+                # Keep draining so producers never block on a dead writer
+                continue
+            self._rows.append(item)
+            if len(self._rows) >= self.row_group_size:
+                try:
+                    self._write_rows()
+                except Exception as e:
+                    self._error = e
+
+    def _write_rows(self):
+        if not self._rows:
+            return
+        table = pa.Table.from_pylist(self._rows, schema=self.schema)
+        self._rows = []
+        if self._writer is None:
+            self._open_file()
+        if self.format == "parquet":
+            self._writer.write_table(table, row_group_size=len(table))
+        else:
+            self._writer.write_table(table, max_chunksize=len(table))
+        with self._lock:
+            self._stats["rows"] += len(table)
+            self._stats["row_groups"] += 1
+        if self._sink.tell() >= self.max_file_bytes:
+            self._close_file()
+
+    def _open_file(self):
+        path = self.directory / f"results-{self._file_index:05d}{FORMATS[self.format]}"
+        self._file_index += 1
+        self._sink = pa.OSFile(str(path), "wb")
+        if self.format == "parquet":
+            self._writer = pq.ParquetWriter(self._sink, self.schema, compression=self.compression)
+        else:
+            options = pa.ipc.IpcWriteOptions(compression=None if self.compression in (None, "none") else self.compression)
+            self._writer = pa.ipc.new_file(self._sink, self.schema, options=options)
+        with self._lock:
+            self._stats["files"] += 1
+
+    def _close_file(self):
+        if self._writer is None:
+            return
+        self._writer.close()
+        size = self._sink.tell()
+        self._sink.close()
+        self._writer = self._sink = None
+        with self._lock:
+            self._stats["bytes"] += size
@@ -0,0 +1,152 @@
+import asyncio
+import os
+import threading
+import time
+import weakref
+from typing import Dict, Optional, Tuple
+
+import anthropic
+
+
+class ConnectionStats:
+    """
+    Process-wide request and connection counters, collected from httpcore
+    trace events on clients built by this module. A request that does not
+    open a connection reused a kept-alive one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections_opened = 0
+        self.connect_seconds = 0.0
+
+    def _record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def _record_connection(self, seconds: float):
+        with self._lock:
+            self.connections_opened += 1
+            self.connect_seconds += seconds
+
+    def _on_trace(self, state: Dict, event_name: str):
+        if event_name == "connection.connect_tcp.started":
+            state["connect_started"] = time.perf_counter()
+        elif event_name.endswith("send_request_headers.started") and "connect_started" in state:
+            # TCP connect plus TLS handshake, if any
+            self._record_connection(time.perf_counter() - state.pop("connect_started"))
+
+    def sync_hook(self, request):
+        self._record_request()
+        state = {}
+        request.extensions["trace"] = lambda event_name, info: self._on_trace(state, event_name)
+
+    async def async_hook(self, request):
+        self._record_request()
+        state = {}
+
+        async def trace(event_name, info):
+            self._on_trace(state, event_name)
+
+        request.extensions["trace"] = trace
+
+    def stats(self) -> Dict:
+        with self._lock:
+            requests, opened, seconds = self.requests, self.connections_opened, self.connect_seconds
+        return {
+            "requests": requests,
+            "connections_opened": opened,
+            "reused": max(0, requests - opened),
+            "reuse_rate": max(0, requests - opened) / requests if requests else 0.0,
+            "avg_connect_ms": seconds / opened * 1000 if opened else 0.0,
+        }
+
+
+CONNECTION_STATS = ConnectionStats()
+
+_clients: Dict[Tuple, object] = {}
+# Event loop -> {settings: client}; dropped with the loop
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple, object]]" = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+
+def _client_options(
+    max_connections: int, keepalive_expiry: float, timeout: float, connect_timeout: float
+) -> Dict:
+    # Built from the SDK's own exports, so they match the HTTP library it bundles
+    limits_type = type(anthropic.DEFAULT_CONNECTION_LIMITS)
+    return {
+        "limits": limits_type(
+            max_connections=max_connections,
+            # Keep every pooled connection alive so steady-state requests skip TCP/TLS setup
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        "timeout": anthropic.Timeout(timeout, connect=connect_timeout),
+    }
+
+
+def get_client(
+    max_connections: int = 32,
+    keepalive_expiry: float = 60.0,
+    timeout: float = 120.0,
+    connect_timeout: float = 10.0,
+    api_key: Optional[str] = None,
+) -> anthropic.Anthropic:
+    """
+    Shared Anthropic client whose connection pool holds max_connections
+    kept-alive connections; size it to the number of concurrent requests.
+    Calls with the same settings return the same client, so threads and
+    app sessions share one pool.
+    """
+    api_key = api_key or os.environ.get("ANTHROPIC_API_KEY")
+    key = ("sync", max_connections, keepalive_expiry, timeout, connect_timeout, api_key)
+    with _clients_lock:
+        if key not in _clients:
+            options = _client_options(max_connections, keepalive_expiry, timeout, connect_timeout)
+            http_client = anthropic.DefaultHttpxClient(
+                event_hooks={"request": [CONNECTION_STATS.sync_hook]}, **options
+            )
+            _clients[key] = anthropic.Anthropic(api_key=api_key, timeout=options["timeout"], http_client=http_client)
+        return _clients[key]
+
+
+def get_async_client(
+    max_connections: int = 32,
+    keepalive_expiry: float = 60.0,
+    timeout: float = 120.0,
+    connect_timeout: float = 10.0,
+    api_key: Optional[str] = None,
+) -> anthropic.AsyncAnthropic:
+    """
+    AsyncAnthropic counterpart of get_client. Async clients are bound to
+    the event loop they first run on, so inside a running loop calls with
+    the same settings return that loop's shared client. Outside a loop
+    a new, unshared client is returned.
+    """
+    api_key = api_key or os.environ.get("ANTHROPIC_API_KEY")
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    key = (max_connections, keepalive_expiry, timeout, connect_timeout, api_key)
+    with _clients_lock:
+        clients = _async_clients.setdefault(loop, {}) if loop is not None else {}
+        if key not in clients:
+            options = _client_options(max_connections, keepalive_expiry, timeout, connect_timeout)
+            http_client = anthropic.DefaultAsyncHttpxClient(
+                event_hooks={"request": [CONNECTION_STATS.async_hook]}, **options
+            )
+            clients[key] = anthropic.AsyncAnthropic(
+                api_key=api_key, timeout=options["timeout"], http_client=http_client
+            )
+        return clients[key]
+
+
+def connection_stats() -> Dict:
+    """
+    Requests, connections opened, reuse rate and average connection setup
+    time across clients built by this module
+    """
+    return CONNECTION_STATS.stats()
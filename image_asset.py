@@ -0,0 +1,126 @@
+import base64
+import hashlib
+import io
+import threading
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional, Tuple, Union
+
+from PIL import Image
+
+
+SUFFIX_MEDIA_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp'
+}
+
+
+def sniff_media_type(data: bytes) -> Optional[str]:
+    """
+    Detect the image media type from its magic bytes
+    """
+    if data[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+class ImageAsset:
+    """
+    Encode-once handle for an image used by one or more analyzer tasks.
+
+    Built from a path, raw bytes or a file-like object. The raw bytes, base64
+    payload, media type, dimensions and content hash are computed lazily and
+    memoized, as are the preprocessed payloads for each task.
+    """
+
+    def __init__(self, source: Union[str, Path, bytes, BinaryIO], name: str = None):
+        self.path = None
+        self._raw_bytes = None
+        if isinstance(source, (str, Path)):
+            self.path = str(source)
+        elif isinstance(source, (bytes, bytearray)):
+            self._raw_bytes = bytes(source)
+        else:
+            if hasattr(source, "seek"):
+                source.seek(0)
+            self._raw_bytes = source.read()
+            name = name or getattr(source, "name", None)
+        self.name = name or self.path or "image"
+
+        self._lock = threading.Lock()
+        self._content_hash = None
+        self._base64 = None
+        self._dimensions = None
+        self._encoded: Dict[str, Tuple[str, str]] = {}
+
+    @classmethod
+    def coerce(cls, image: Union["ImageAsset", str, Path, bytes, BinaryIO]) -> "ImageAsset":
+        """
+        Return the argument as an ImageAsset, wrapping paths, bytes and files
+        """
+        return image if isinstance(image, ImageAsset) else cls(image)
+
+    @property
+    def raw_bytes(self) -> bytes:
+        if self._raw_bytes is None:
+            with open(self.path, "rb") as image_file:
+                self._raw_bytes = image_file.read()
+        return self._raw_bytes
+
+    @property
+    def content_hash(self) -> str:
+        if self._content_hash is None:
+            self._content_hash = hashlib.sha256(self.raw_bytes).hexdigest()
+        return self._content_hash
+
+    @property
+    def media_type(self) -> str:
+        sniffed = sniff_media_type(self.raw_bytes[:16])
+        if sniffed:
+            return sniffed
+        return SUFFIX_MEDIA_TYPES.get(Path(self.name).suffix.lower(), 'image/jpeg')
+
+    @property
+    def base64(self) -> str:
+        if self._base64 is None:
+            self._base64 = base64.standard_b64encode(self.raw_bytes).decode("utf-8")
+        return self._base64
+
+    @property
+    def dimensions(self) -> Tuple[int, int]:
+        """
+        (width, height), read from the image header without a full decode
+        """
+        if self._dimensions is None:
+            # Straight from the file when it hasn't been read yet, so only the header is loaded
+            source = self.path if self._raw_bytes is None else io.BytesIO(self._raw_bytes)
+            with Image.open(source) as image:
+                self._dimensions = image.size
+        return self._dimensions
+
+    def encoded(self, task: str = None, preprocessor=None) -> Tuple[str, str]:
+        """
+        (base64 data, media type) for upload, preprocessed with the task's
+        profile when a preprocessor is given
+        """
+        if preprocessor is None or task is None:
+            return self.base64, self.media_type
+        with self._lock:
+            if task not in self._encoded:
+                image_bytes, media_type, _ = preprocessor.process(self.raw_bytes, task, self.media_type)
+                self._encoded[task] = (
+                    base64.standard_b64encode(image_bytes).decode("utf-8"),
+                    media_type,
+                )
+            return self._encoded[task]
+
+    def __repr__(self) -> str:
+        return f"ImageAsset({self.name!r})"
@@ -0,0 +1,187 @@
+import io
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from image_asset import ImageAsset
+
+
+def _load_grayscale(image: ImageAsset, size: Tuple[int, int]) -> np.ndarray:
+    with Image.open(io.BytesIO(image.raw_bytes)) as img:
+        # Let the JPEG decoder downscale on the fly instead of decoding every pixel
+        img.draft("L", (size[0] * 4, size[1] * 4))
+        img = img.convert("L").resize(size, Image.LANCZOS)
+        return np.asarray(img, dtype=np.float64)
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.astype(np.uint8).ravel()).tobytes(), "big")
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)
+    matrix = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n))
+    matrix[0] *= 1 / np.sqrt(2)
+    return matrix * np.sqrt(2 / n)
+
+
+_DCT_CACHE: Dict[int, np.ndarray] = {}
+
+
+def phash(image: ImageAsset, hash_size: int = 8, highfreq_factor: int = 4) -> int:
+    """
+    DCT perceptual hash: robust to resizing, recompression and small edits
+    """
+    size = hash_size * highfreq_factor
+    pixels = _load_grayscale(image, (size, size))
+    if size not in _DCT_CACHE:
+        _DCT_CACHE[size] = _dct_matrix(size)
+    dct = _DCT_CACHE[size]
+    low = (dct @ pixels @ dct.T)[:hash_size, :hash_size]
+    # Exclude the DC term from the median so flat images don't skew it
+    return _bits_to_int(low > np.median(low.ravel()[1:]))
+
+
+def dhash(image: ImageAsset, hash_size: int = 8) -> int:
+    """
+    Difference hash: compares horizontally adjacent pixels
+    """
+    pixels = _load_grayscale(image, (hash_size + 1, hash_size))
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+HASH_FUNCTIONS = {"phash": phash, "dhash": dhash}
+
+
+class MultiIndexHashIndex:
+    """
+    Hamming-distance index over fixed-width hashes using multi-index hashing.
+
+    Each hash is split into max_distance + 1 bands. Two hashes within
+    max_distance bits of each other must agree exactly on at least one
+    band, so a search only verifies items sharing a band value instead of
+    scanning every stored hash.
+    """
+
+    def __init__(self, max_distance: int, bits: int = 64):
+        self.max_distance = max_distance
+        self.bits = bits
+        band_count = max_distance + 1
+        width = bits // band_count
+        self.bands = [
+            (i * width, bits if i == band_count - 1 else (i + 1) * width)
+            for i in range(band_count)
+        ]
+        self.tables: List[Dict[int, List[Tuple[int, str]]]] = [{} for _ in self.bands]
+
+    def _band_values(self, value: int):
+        for start, end in self.bands:
+            yield (value >> start) & ((1 << (end - start)) - 1)
+
+    def add(self, value: int, item: str):
+        for table, band in zip(self.tables, self._band_values(value)):
+            table.setdefault(band, []).append((value, item))
+
+    def remove(self, value: int, item: str):
+        for table, band in zip(self.tables, self._band_values(value)):
+            entries = table.get(band)
+            if entries and (value, item) in entries:
+                entries.remove((value, item))
+                if not entries:
+                    del table[band]
+
+    def search(self, value: int) -> List[Tuple[int, str]]:
+        """
+        (distance, item) pairs within max_distance, nearest first
+        """
+        seen = set()
+        matches = []
+        for table, band in zip(self.tables, self._band_values(value)):
+            for candidate, item in table.get(band, ()):
+                if item in seen:
+                    continue
+                seen.add(item)
+                distance = (candidate ^ value).bit_count()
+                if distance <= self.max_distance:
+                    matches.append((distance, item))
+        return sorted(matches)
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self.tables[0].values())
+
+
+class ImageDeduplicator:
+    """
+    Maps near-duplicate images onto one canonical image per cluster.
+
+    The first image claimed with a given perceptual hash becomes the
+    canonical one; later images within threshold bits map to it and can
+    wait for its analysis instead of paying for their own, for at most
+    wait_seconds. If the canonical image fails, it is dropped so the next
+    copy takes its place.
+    """
+
+    def __init__(self, threshold: int = 6, method: str = "phash", hash_size: int = 8, wait_seconds: float = 300.0):
+        self.threshold = threshold
+        self.wait_seconds = wait_seconds
+        self.method = method
+        self.hash_size = hash_size
+        self.index = MultiIndexHashIndex(threshold, bits=hash_size * hash_size)
+        self._lock = threading.Lock()
+        self._pending: Dict[str, threading.Event] = {}
+        self._failed = set()
+        self._hashes: Dict[str, int] = {}
+
+    def compute_hash(self, image: ImageAsset) -> int:
+        return HASH_FUNCTIONS[self.method](image, self.hash_size)
+
+    def claim(self, image_path: str, image_hash: int) -> Optional[str]:
+        """
+        Canonical image for a near-duplicate, or None if this image is new
+        and now canonical (the caller must then call resolve())
+        """
+        with self._lock:
+            matches = self.index.search(image_hash)
+            if matches:
+                return matches[0][1]
+            self.index.add(image_hash, image_path)
+            self._hashes[image_path] = image_hash
+            self._pending[image_path] = threading.Event()
+            return None
+
+    def register_completed(self, image_path: str, image_hash: int):
+        """
+        Add an image analyzed by an earlier run as a canonical candidate
+        """
+        with self._lock:
+            if not self.index.search(image_hash):
+                self.index.add(image_hash, image_path)
+                self._hashes[image_path] = image_hash
+
+    def resolve(self, image_path: str, success: bool):
+        """
+        Mark a canonical image's analysis as finished
+        """
+        with self._lock:
+            if success:
+                # A retried image may have failed before
+                self._failed.discard(image_path)
+            else:
+                self.index.remove(self._hashes.pop(image_path), image_path)
+                self._failed.add(image_path)
+            event = self._pending.pop(image_path, None)
+        if event is not None:
+            event.set()
+
+    def wait(self, canonical: str, timeout: Optional[float] = None) -> bool:
+        """
+        Block until a canonical image is resolved; True if it succeeded
+        """
+        with self._lock:
+            event = self._pending.get(canonical)
+        if event is not None and not event.wait(timeout):
+            return False
+        with self._lock:
+            return canonical not in self._failed
@@ -0,0 +1,164 @@
+import io
+import threading
+from typing import Dict, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+
+# Claude downsamples anything with a long edge above ~1568px, so pixels past
+# that point cost upload bytes without improving the answer.
+MAX_EFFECTIVE_EDGE = 1568
+
+# Per-task resolution profiles. "format" is None to keep the source format.
+DEFAULT_PROFILES = {
+    "analysis": {"max_edge": 1568, "format": "WEBP", "quality": 85},
+    "ocr": {"max_edge": 1568, "format": "WEBP", "quality": 92},
+    "alt_text": {"max_edge": 768, "format": "WEBP", "quality": 80},
+    "multilingual": {"max_edge": 1024, "format": "WEBP", "quality": 80},
+    "comparison": {"max_edge": 1024, "format": "WEBP", "quality": 85},
+    # Fused analysis + alt text + OCR needs OCR-grade resolution
+    "full_analysis": {"max_edge": 1568, "format": "WEBP", "quality": 92},
+}
+
+FORMAT_MEDIA_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "GIF": "image/gif",
+    "WEBP": "image/webp",
+}
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """
+    Approximate image input tokens (width * height / 750), after the
+    server-side downscale to the effective resolution
+    """
+    long_edge = max(width, height)
+    if long_edge > MAX_EFFECTIVE_EDGE:
+        scale = MAX_EFFECTIVE_EDGE / long_edge
+        width, height = int(width * scale), int(height * scale)
+    return max(1, int(width * height / 750))
+
+
+class ImagePreprocessor:
+    """
+    Downsize, orient and re-encode images before they are uploaded.
+
+    Each task has its own profile (max long edge, output format, quality).
+    EXIF orientation is applied to the pixels and the EXIF block is dropped.
+    """
+
+    def __init__(self, profiles: Dict[str, Dict] = None, enabled: bool = True):
+        self.profiles = {**DEFAULT_PROFILES, **(profiles or {})}
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._totals = {
+            "images": 0,
+            "original_bytes": 0,
+            "processed_bytes": 0,
+            "bytes_saved": 0,
+            "tokens_saved": 0,
+        }
+
+    def profile_for(self, task: str) -> Dict:
+        return self.profiles.get(task, self.profiles["analysis"])
+
+    def process(self, image_bytes: bytes, task: str, media_type: str) -> Tuple[bytes, str, Dict]:
+        """
+        Apply the task's profile; returns (bytes, media_type, report)
+        """
+        profile = self.profile_for(task)
+        report = {
+            "task": task,
+            "original_bytes": len(image_bytes),
+            "processed_bytes": len(image_bytes),
+            "bytes_saved": 0,
+            "tokens_saved": 0,
+        }
+        if not self.enabled:
+            return image_bytes, media_type, self._record(report)
+
+        image = Image.open(io.BytesIO(image_bytes))
+        report["original_size"] = image.size
+        report["processed_size"] = image.size
+        original_tokens = estimate_image_tokens(*image.size)
+        report["original_tokens"] = report["processed_tokens"] = original_tokens
+
+        # Animated images would lose their frames; send them untouched
+        if getattr(image, "is_animated", False):
+            return image_bytes, media_type, self._record(report)
+
+        has_exif = bool(image.info.get("exif"))
+        image = ImageOps.exif_transpose(image)
+
+        max_edge = profile.get("max_edge") or MAX_EFFECTIVE_EDGE
+        resized = max(image.size) > max_edge
+        if resized:
+            image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        source_format = {v: k for k, v in FORMAT_MEDIA_TYPES.items()}.get(media_type, "JPEG")
+        target_format = profile.get("format") or source_format
+        if not resized and not has_exif and target_format == source_format:
+            return image_bytes, media_type, self._record(report)
+
+        processed = self._encode(image, target_format, profile)
+
+        if not resized and len(processed) >= len(image_bytes):
+            # A re-encode that grows a small image is not worth sending,
+            # unless the original carries EXIF orientation and metadata
+            if not has_exif:
+                return image_bytes, media_type, self._record(report)
+            if target_format != source_format:
+                reencoded = self._encode(image, source_format, profile)
+                if len(reencoded) < len(processed):
+                    processed, target_format = reencoded, source_format
+
+        processed_tokens = estimate_image_tokens(*image.size)
+        report.update({
+            "processed_bytes": len(processed),
+            "bytes_saved": len(image_bytes) - len(processed),
+            "processed_size": image.size,
+            "processed_tokens": processed_tokens,
+            "tokens_saved": max(0, original_tokens - processed_tokens),
+        })
+        return processed, FORMAT_MEDIA_TYPES[target_format], self._record(report)
+
+    @staticmethod
+    def _encode(image: Image.Image, target_format: str, profile: Dict) -> bytes:
+        if target_format == "JPEG" and image.mode not in ("RGB", "L"):
+            background = Image.new("RGB", image.size, "white")
+            rgba = image.convert("RGBA")
+            background.paste(rgba, mask=rgba.getchannel("A"))
+            image = background
+        elif target_format == "WEBP" and image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+
+        buffer = io.BytesIO()
+        save_kwargs = {}
+        if target_format in ("JPEG", "WEBP"):
+            save_kwargs["quality"] = profile.get("quality", 85)
+        if target_format == "JPEG":
+            save_kwargs["optimize"] = True
+        image.save(buffer, format=target_format, **save_kwargs)
+        return buffer.getvalue()
+
+    def _record(self, report: Dict) -> Dict:
+        self._local.last_report = report
+        with self._lock:
+            self._totals["images"] += 1
+            for field in ("original_bytes", "processed_bytes", "bytes_saved", "tokens_saved"):
+                self._totals[field] += report[field]
+        return report
+
+    def pop_last_report(self) -> Optional[Dict]:
+        """
+        Report for the last image processed on the calling thread, if any
+        """
+        report = getattr(self._local, "last_report", None)
+        self._local.last_report = None
+        return report
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._totals)
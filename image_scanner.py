@@ -0,0 +1,94 @@
+import fnmatch
+import os
+import queue
+import threading
+from typing import Iterable, Iterator, List, Optional
+
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif'}
+
+
+def scan_images(
+    directory_path: str,
+    include: Optional[List[str]] = None,
+    exclude: Optional[List[str]] = None,
+    max_depth: Optional[int] = None,
+    extensions: Iterable[str] = IMAGE_EXTENSIONS,
+) -> Iterator[str]:
+    """
+    Lazily yield image paths under a directory using os.scandir.
+
+    include/exclude are glob patterns matched against the path relative to
+    directory_path (e.g. "shoes/*", "*_thumb.jpg"); excluded directories are
+    not descended into. max_depth=0 only scans directory_path itself.
+    Symlinked directories are not followed.
+    """
+    extensions = {ext.lower() for ext in extensions}
+    stack = [(directory_path, 0)]
+    while stack:
+        current, depth = stack.pop()
+        try:
+            entries = os.scandir(current)
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                relative = os.path.relpath(entry.path, directory_path).replace(os.sep, "/")
+                if exclude and any(fnmatch.fnmatch(relative, pattern) for pattern in exclude):
+                    continue
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+                if is_dir:
+                    if max_depth is None or depth < max_depth:
+                        stack.append((entry.path, depth + 1))
+                    continue
+                if os.path.splitext(entry.name)[1].lower() not in extensions:
+                    continue
+                if include and not any(fnmatch.fnmatch(relative, pattern) for pattern in include):
+                    continue
+                yield entry.path
+
+
+def iter_prefetched(items: Iterable, maxsize: int = 1024) -> Iterator:
+    """
+    Run an iterator on a background thread, feeding a bounded queue.
+
+    The consumer starts receiving items immediately while the producer
+    stays at most maxsize items ahead. Producer exceptions are re-raised
+    in the consumer.
+    """
+    buffer = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(entry) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put(("item", item)):
+                    return
+            put(("done", None))
+        except Exception as e:
+            put(("error", e))
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            kind, value = buffer.get()
+            if kind == "done":
+                return
+            if kind == "error":
+                raise value
+            yield value
+    finally:
+        stop.set()
@@ -0,0 +1,207 @@
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+from visual_product_analyzer import VisualProductAnalyzer
+
+
+class MessageBatchRunner:
+    """
+    Run analyzer tasks through the Message Batches API for offline catalog jobs.
+
+    Requests are packed into batches capped by request count and payload
+    size. Batch IDs, the custom_id -> image mapping and the file each
+    result was written to are persisted to a JSON state file after every step, so a crashed run resumes where it
+    left off: already submitted images are not resubmitted and already
+    collected batches are not downloaded again.
+    """
+
+    # API limits are 100,000 requests / 256 MB per batch; stay under them
+    MAX_REQUESTS_PER_BATCH = 100_000
+    MAX_BATCH_BYTES = 256 * 1024 * 1024
+
+    def __init__(
+        self,
+        analyzer: VisualProductAnalyzer,
+        state_path: str,
+        task: str = "analysis",
+        max_requests_per_batch: int = 10_000,
+        max_batch_bytes: int = 200 * 1024 * 1024,
+        poll_interval: float = 10.0,
+        max_poll_interval: float = 300.0,
+    ):
+        if task not in ("analysis", "full_analysis"):
+            raise ValueError(f"Unsupported batch task: {task}")
+        self.analyzer = analyzer
+        self.state_path = Path(state_path)
+        self.task = task
+        self.max_requests_per_batch = min(max_requests_per_batch, self.MAX_REQUESTS_PER_BATCH)
+        self.max_batch_bytes = min(max_batch_bytes, self.MAX_BATCH_BYTES)
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.state = self._load_state()
+
+    def _load_state(self) -> Dict:
+        if self.state_path.exists():
+            with open(self.state_path) as f:
+                state = json.load(f)
+            if state.get("task") != self.task:
+                raise ValueError(f"{self.state_path} belongs to a '{state.get('task')}' run")
+            state.setdefault("outputs", {})
+            return state
+        return {"task": self.task, "next_id": 0, "batches": [], "errors": {}, "outputs": {}}
+
+    def _save_state(self):
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _spec(self, image_path: str) -> Dict:
+        if self.task == "full_analysis":
+            return self.analyzer._full_analysis_spec(image_path)
+        return self.analyzer._analysis_spec(image_path)
+
+    def _write_output(self, image_path: str, output_dir: str, result):
+        # Imported here, since batch_image_processor imports this module
+        from batch_image_processor import BatchImageProcessor
+
+        output_file = BatchImageProcessor.output_file(image_path, output_dir)
+        with open(output_file, "w") as f:
+            json.dump(result, f, indent=2)
+        self.state["outputs"][image_path] = str(output_file)
+
+    def submit(self, image_paths: Iterable[str], output_dir: str) -> List[str]:
+        """
+        Submit every image not yet submitted; returns the new batch IDs.
+        Images already in the result cache are written out without a request.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        submitted = {
+            path for batch in self.state["batches"] for path in batch["requests"].values()
+        }
+        new_batches = []
+        requests, mapping, size = [], {}, 0
+
+        for image_path in image_paths:
+            image_path = str(image_path)
+            if image_path in submitted:
+                continue
+            spec = self._spec(image_path)
+            key = self.analyzer._cache_key(spec)
+            cached = self.analyzer.cache.get(key) if key is not None else None
+            if cached is not None:
+                self._write_output(image_path, output_dir, cached)
+                continue
+
+            custom_id = f"img-{self.state['next_id']:08d}"
+            self.state["next_id"] += 1
+            request = {"custom_id": custom_id, "params": self.analyzer._build_request(spec)}
+            request_size = len(json.dumps(request))
+
+            if requests and (
+                len(requests) >= self.max_requests_per_batch
+                or size + request_size > self.max_batch_bytes
+            ):
+                new_batches.append(self._create_batch(requests, mapping))
+                requests, mapping, size = [], {}, 0
+
+            requests.append(request)
+            mapping[custom_id] = image_path
+            size += request_size
+
+        if requests:
+            new_batches.append(self._create_batch(requests, mapping))
+        self._save_state()
+        return new_batches
+
+    def _create_batch(self, requests: List[Dict], mapping: Dict[str, str]) -> str:
+        batch = self.analyzer.client.messages.batches.create(requests=requests)
+        self.state["batches"].append({"id": batch.id, "requests": mapping, "status": "submitted"})
+        self._save_state()
+        print(f"Submitted batch {batch.id} with {len(requests)} requests")
+        return batch.id
+
+    def wait(self):
+        """
+        Poll with backoff until every submitted batch has ended
+        """
+        interval = self.poll_interval
+        while True:
+            pending = [b for b in self.state["batches"] if b["status"] == "submitted"]
+            for batch in pending:
+                status = self.analyzer.client.messages.batches.retrieve(batch["id"])
+                if status.processing_status == "ended":
+                    batch["status"] = "ended"
+                    self._save_state()
+            if all(b["status"] != "submitted" for b in self.state["batches"]):
+                return
+            time.sleep(interval)
+            interval = min(self.max_poll_interval, interval * 1.5)
+
+    def collect(self, output_dir: str):
+        """
+        Stream results of ended batches into per-image JSON files and the cache
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        for batch in self.state["batches"]:
+            if batch["status"] != "ended":
+                continue
+            for item in self.analyzer.client.messages.batches.results(batch["id"]):
+                image_path = batch["requests"].get(item.custom_id)
+                if image_path is None:
+                    continue
+                if item.result.type != "succeeded":
+                    error = getattr(item.result, "error", None)
+                    self.state["errors"][image_path] = str(error) if error else item.result.type
+                    continue
+                spec = self._spec(image_path)
+                try:
+                    result = self.analyzer._parse_with_repair(spec, item.result.message)
+                except Exception as e:
+                    self.state["errors"][image_path] = f"Unparseable response: {e}"
+                    continue
+                self.state["errors"].pop(image_path, None)
+                self._write_output(image_path, output_dir, result)
+                key = self.analyzer._cache_key(spec)
+                if key is not None:
+                    self.analyzer.cache.put(key, result)
+            batch["status"] = "collected"
+            self._save_state()
+
+    def results(self, image_paths: Iterable[str], output_dir: str) -> List[Dict]:
+        """
+        Result rows in the BatchImageProcessor shape, read back from the
+        file recorded for each image when its result was collected
+        """
+        results = []
+        for image_path in image_paths:
+            image_path = str(image_path)
+            output_file = self.state["outputs"].get(image_path)
+            if image_path in self.state["errors"]:
+                results.append({"image": image_path, "status": "error", "error": self.state["errors"][image_path]})
+            elif output_file and os.path.exists(output_file):
+                with open(output_file) as f:
+                    output = json.load(f)
+                result = {"image": image_path, "status": "success"}
+                if self.task == "full_analysis":
+                    result.update(output)
+                else:
+                    result["analysis"] = output
+                results.append(result)
+            else:
+                results.append({"image": image_path, "status": "error", "error": "No batch result"})
+        return results
+
+    def run(self, image_paths: Iterable[str], output_dir: str) -> List[Dict]:
+        """
+        Submit, wait and collect; safe to call again after a crash
+        """
+        image_paths = [str(p) for p in image_paths]
+        self.submit(image_paths, output_dir)
+        self.wait()
+        self.collect(output_dir)
+        return self.results(image_paths, output_dir)
@@ -0,0 +1,189 @@
+import json
+import os
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Per-call measurements recorded by the analyzers: field -> (metric, help).
+# Fields ending in _seconds are histograms, the rest counters.
+CALL_METRICS = {
+    "requests": ("vpa_requests_total", "API requests sent"),
+    "errors": ("vpa_request_errors_total", "API requests that failed after retries"),
+    "retries": ("vpa_retries_total", "Retried API attempts"),
+    "payload_bytes": ("vpa_payload_bytes_total", "Request body bytes sent"),
+    "input_tokens": ("vpa_input_tokens_total", "Uncached input tokens"),
+    "output_tokens": ("vpa_output_tokens_total", "Output tokens"),
+    "cache_creation_input_tokens": ("vpa_cache_creation_input_tokens_total", "Input tokens written to the prompt cache"),
+    "cache_read_input_tokens": ("vpa_cache_read_input_tokens_total", "Input tokens read from the prompt cache"),
+    "cost": ("vpa_cost_usd_total", "Estimated USD cost at list prices, each call at its own model's rates"),
+    "read_seconds": ("vpa_image_read_seconds", "Time reading image files"),
+    "encode_seconds": ("vpa_image_encode_seconds", "Time preprocessing and base64-encoding images"),
+    "request_seconds": ("vpa_request_seconds", "API request latency, including retries"),
+    "first_token_seconds": ("vpa_first_token_seconds", "Time to first streamed token"),
+    "parse_seconds": ("vpa_parse_seconds", "Time parsing and validating responses"),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class MetricsRegistry:
+    """
+    Thread-safe counters and histograms keyed by name and labels, exported
+    as Prometheus text exposition or a JSON snapshot
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._help: Dict[str, str] = {metric: help_text for metric, help_text in CALL_METRICS.values()}
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        # name -> labels -> [per-bucket counts (last is +Inf), sum, count]
+        self._histograms: Dict[str, Dict[Labels, list]] = {}
+
+    @staticmethod
+    def _labels(labels: Dict[str, str]) -> Labels:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def describe(self, name: str, help_text: str):
+        with self._lock:
+            self._help[name] = help_text
+
+    def inc(self, name: str, amount: float = 1.0, **labels):
+        key = self._labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels):
+        key = self._labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            histogram = series[key]
+            histogram[0][bisect_left(self.buckets, value)] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def record_call(self, values: Dict[str, float], **labels):
+        """
+        Record per-call measurements named as in CALL_METRICS
+        """
+        for field, value in values.items():
+            if value is None:
+                continue
+            metric = CALL_METRICS[field][0]
+            if field.endswith("_seconds"):
+                self.observe(metric, value, **labels)
+            elif value:
+                self.inc(metric, value, **labels)
+
+    def snapshot(self) -> Dict:
+        """
+        JSON-serializable view of every series
+        """
+        with self._lock:
+            counters = {
+                name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                for name, series in self._counters.items()
+            }
+            histograms = {}
+            for name, series in self._histograms.items():
+                histograms[name] = []
+                for key, (counts, total, count) in series.items():
+                    cumulative, running = {}, 0
+                    for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                        running += bucket_count
+                        cumulative["+Inf" if bound == float("inf") else f"{bound:g}"] = running
+                    histograms[name].append({"labels": dict(key), "count": count, "sum": total, "buckets": cumulative})
+        return {"counters": counters, "histograms": histograms}
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    def prometheus_text(self) -> str:
+        """
+        Prometheus text exposition format (version 0.0.4)
+        """
+        snapshot = self.snapshot()
+        with self._lock:
+            help_texts = dict(self._help)
+        lines = []
+        for name, series in sorted(snapshot["counters"].items()):
+            lines.append(f"# HELP {name} {help_texts.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+            for entry in series:
+                lines.append(f"{name}{_format_labels(entry['labels'])} {_format_value(entry['value'])}")
+        for name, series in sorted(snapshot["histograms"].items()):
+            lines.append(f"# HELP {name} {help_texts.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+            for entry in series:
+                for bound, count in entry["buckets"].items():
+                    labels = _format_labels(dict(entry["labels"], le=bound))
+                    lines.append(f"{name}_bucket{labels} {count}")
+                lines.append(f"{name}_sum{_format_labels(entry['labels'])} {_format_value(entry['sum'])}")
+                lines.append(f"{name}_count{_format_labels(entry['labels'])} {entry['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, directory: str):
+        """
+        Save metrics.prom (for a textfile collector) and metrics.json
+        """
+        with open(os.path.join(directory, "metrics.prom"), "w") as f:
+            f.write(self.prometheus_text())
+        with open(os.path.join(directory, "metrics.json"), "w") as f:
+            f.write(self.to_json())
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+REGISTRY = MetricsRegistry()
+
+
+def start_metrics_server(port: int = 9464, host: str = "127.0.0.1", registry: Optional[MetricsRegistry] = None):
+    """
+    Serve /metrics (Prometheus text) and /metrics.json on a background
+    thread; returns the server, stop it with shutdown()
+    """
+    registry = registry if registry is not None else REGISTRY
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            path = self.path.split("?")[0]
+            if path == "/metrics":
+                body, content_type = registry.prometheus_text(), "text/plain; version=0.0.4"
+            elif path == "/metrics.json":
+                body, content_type = registry.to_json(), "application/json"
+            else:
+                self.send_error(404)
+                return
+            data = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("content-type", content_type)
+            self.send_header("content-length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
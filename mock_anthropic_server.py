@@ -0,0 +1,615 @@
+import argparse
+import itertools
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+
+def canned_response_text(body: Dict) -> str:
+    """
+    Plausible response text for a Messages API request, shaped by its prompt
+    """
+    prompt = ""
+    system = body.get("system") or ""
+    if isinstance(system, str):
+        prompt += system
+    else:
+        prompt += "".join(block.get("text", "") for block in system)
+    for message in body.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            prompt += content
+            continue
+        for block in content or []:
+            if block.get("type") == "text":
+                prompt += block["text"]
+
+    analysis = {
+        "product_type": "Ceramic Mug",
+        "category": "Home/Kitchen",
+        "features": ["12 oz capacity", "Glossy glaze", "Ergonomic handle"],
+        "colors": ["White", "Navy"],
+        "materials": ["Ceramic"],
+        "condition": "New",
+        "defects": [],
+        "suggested_title": "Classic Glazed Ceramic Coffee Mug, 12 oz",
+        "suggested_description": "A sturdy everyday mug with a glossy finish. Dishwasher and microwave safe.",
+        "key_selling_points": ["Durable ceramic", "Comfortable grip", "Easy to clean"],
+        "target_audience": "Coffee and tea drinkers",
+        "comparable_products": ["IKEA FÄRGRIK mug"],
+        "confidence_score": 0.91,
+    }
+    if '"extracted_text"' in prompt:
+        return json.dumps({
+            "analysis": analysis,
+            "alt_text": "1. White ceramic mug\n2. Glossy white ceramic coffee mug with navy rim\n"
+                        "3. Glossy white 12 oz ceramic coffee mug with a navy rim and curved handle",
+            "extracted_text": "MADE IN PORTUGAL\nDISHWASHER SAFE",
+        })
+    if "languages:" in prompt.lower():
+        codes = prompt.lower().split("languages:", 1)[1].split("\n", 1)[0]
+        return json.dumps({
+            code.strip(): {
+                "title": analysis["suggested_title"],
+                "description": analysis["suggested_description"],
+                "features": analysis["features"],
+            }
+            for code in codes.split(",") if code.strip()
+        })
+    if "language:" in prompt.lower():
+        return json.dumps({
+            "title": analysis["suggested_title"],
+            "description": analysis["suggested_description"],
+            "features": analysis["features"],
+        })
+    if "JSON" in prompt:
+        return "```json\n" + json.dumps(analysis, indent=2) + "\n```"
+    return "MADE IN PORTUGAL\nDISHWASHER SAFE"
+
+
+def cacheable_prefix(body: Dict) -> Optional[str]:
+    """
+    Canonical serialization of the request prefix up to and including the
+    last block marked with cache_control (tools, then system, then
+    messages), or None when nothing is marked cacheable
+    """
+    blocks = [("model", body.get("model"))]
+    blocks += [("tool", tool) for tool in body.get("tools") or []]
+    system = body.get("system") or []
+    if isinstance(system, str):
+        system = [{"type": "text", "text": system}]
+    blocks += [("system", block) for block in system]
+    for message in body.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            content = [{"type": "text", "text": content}]
+        blocks += [(message.get("role"), block) for block in content or []]
+    last = max(
+        (i for i, (_, block) in enumerate(blocks) if isinstance(block, dict) and block.get("cache_control")),
+        default=None,
+    )
+    if last is None:
+        return None
+    return json.dumps(blocks[:last + 1], sort_keys=True, ensure_ascii=False)
+
+
+# Shortest prefix the API caches, by model name prefix; shorter prefixes
+# marked with cache_control are processed as ordinary input
+MIN_CACHEABLE_TOKENS = {
+    "claude-3-5-haiku": 2048,
+    "claude-3-haiku": 2048,
+}
+DEFAULT_MIN_CACHEABLE_TOKENS = 1024
+
+
+def min_cacheable_tokens(model: str) -> int:
+    for prefix in sorted(MIN_CACHEABLE_TOKENS, key=len, reverse=True):
+        if (model or "").startswith(prefix):
+            return MIN_CACHEABLE_TOKENS[prefix]
+    return DEFAULT_MIN_CACHEABLE_TOKENS
+
+
+def prefix_tokens(prefix: str) -> int:
+    """
+    Approximate token count of a cacheable prefix, at 4 bytes per token
+    """
+    return len(prefix) // 4
+
+
+FILLER = "Additional product detail for benchmarking. "
+
+
+def _pad(content: List[Dict], chars: int):
+    """
+    Grow a response by chars characters: the text of a text block, or the
+    longest string field of a tool call's input
+    """
+    block = content[0]
+    filler = (FILLER * (chars // len(FILLER) + 1))[:chars]
+    if block["type"] == "text":
+        block["text"] += "\n" + filler
+        return
+    strings = [key for key, value in block["input"].items() if isinstance(value, str)]
+    if strings:
+        key = max(strings, key=lambda k: len(block["input"][k]))
+        block["input"][key] += " " + filler
+
+
+def build_message(
+    body: Dict,
+    message_id: str,
+    prompt_cache: Optional[Set[str]] = None,
+    malformed: bool = False,
+    response_chars: int = 0,
+) -> Dict:
+    """
+    Messages API response for a request. Forced tool calls are answered
+    with a tool_use block, unless malformed is set, in which case the JSON
+    comes back as fenced text with a trailing comma. response_chars pads
+    the answer to simulate longer outputs.
+    """
+    text = canned_response_text(body)
+    content = [{"type": "text", "text": text}]
+    stop_reason = "end_turn"
+    tool_choice = body.get("tool_choice") or {}
+    if tool_choice.get("type") == "tool":
+        payload = text.split("```json")[1].split("```")[0] if "```json" in text else text
+        try:
+            tool_input = json.loads(payload)
+        except json.JSONDecodeError:
+            tool_input = {"text": text}
+        if malformed:
+            content = [{"type": "text", "text": "```\n" + json.dumps(tool_input)[:-1] + ",}\n```"}]
+        else:
+            content = [{
+                "type": "tool_use",
+                "id": message_id.replace("msg", "toolu"),
+                "name": tool_choice["name"],
+                "input": tool_input,
+            }]
+            stop_reason = "tool_use"
+    if response_chars > 0:
+        _pad(content, response_chars)
+    # Roughly 4 bytes of request per input token
+    input_tokens = max(1, len(json.dumps(body)) // 4)
+    usage = {
+        "input_tokens": input_tokens,
+        "output_tokens": max(1, len(json.dumps(content)) // 4),
+        "cache_creation_input_tokens": 0,
+        "cache_read_input_tokens": 0,
+    }
+    prefix = cacheable_prefix(body) if prompt_cache is not None else None
+    cached_tokens = min(input_tokens, prefix_tokens(prefix)) if prefix is not None else 0
+    # Like the API, prefixes under the model's minimum are not cached
+    if prefix is not None and cached_tokens >= min_cacheable_tokens(body.get("model")):
+        usage["input_tokens"] = input_tokens - cached_tokens
+        if prefix in prompt_cache:
+            usage["cache_read_input_tokens"] = cached_tokens
+        else:
+            prompt_cache.add(prefix)
+            usage["cache_creation_input_tokens"] = cached_tokens
+    return {
+        "id": message_id,
+        "type": "message",
+        "role": "assistant",
+        "model": body.get("model", "mock"),
+        "content": content,
+        "stop_reason": stop_reason,
+        "stop_sequence": None,
+        "usage": usage,
+    }
+
+
+def latency_distribution(spec: str) -> Callable[[], float]:
+    """
+    Sampler of injected latency in seconds from a spec string:
+    "0.2" (fixed), "uniform:LOW,HIGH", "lognormal:MEDIAN,SIGMA" or
+    "tail:BASE,SLOW,RATE" (BASE, except a RATE fraction of SLOW)
+    """
+    kind, _, args = spec.partition(":")
+    if not args:
+        value = float(kind)
+        return lambda: value
+    values = [float(arg) for arg in args.split(",")]
+    if kind == "uniform":
+        low, high = values
+        return lambda: random.uniform(low, high)
+    if kind == "lognormal":
+        median, sigma = values
+        return lambda: random.lognormvariate(math.log(median), sigma)
+    if kind == "tail":
+        base, slow, rate = values
+        return lambda: slow if random.random() < rate else base
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def _iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class MockAnthropicServer:
+    """
+    Local stand-in for the Messages and Message Batches endpoints.
+
+    Point the SDK at it with ANTHROPIC_BASE_URL=server.base_url (or
+    base_url=...). Batches report "ended" batch_delay seconds after
+    creation. Requests with "stream": true get server-sent events, one
+    text delta every stream_chunk_delay seconds. Prompt caching is simulated: prefixes marked with
+    cache_control are remembered in prompt_cache and reported as cache
+    writes, then cache reads, in the response usage, once they reach the
+    model's minimum cacheable length (MIN_CACHEABLE_TOKENS). A malformed_rate
+    fraction of forced tool calls is answered with broken JSON text.
+    first_token_latency, if set, samples a delay (see latency_distribution)
+    applied before a response's first content: after message_start when
+    streaming, before the whole response otherwise.
+
+    Rate limits are simulated too: with rate_limits (per-minute
+    "requests", "input_tokens" and/or "output_tokens"), responses carry
+    anthropic-ratelimit-* headers and requests over a limit get a 429 with
+    retry-after. rate_limit_rate and overloaded_rate inject random 429s
+    and 529s on top. response_chars pads every answer. Request bytes,
+    response bytes and statuses are counted in stats().
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        batch_delay: float = 0.0,
+        stream_chunk_delay: float = 0.0,
+        malformed_rate: float = 0.0,
+        first_token_latency: Optional[Callable[[], float]] = None,
+        rate_limits: Optional[Dict[str, int]] = None,
+        rate_limit_rate: float = 0.0,
+        overloaded_rate: float = 0.0,
+        retry_after: float = 1.0,
+        response_chars: int = 0,
+        record_requests: bool = True,
+    ):
+        self.batch_delay = batch_delay
+        self.first_token_latency = first_token_latency
+        self.malformed_rate = malformed_rate
+        self.stream_chunk_delay = stream_chunk_delay
+        self.rate_limits = rate_limits or {}
+        self.rate_limit_rate = rate_limit_rate
+        self.overloaded_rate = overloaded_rate
+        self.retry_after = retry_after
+        self.response_chars = response_chars
+        # Benchmarks turn this off so request bodies (images) are not kept
+        self.record_requests = record_requests
+        self.batches: Dict[str, Dict] = {}
+        self.requests = []
+        self.statuses = Counter()
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        # (time, input tokens, output tokens) of admitted requests in the last minute
+        self._window = deque()
+        self.prompt_cache: Set[str] = set()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockAnthropicServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def build_message(self, body: Dict) -> Dict:
+        malformed = self.malformed_rate > 0 and random.random() < self.malformed_rate
+        return build_message(body, self.next_id("msg"), self.prompt_cache, malformed, self.response_chars)
+
+    def admit(self, message: Dict) -> Tuple[int, Optional[Dict], Dict[str, str]]:
+        """
+        Apply the simulated rate limits and error rates to a response.
+        Returns (status, error payload or None, headers to send).
+        """
+        now = time.time()
+        usage = message["usage"]
+        cost = {
+            "requests": 1,
+            "input_tokens": usage["input_tokens"] + usage["cache_creation_input_tokens"],
+            "output_tokens": usage["output_tokens"],
+        }
+        with self._lock:
+            while self._window and self._window[0][0] <= now - 60:
+                self._window.popleft()
+            used = {
+                "requests": len(self._window),
+                "input_tokens": sum(entry[1] for entry in self._window),
+                "output_tokens": sum(entry[2] for entry in self._window),
+            }
+            over = [kind for kind, limit in self.rate_limits.items() if used[kind] + cost[kind] > limit]
+            error = None
+            if over:
+                retry_after = max(1.0, self._window[0][0] + 60 - now) if self._window else 1.0
+                error = (429, "rate_limit_error", f"Rate limit exceeded: {', '.join(over)}", retry_after)
+            else:
+                roll = random.random()
+                if roll < self.rate_limit_rate:
+                    error = (429, "rate_limit_error", "Rate limit exceeded", self.retry_after)
+                elif roll < self.rate_limit_rate + self.overloaded_rate:
+                    error = (529, "overloaded_error", "Overloaded", self.retry_after)
+                else:
+                    self._window.append((now, cost["input_tokens"], cost["output_tokens"]))
+                    for kind in used:
+                        used[kind] += cost[kind]
+            reset = _iso(self._window[0][0] + 60 if self._window else now)
+
+        headers = {}
+        for kind, limit in self.rate_limits.items():
+            prefix = "anthropic-ratelimit-" + kind.replace("_", "-")
+            headers[f"{prefix}-limit"] = str(limit)
+            headers[f"{prefix}-remaining"] = str(max(0, limit - used[kind]))
+            headers[f"{prefix}-reset"] = reset
+        if error is None:
+            return 200, None, headers
+        status, error_type, text, retry_after = error
+        headers["retry-after"] = f"{retry_after:g}"
+        return status, {"type": "error", "error": {"type": error_type, "message": text}}, headers
+
+    def _count_response(self, status: Optional[int], size: int):
+        with self._lock:
+            if status is not None:
+                self.statuses[status] += 1
+            self.bytes_sent += size
+
+    def stats(self) -> Dict:
+        """
+        Responses by status, request bytes received and response bytes sent
+        """
+        with self._lock:
+            return {
+                "statuses": dict(self.statuses),
+                "bytes_received": self.bytes_received,
+                "bytes_sent": self.bytes_sent,
+            }
+
+    def inject_latency(self):
+        if self.first_token_latency is not None:
+            time.sleep(max(0.0, self.first_token_latency()))
+
+    def next_id(self, prefix: str) -> str:
+        with self._lock:
+            return f"{prefix}_mock_{next(self._ids):06d}"
+
+    def batch_view(self, batch: Dict) -> Dict:
+        ended = time.time() - batch["created_at"] >= self.batch_delay
+        count = len(batch["requests"])
+        return {
+            "id": batch["id"],
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else count,
+                "succeeded": count if ended else 0,
+                "errored": 0,
+                "canceled": 0,
+                "expired": 0,
+            },
+            "created_at": _iso(batch["created_at"]),
+            "expires_at": _iso(batch["created_at"] + 86400),
+            "ended_at": _iso(batch["created_at"] + self.batch_delay) if ended else None,
+            "archived_at": None,
+            "cancel_initiated_at": None,
+            "results_url": f"{self.base_url}/v1/messages/batches/{batch['id']}/results" if ended else None,
+        }
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status: int, payload, headers: Dict = None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+                server._count_response(status, len(data))
+
+            def _send_stream(self, message: Dict, headers: Dict = None, chunk_size: int = 16):
+                """
+                Send a message as Messages API server-sent events, chunked
+                """
+                self.send_response(200)
+                self.send_header("content-type", "text/event-stream")
+                self.send_header("transfer-encoding", "chunked")
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                server._count_response(200, 0)
+
+                def send_event(name: str, payload: Dict):
+                    data = f"event: {name}\ndata: {json.dumps(payload)}\n\n".encode("utf-8")
+                    self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                    self.wfile.flush()
+                    server._count_response(None, len(data))
+
+                block = message["content"][0]
+                if block["type"] == "tool_use":
+                    text = json.dumps(block["input"])
+                    start_block = dict(block, input={})
+                    delta = lambda piece: {"type": "input_json_delta", "partial_json": piece}
+                else:
+                    text = block["text"]
+                    start_block = {"type": "text", "text": ""}
+                    delta = lambda piece: {"type": "text_delta", "text": piece}
+                start = dict(message, content=[], stop_reason=None, usage=dict(message["usage"], output_tokens=1))
+                send_event("message_start", {"type": "message_start", "message": start})
+                send_event("content_block_start", {
+                    "type": "content_block_start", "index": 0, "content_block": start_block,
+                })
+                server.inject_latency()
+                for offset in range(0, len(text), chunk_size):
+                    if server.stream_chunk_delay:
+                        time.sleep(server.stream_chunk_delay)
+                    send_event("content_block_delta", {
+                        "type": "content_block_delta",
+                        "index": 0,
+                        "delta": delta(text[offset:offset + chunk_size]),
+                    })
+                send_event("content_block_stop", {"type": "content_block_stop", "index": 0})
+                send_event("message_delta", {
+                    "type": "message_delta",
+                    "delta": {"stop_reason": message["stop_reason"], "stop_sequence": None},
+                    "usage": {"output_tokens": message["usage"]["output_tokens"]},
+                })
+                send_event("message_stop", {"type": "message_stop"})
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+            def _read_json(self) -> Dict:
+                length = int(self.headers.get("content-length") or 0)
+                with server._lock:
+                    server.bytes_received += length
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def do_POST(self):
+                path = self.path.split("?")[0]
+                body = self._read_json()
+                if path == "/v1/messages":
+                    if server.record_requests:
+                        with server._lock:
+                            server.requests.append(body)
+                    message = server.build_message(body)
+                    status, error, headers = server.admit(message)
+                    if error is not None:
+                        self._send_json(status, error, headers)
+                    elif body.get("stream"):
+                        try:
+                            self._send_stream(message, headers)
+                        except (BrokenPipeError, ConnectionResetError):
+                            # Client closed the stream, e.g. a cancelled hedge
+                            self.close_connection = True
+                    else:
+                        server.inject_latency()
+                        self._send_json(200, message, headers)
+                elif path == "/v1/messages/batches":
+                    batch = {
+                        "id": server.next_id("msgbatch"),
+                        "created_at": time.time(),
+                        "requests": body.get("requests", []),
+                    }
+                    with server._lock:
+                        server.batches[batch["id"]] = batch
+                    self._send_json(200, server.batch_view(batch))
+                else:
+                    self._send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": path}})
+
+            def do_GET(self):
+                parts = self.path.split("?")[0].strip("/").split("/")
+                batch = None
+                if len(parts) >= 4 and parts[:3] == ["v1", "messages", "batches"]:
+                    batch = server.batches.get(parts[3])
+                if batch is None:
+                    self._send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+                elif len(parts) == 4:
+                    self._send_json(200, server.batch_view(batch))
+                elif len(parts) == 5 and parts[4] == "results":
+                    lines = [
+                        json.dumps({
+                            "custom_id": request["custom_id"],
+                            "result": {
+                                "type": "succeeded",
+                                "message": server.build_message(request["params"]),
+                            },
+                        })
+                        for request in batch["requests"]
+                    ]
+                    data = ("\n".join(lines) + "\n").encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("content-type", "application/binary")
+                    self.send_header("content-length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                else:
+                    self._send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+
+        return Handler
+
+
+def add_server_arguments(parser: argparse.ArgumentParser):
+    """
+    Command-line options for the simulated API behaviour
+    """
+    parser.add_argument("--batch-delay", type=float, default=5.0)
+    parser.add_argument("--stream-delay", type=float, default=0.02, help="seconds between streamed text chunks")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="fraction of tool calls answered with broken JSON")
+    parser.add_argument(
+        "--latency", help='time to first token, e.g. "0.3", "lognormal:0.3,0.5" or "tail:0.2,3.0,0.05"'
+    )
+    parser.add_argument("--rpm", type=int, help="requests per minute limit")
+    parser.add_argument("--input-tpm", type=int, help="input tokens per minute limit")
+    parser.add_argument("--output-tpm", type=int, help="output tokens per minute limit")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--overloaded-rate", type=float, default=0.0, help="fraction of requests answered with 529")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="retry-after seconds on injected errors")
+    parser.add_argument("--response-chars", type=int, default=0, help="characters of padding added to every answer")
+
+
+def server_from_args(args: argparse.Namespace, host: str = "127.0.0.1", port: int = 0, **options) -> MockAnthropicServer:
+    limits = {"requests": args.rpm, "input_tokens": args.input_tpm, "output_tokens": args.output_tpm}
+    return MockAnthropicServer(
+        host,
+        port,
+        batch_delay=args.batch_delay,
+        stream_chunk_delay=args.stream_delay,
+        malformed_rate=args.malformed_rate,
+        first_token_latency=latency_distribution(args.latency) if args.latency else None,
+        rate_limits={kind: limit for kind, limit in limits.items() if limit},
+        rate_limit_rate=args.rate_limit_rate,
+        overloaded_rate=args.overloaded_rate,
+        retry_after=args.retry_after,
+        response_chars=args.response_chars,
+        **options,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock of the Anthropic Messages API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = server_from_args(args, args.host, args.port)
+    print(f"Mock Anthropic API listening on {server.base_url}")
+    print(f"export ANTHROPIC_BASE_URL={server.base_url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import threading
+from typing import Dict, List, Optional
+
+from run_budget import USAGE_FIELDS, estimate_cost
+
+
+FAST_MODEL = "claude-3-5-haiku-20241022"
+STRONG_MODEL = "claude-sonnet-4-20250514"
+
+# Models tried in order for each task; tasks not listed use STRONG_MODEL only
+DEFAULT_ROUTES = {
+    "analysis": [FAST_MODEL, STRONG_MODEL],
+    "full_analysis": [FAST_MODEL, STRONG_MODEL],
+    "alt_text": [FAST_MODEL, STRONG_MODEL],
+    "ocr": [FAST_MODEL, STRONG_MODEL],
+}
+
+class ModelCascade:
+    """
+    Per-task model routing. Each task's models are tried in order, and a
+    result is escalated to the next model only when:
+
+    - it fails schema validation (no JSON, or required fields missing)
+    - its confidence_score is below min_confidence
+    - the output was cut off at max_tokens (e.g. truncated OCR)
+
+    The answer of the last model is always accepted. Which tier answered
+    each call is kept per thread (see pop_last_answer) and summed in
+    stats(), with the net cost and latency saved against answering with
+    the last model every time: what fast-tier answers saved, minus what
+    the escalated attempts spent for nothing.
+    """
+
+    def __init__(self, routes: Optional[Dict[str, List[str]]] = None, min_confidence: float = 0.7):
+        self.routes = {**DEFAULT_ROUTES, **(routes or {})}
+        self.min_confidence = min_confidence
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._answers: Dict[str, int] = {}
+        self._escalations: Dict[str, int] = {}
+        # model -> [calls, seconds, cost]
+        self._calls: Dict[str, List[float]] = {}
+        # (answering model, last model) -> answers that skipped the last model
+        self._early_answers: Dict[tuple, int] = {}
+        # Cost of those answers at the last model's prices, minus what was paid
+        self._cost_saved = 0.0
+        # Attempts whose answer was escalated: calls, tokens, cost, seconds
+        self._wasted = {"calls": 0, "tokens": 0, "cost": 0.0, "seconds": 0.0}
+
+    def models_for(self, task: str) -> List[str]:
+        return self.routes.get(task) or [STRONG_MODEL]
+
+    def escalation_reason(self, spec: Dict, message, result) -> Optional[str]:
+        """
+        Why a tier's answer should be escalated, or None to accept it
+        """
+        if getattr(message, "stop_reason", None) == "max_tokens":
+            return "truncated"
+        required = ((spec.get("tool") or {}).get("input_schema") or {}).get("required") or []
+        for block in message.content:
+            if block.type == "tool_use" and isinstance(block.input, dict):
+                if any(field not in block.input for field in required):
+                    return "invalid"
+        analysis = result.get("analysis", result) if isinstance(result, dict) else None
+        if isinstance(analysis, dict) and "confidence_score" in analysis:
+            if analysis["confidence_score"] < self.min_confidence:
+                return "low_confidence"
+        return None
+
+    def record_call(self, model: str, seconds: float, message=None) -> Dict:
+        """
+        Time, tokens and cost of one tier's attempt (message is None if
+        the request failed); returns the attempt for record_answer()
+        """
+        usage = getattr(message, "usage", None)
+        tokens = {field: getattr(usage, field, None) or 0 for field in USAGE_FIELDS}
+        cost = estimate_cost(model, **tokens)
+        if message is not None:
+            with self._lock:
+                calls = self._calls.setdefault(model, [0, 0.0, 0.0])
+                calls[0] += 1
+                calls[1] += seconds
+                calls[2] += cost
+        return {"model": model, "seconds": seconds, "tokens": tokens, "cost": cost}
+
+    def record_answer(self, task: str, model: str, tier: int, escalations: List[str], attempts: List[Dict]):
+        """
+        Which tier answered a call, and why earlier tiers were escalated;
+        attempts are the call's record_call() results, the answer last
+        """
+        last_model = self.models_for(task)[-1]
+        *escalated, answer = attempts
+        with self._lock:
+            self._answers[model] = self._answers.get(model, 0) + 1
+            for reason in escalations:
+                self._escalations[reason] = self._escalations.get(reason, 0) + 1
+            if model != last_model:
+                key = (model, last_model)
+                self._early_answers[key] = self._early_answers.get(key, 0) + 1
+                self._cost_saved += estimate_cost(last_model, **answer["tokens"]) - answer["cost"]
+            for attempt in escalated:
+                self._wasted["calls"] += 1
+                self._wasted["tokens"] += sum(attempt["tokens"].values())
+                self._wasted["cost"] += attempt["cost"]
+                self._wasted["seconds"] += attempt["seconds"]
+        self._local.answer = {"model": model, "tier": tier, "escalations": escalations}
+
+    def pop_last_answer(self) -> Optional[Dict]:
+        """
+        Model, tier and escalation reasons of the last call answered on
+        this thread; None if it was served from the cache
+        """
+        answer = getattr(self._local, "answer", None)
+        self._local.answer = None
+        return answer
+
+    def stats(self) -> Dict:
+        """
+        Answers by model, escalations by reason, calls, average seconds and
+        cost by model, the attempts spent on escalated answers, and the
+        net cost and seconds saved by the cascade (fast-tier savings
+        estimated from each model's average latency, less the escalated
+        attempts; negative when escalations cost more than they saved)
+        """
+        with self._lock:
+            answers = dict(self._answers)
+            escalations = dict(self._escalations)
+            calls = {model: list(values) for model, values in self._calls.items()}
+            early_answers = dict(self._early_answers)
+            cost_saved = self._cost_saved - self._wasted["cost"]
+            wasted = dict(self._wasted)
+        models = {
+            model: {
+                "calls": int(count),
+                "avg_seconds": seconds / count if count else 0.0,
+                "cost": round(cost, 4),
+            }
+            for model, (count, seconds, cost) in calls.items()
+        }
+        seconds_saved = 0.0
+        for (model, last_model), count in early_answers.items():
+            # Unknown until the last model has answered something
+            if last_model in models:
+                seconds_saved += count * (models[last_model]["avg_seconds"] - models[model]["avg_seconds"])
+        seconds_saved -= wasted["seconds"]
+        answered = sum(answers.values())
+        fast_answers = sum(early_answers.values())
+        return {
+            "answers": answers,
+            "escalations": escalations,
+            "escalation_rate": sum(escalations.values()) / answered if answered else 0.0,
+            "fast_answer_rate": fast_answers / answered if answered else 0.0,
+            "models": models,
+            "escalated_attempts": {
+                "calls": wasted["calls"],
+                "tokens": wasted["tokens"],
+                "cost": round(wasted["cost"], 4),
+                "seconds": round(wasted["seconds"], 3),
+            },
+            "cost_saved": round(cost_saved, 4),
+            "seconds_saved": round(seconds_saved, 3),
+        }
@@ -0,0 +1,244 @@
+import random
+import threading
+import time
+from typing import Callable, Dict, Mapping, Optional
+
+import anthropic
+
+
+# HTTP statuses that mean "slow down" rather than "this request is broken"
+THROTTLE_STATUSES = {429, 529}
+
+# Statuses worth retrying that say nothing about load; the SDK's own
+# retries are off when the scheduler is in charge, so it retries these too
+TRANSIENT_STATUSES = {408, 500, 502, 503}
+
+
+class TokenBucket:
+    """
+    Per-minute token bucket. Reservations may overdraw the bucket; the
+    caller then waits until the debt has been refilled.
+    """
+
+    def __init__(self, per_minute: Optional[float]):
+        self.capacity = per_minute
+        self.tokens = per_minute or 0.0
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return not self.capacity
+
+    def _refill(self, now: float):
+        if self.unlimited:
+            return
+        rate = self.capacity / 60.0
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """
+        Take amount tokens; returns how many seconds to wait before using them
+        """
+        if self.unlimited:
+            return 0.0
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / (self.capacity / 60.0)
+
+    def refund(self, amount: float):
+        if self.unlimited or amount <= 0:
+            return
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def sync(self, limit: Optional[float], remaining: Optional[float]):
+        """
+        Adopt the limit and remaining budget reported by the API
+        """
+        self._refill(time.monotonic())
+        if limit:
+            if self.unlimited:
+                self.tokens = limit
+            self.capacity = limit
+        if remaining is not None and not self.unlimited:
+            self.tokens = min(self.tokens, remaining)
+
+
+class AdaptiveScheduler:
+    """
+    Rate-limit-aware scheduler for concurrent API calls.
+
+    Token buckets for requests, input tokens and output tokens per minute
+    pace the calls, and are kept in step with the anthropic-ratelimit-*
+    response headers. Concurrency follows AIMD: one more slot after every
+    window of successes, halved on a 429/529. Throttled calls are retried
+    with jittered exponential backoff, honouring retry-after; timeouts,
+    5xx errors and connection errors are retried the same way but leave
+    concurrency alone.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        input_tokens_per_minute: Optional[float] = None,
+        output_tokens_per_minute: Optional[float] = None,
+        initial_concurrency: int = 4,
+        min_concurrency: int = 1,
+        max_concurrency: int = 64,
+        max_retries: int = 6,
+        base_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+    ):
+        self.buckets = {
+            "requests": TokenBucket(requests_per_minute),
+            "input_tokens": TokenBucket(input_tokens_per_minute),
+            "output_tokens": TokenBucket(output_tokens_per_minute),
+        }
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.concurrency = max(min_concurrency, min(initial_concurrency, max_concurrency))
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._successes = 0
+        self._last_decrease = 0.0
+        self._counters = {
+            "requests": 0, "successes": 0, "throttled": 0, "transient_errors": 0, "retries": 0, "failures": 0,
+        }
+
+    def call(self, fn: Callable, input_tokens: int = 0, output_tokens: int = 0):
+        """
+        Run fn under the rate limits, retrying throttled and transient failures.
+        input_tokens and output_tokens are up-front estimates; output is
+        reconciled against message.usage when fn returns a message.
+        """
+        for attempt in range(self.max_retries + 1):
+            self._acquire_slot()
+            try:
+                with self._condition:
+                    wait = max(
+                        self.buckets["requests"].reserve(1),
+                        self.buckets["input_tokens"].reserve(input_tokens),
+                        self.buckets["output_tokens"].reserve(output_tokens),
+                    )
+                    self._counters["requests"] += 1
+                if wait > 0:
+                    time.sleep(wait)
+                response = fn()
+            except Exception as e:
+                self._release_slot()
+                throttled = self._is_throttle(e)
+                retryable = throttled or self._is_transient(e)
+                # Even a final throttled attempt backs concurrency off
+                if throttled:
+                    self._on_throttle()
+                elif retryable:
+                    self._on_transient()
+                with self._condition:
+                    if not retryable or attempt == self.max_retries:
+                        self._counters["failures"] += 1
+                        raise
+                    self._counters["retries"] += 1
+                time.sleep(self._backoff(attempt, self._retry_after(e)))
+                continue
+
+            self._release_slot()
+            self._on_success(response, output_tokens)
+            return response
+
+    def observe_headers(self, headers: Mapping[str, str]):
+        """
+        Update the buckets from anthropic-ratelimit-* response headers
+        """
+        with self._condition:
+            for kind, bucket in self.buckets.items():
+                prefix = "anthropic-ratelimit-" + kind.replace("_", "-")
+                limit = _to_float(headers.get(f"{prefix}-limit"))
+                remaining = _to_float(headers.get(f"{prefix}-remaining"))
+                if limit is not None or remaining is not None:
+                    bucket.sync(limit, remaining)
+
+    def _acquire_slot(self):
+        with self._condition:
+            while self._in_flight >= self.concurrency:
+                self._condition.wait()
+            self._in_flight += 1
+
+    def _release_slot(self):
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify()
+
+    def _on_success(self, response, output_tokens: int):
+        usage = getattr(response, "usage", None)
+        with self._condition:
+            self._counters["successes"] += 1
+            if usage is not None:
+                self.buckets["output_tokens"].refund(output_tokens - usage.output_tokens)
+            # Additive increase: one more slot per window of clean successes
+            self._successes += 1
+            if self._successes >= self.concurrency and self.concurrency < self.max_concurrency:
+                self.concurrency += 1
+                self._successes = 0
+                self._condition.notify()
+
+    def _on_throttle(self):
+        with self._condition:
+            self._counters["throttled"] += 1
+            self._successes = 0
+            # Multiplicative decrease, at most once per second so a burst of
+            # rejections from the same window only halves once
+            now = time.monotonic()
+            if now - self._last_decrease >= 1.0:
+                self.concurrency = max(self.min_concurrency, self.concurrency // 2)
+                self._last_decrease = now
+
+    def _on_transient(self):
+        with self._condition:
+            self._counters["transient_errors"] += 1
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        delay = random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    @staticmethod
+    def _is_throttle(error: Exception) -> bool:
+        return isinstance(error, anthropic.APIStatusError) and error.status_code in THROTTLE_STATUSES
+
+    @staticmethod
+    def _is_transient(error: Exception) -> bool:
+        if isinstance(error, anthropic.APIConnectionError):
+            # Includes APITimeoutError
+            return True
+        return isinstance(error, anthropic.APIStatusError) and error.status_code in TRANSIENT_STATUSES
+
+    @staticmethod
+    def _retry_after(error: Exception) -> Optional[float]:
+        response = getattr(error, "response", None)
+        if response is None:
+            return None
+        return _to_float(response.headers.get("retry-after"))
+
+    def stats(self) -> Dict:
+        with self._condition:
+            stats = dict(self._counters)
+            stats["concurrency"] = self.concurrency
+            stats["in_flight"] = self._in_flight
+            for kind, bucket in self.buckets.items():
+                stats[f"{kind}_per_minute"] = bucket.capacity
+        return stats
+
+
+def _to_float(value) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
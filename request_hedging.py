@@ -0,0 +1,232 @@
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Iterator, Optional
+
+
+def output_text(event) -> str:
+    """
+    Text carried by a Messages API stream event: a text delta, or a piece
+    of tool input JSON. Empty for every other event.
+    """
+    if event.type == "text":
+        return event.text
+    if event.type == "input_json":
+        return event.partial_json
+    return ""
+
+
+class HedgingPolicy:
+    """
+    Hedged requests for interactive calls: if a streamed request has not
+    produced its first output within the adaptive threshold (the observed
+    percentile of time to first output), a duplicate is started and
+    whichever attempt produces output first is used; the other is
+    cancelled.
+
+    Hedges are capped by a budget: each request earns max_hedge_rate
+    credits (up to burst) and a hedge spends one, so at most that
+    fraction of requests is ever duplicated. Until min_samples first
+    output times are known, initial_delay is used (None: no hedging).
+    """
+
+    def __init__(
+        self,
+        percentile: float = 0.95,
+        min_samples: int = 20,
+        initial_delay: Optional[float] = None,
+        min_delay: float = 0.05,
+        max_hedge_rate: float = 0.05,
+        burst: float = 2.0,
+        window: int = 1000,
+    ):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_hedge_rate = max_hedge_rate
+        self.burst = burst
+        self._first_outputs = deque(maxlen=window)
+        self._credit = 1.0
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "hedges": 0, "hedge_wins": 0, "budget_denied": 0, "latency_saved": 0.0}
+
+    def delay(self) -> Optional[float]:
+        """
+        Seconds to wait for a first output before hedging, or None
+        """
+        with self._lock:
+            samples = sorted(self._first_outputs)
+        if len(samples) < self.min_samples:
+            return self.initial_delay
+        threshold = samples[min(len(samples) - 1, int(self.percentile * len(samples)))]
+        return max(self.min_delay, threshold)
+
+    def observe_first_output(self, seconds: float):
+        with self._lock:
+            self._first_outputs.append(seconds)
+
+    def _start_request(self):
+        with self._lock:
+            self._stats["requests"] += 1
+            self._credit = min(self.burst, self._credit + self.max_hedge_rate)
+
+    def _acquire_hedge(self) -> bool:
+        with self._lock:
+            if self._credit < 1.0:
+                self._stats["budget_denied"] += 1
+                return False
+            self._credit -= 1.0
+            self._stats["hedges"] += 1
+            return True
+
+    def _record_win(self):
+        with self._lock:
+            self._stats["hedge_wins"] += 1
+
+    def _record_saved(self, elapsed: float):
+        """
+        The beaten primary is closed at once, so its first output time is
+        estimated as the median of the observed first outputs slower than
+        the winner's
+        """
+        with self._lock:
+            slower = sorted(seconds for seconds in self._first_outputs if seconds > elapsed)
+            if slower:
+                self._stats["latency_saved"] += slower[len(slower) // 2] - elapsed
+
+    def stats(self) -> Dict:
+        """
+        Requests, hedges, hedge_rate, hedge_wins, hedges denied by the
+        budget, the current threshold and first-output seconds saved by
+        winning hedges (estimated from the first output time distribution)
+        """
+        threshold = self.delay()
+        with self._lock:
+            stats = dict(self._stats)
+        stats["hedge_rate"] = stats["hedges"] / stats["requests"] if stats["requests"] else 0.0
+        stats["win_rate"] = stats["hedge_wins"] / stats["hedges"] if stats["hedges"] else 0.0
+        stats["avg_latency_saved"] = stats["latency_saved"] / stats["hedge_wins"] if stats["hedge_wins"] else 0.0
+        stats["threshold"] = threshold
+        return stats
+
+    def stream(self, open_stream: Callable, on_open: Optional[Callable] = None) -> Iterator:
+        """
+        Yield the events of whichever attempt produces output first and
+        return its final message. open_stream() returns a Messages API
+        stream manager; on_open is called with each attempt's response
+        headers.
+        """
+        request = _HedgedRequest(self, open_stream)
+        self._start_request()
+        request.launch()
+        delay = self.delay()
+        winner = None
+        pending = []
+        while winner is None:
+            timeout = None
+            if delay is not None and len(request.attempts) == 1:
+                timeout = max(0.0, request.started + delay - time.perf_counter())
+            try:
+                index, kind, payload = request.events.get(timeout=timeout)
+            except queue.Empty:
+                if not self._acquire_hedge():
+                    delay = None
+                    continue
+                request.launch()
+                continue
+            if kind == "open":
+                if on_open is not None:
+                    on_open(payload)
+            elif kind == "error":
+                request.failed.add(index)
+                if len(request.failed) == len(request.attempts):
+                    raise payload
+            elif kind == "event" and output_text(payload) or kind == "done":
+                winner = index
+                request.decide(index)
+                pending.append((index, kind, payload))
+            else:
+                # Start-of-message events, held until a winner is known
+                pending.append((index, kind, payload))
+
+        for index, kind, payload in pending:
+            if index != winner:
+                continue
+            if kind == "done":
+                return payload
+            yield payload
+        while True:
+            index, kind, payload = request.events.get()
+            if index != winner:
+                continue
+            if kind == "event":
+                yield payload
+            elif kind == "done":
+                return payload
+            elif kind == "error":
+                raise payload
+
+
+class _HedgedRequest:
+    """
+    The attempts of one hedged request, each streamed on its own thread
+    into a shared queue of (attempt, kind, payload)
+    """
+
+    def __init__(self, policy: HedgingPolicy, open_stream: Callable):
+        self.policy = policy
+        self.open_stream = open_stream
+        self.events = queue.Queue()
+        self.attempts = []
+        self.failed = set()
+        self.started = time.perf_counter()
+        self.winner = None
+        self.winner_first_output = None
+        self.streams = {}
+        self._lock = threading.Lock()
+
+    def launch(self):
+        index = len(self.attempts)
+        thread = threading.Thread(target=self._attempt, args=(index, time.perf_counter()), daemon=True)
+        self.attempts.append(thread)
+        thread.start()
+
+    def decide(self, index: int):
+        with self._lock:
+            self.winner = index
+            self.winner_first_output = time.perf_counter() - self.started
+            losers = [stream for attempt, stream in self.streams.items() if attempt != index]
+        # Closing a stream cancels its request; its thread then ends with an
+        # error event, which is ignored
+        for stream in losers:
+            try:
+                stream.close()
+            except Exception:
+                pass
+        if index > 0:
+            self.policy._record_win()
+            self.policy._record_saved(self.winner_first_output)
+
+    def _attempt(self, index: int, launched: float):
+        first_output = None
+        try:
+            with self.open_stream() as stream:
+                with self._lock:
+                    if self.winner is not None and self.winner != index:
+                        # Beaten before it opened; leaving the block closes it
+                        return
+                    self.streams[index] = stream
+                self.events.put((index, "open", stream.response.headers))
+                for event in stream:
+                    if first_output is None and output_text(event):
+                        first_output = time.perf_counter()
+                        self.policy.observe_first_output(first_output - launched)
+                    with self._lock:
+                        if self.winner is not None and self.winner != index:
+                            return
+                    self.events.put((index, "event", event))
+                self.events.put((index, "done", stream.get_final_message()))
+        except Exception as e:
+            self.events.put((index, "error", e))
@@ -0,0 +1,300 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+
+class ResultCache:
+    """
+    Content-addressed cache for analyzer results.
+
+    An in-memory LRU sits in front of an on-disk SQLite store. Entries are
+    keyed on the SHA-256 of the image bytes plus the task, prompt, model and
+    request parameters, so an unchanged image never pays for a second call.
+
+    The on-disk size is tracked as a running total. Eviction runs when it
+    passes max_disk_bytes, trimming least recently used entries down to
+    evict_to (a fraction of the cap), and expired entries are swept every
+    evict_interval seconds rather than on every write. Memory hits refresh
+    the on-disk access time in batches, so hot entries are not evicted.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = ".vpa_cache/results.sqlite",
+        max_memory_items: int = 1024,
+        max_disk_bytes: int = 512 * 1024 * 1024,
+        ttl_seconds: Optional[float] = None,
+        evict_interval: float = 60.0,
+        evict_to: float = 0.9,
+    ):
+        self.path = path
+        self.max_memory_items = max_memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl_seconds = ttl_seconds
+        self.evict_interval = evict_interval
+        self.evict_to = evict_to
+
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        # Memory hits since the last flush: key -> access time, so disk LRU
+        # order sees them without a write per hit
+        self._touched: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "writes": 0,
+            "evictions": 0,
+        }
+
+        self._db = None
+        self._disk_bytes = 0
+        self._last_evicted = time.time()
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_results_accessed ON results (accessed_at)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_results_created ON results (created_at)"
+            )
+            self._disk_bytes = self._db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM results"
+            ).fetchone()[0]
+            self._db.commit()
+
+    @staticmethod
+    def hash_bytes(data: bytes) -> str:
+        """
+        SHA-256 hex digest of raw image bytes
+        """
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def hash_file(image_path: str, chunk_size: int = 1024 * 1024) -> str:
+        """
+        SHA-256 hex digest of a file, read in chunks
+        """
+        digest = hashlib.sha256()
+        with open(image_path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def make_key(
+        image_hashes: List[str], task: str, prompt: str, model: str, params: Dict = None
+    ) -> str:
+        """
+        Build a stable cache key from everything that affects the response
+        """
+        payload = json.dumps(
+            {
+                "images": list(image_hashes),
+                "task": task,
+                "prompt": prompt,
+                "model": model,
+                "params": params or {},
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Return the cached value for a key, or None on a miss
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, value = entry
+                if not self._expired(created_at, now):
+                    self._memory.move_to_end(key)
+                    if self._db is not None:
+                        self._touched[key] = now
+                        if len(self._touched) >= self.max_memory_items:
+                            self._flush_touched()
+                            self._db.commit()
+                    self._counters["hits"] += 1
+                    self._counters["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, created_at, size FROM results WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    if not self._expired(row[1], now):
+                        self._db.execute(
+                            "UPDATE results SET accessed_at = ? WHERE key = ?", (now, key)
+                        )
+                        self._db.commit()
+                        value = json.loads(row[0])
+                        self._remember(key, row[1], value)
+                        self._counters["hits"] += 1
+                        self._counters["disk_hits"] += 1
+                        return value
+                    self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                    self._db.commit()
+                    self._disk_bytes -= row[2]
+
+            self._counters["misses"] += 1
+            return None
+
+    def contains(self, key: str) -> bool:
+        """
+        Whether a key has an unexpired value, without counting a hit or miss
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and not self._expired(entry[0], now):
+                return True
+            if self._db is None:
+                return False
+            row = self._db.execute("SELECT created_at FROM results WHERE key = ?", (key,)).fetchone()
+            return row is not None and not self._expired(row[0], now)
+
+    def put(self, key: str, value: Any):
+        """
+        Store a JSON-serializable value under a key
+        """
+        now = time.time()
+        serialized = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._remember(key, now, value)
+            self._counters["writes"] += 1
+            if self._db is not None:
+                size = len(serialized.encode("utf-8"))
+                replaced = self._db.execute("SELECT size FROM results WHERE key = ?", (key,)).fetchone()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results (key, value, size, created_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, serialized, size, now, now),
+                )
+                self._disk_bytes += size - (replaced[0] if replaced else 0)
+                if self._disk_bytes > self.max_disk_bytes or (
+                    self.ttl_seconds is not None and now - self._last_evicted >= self.evict_interval
+                ):
+                    self._evict_disk(now)
+                self._db.commit()
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        """
+        Return the cached value, computing and storing it on a miss
+        """
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def _remember(self, key: str, created_at: float, value: Any):
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _flush_touched(self):
+        if self._touched:
+            self._db.executemany(
+                "UPDATE results SET accessed_at = MAX(accessed_at, ?) WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def _evict_disk(self, now: float):
+        self._last_evicted = now
+        self._flush_touched()
+        if self.ttl_seconds is not None:
+            cursor = self._db.execute(
+                "DELETE FROM results WHERE created_at < ?", (now - self.ttl_seconds,)
+            )
+            self._counters["evictions"] += max(cursor.rowcount, 0)
+
+        # Resync, since other processes may share the file
+        self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if self._disk_bytes <= self.max_disk_bytes:
+            return
+
+        # Drop least recently used rows until we are under the low-water mark,
+        # so the next writes do not evict again straight away
+        target = self.max_disk_bytes * self.evict_to
+        victims = []
+        for key, size in self._db.execute("SELECT key, size FROM results ORDER BY accessed_at ASC"):
+            if self._disk_bytes <= target:
+                break
+            victims.append((key,))
+            self._disk_bytes -= size
+        self._db.executemany("DELETE FROM results WHERE key = ?", victims)
+        for (key,) in victims:
+            self._memory.pop(key, None)
+        self._counters["evictions"] += len(victims)
+
+    def stats(self) -> Dict:
+        """
+        Hit/miss counters and current cache size
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats["memory_entries"] = len(self._memory)
+            if self._db is not None:
+                entries, size = self._db.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+                ).fetchone()
+                stats["disk_entries"] = entries
+                stats["disk_bytes"] = size
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        """
+        Remove every entry from memory and disk
+        """
+        with self._lock:
+            self._memory.clear()
+            self._touched.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM results")
+                self._db.commit()
+                self._disk_bytes = 0
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._flush_touched()
+                self._db.commit()
+                self._db.close()
+                self._db = None
+
+
+def default_cache_path() -> str:
+    """
+    Cache location, overridable through VPA_CACHE_PATH
+    """
+    return os.environ.get("VPA_CACHE_PATH", ".vpa_cache/results.sqlite")
@@ -0,0 +1,297 @@
+import argparse
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+# Indexed columns filled from each result, and the text columns searched
+# through the FTS5 index
+INDEXED_COLUMNS = ["category", "product_type", "condition", "confidence"]
+TEXT_COLUMNS = ["suggested_title", "suggested_description", "extracted_text", "alt_text"]
+
+COLUMNS = [
+    "image", "status", "product_type", "category", "condition", "confidence", "defect_count",
+    "suggested_title", "suggested_description", "alt_text", "extracted_text",
+    "answered_by", "duplicate_of", "error", "result", "updated_at",
+]
+
+
+class ResultStore:
+    """
+    SQLite store of batch results, one row per image.
+
+    Rows are written in batches, each batch in one transaction, to a WAL
+    database, so readers can query while a run is writing. Category,
+    product type, condition and confidence are indexed, and titles,
+    descriptions, OCR text and alt text have an FTS5 index (a LIKE scan
+    where SQLite is built without FTS5). The full result is kept as JSON,
+    so the CSV and JSON layouts of a run can be exported on demand.
+    """
+
+    def __init__(self, path: str = "results.sqlite", batch_size: int = 500):
+        self.path = path
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[Tuple, bool]] = []
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS results (
+                id INTEGER PRIMARY KEY,
+                image TEXT NOT NULL UNIQUE,
+                status TEXT NOT NULL,
+                product_type TEXT,
+                category TEXT,
+                condition TEXT,
+                confidence REAL,
+                defect_count INTEGER NOT NULL DEFAULT 0,
+                suggested_title TEXT,
+                suggested_description TEXT,
+                alt_text TEXT,
+                extracted_text TEXT,
+                answered_by TEXT,
+                duplicate_of TEXT,
+                error TEXT,
+                result TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )"""
+        )
+        for column in INDEXED_COLUMNS:
+            self._db.execute(f"CREATE INDEX IF NOT EXISTS idx_results_{column} ON results ({column} COLLATE NOCASE)")
+        self.full_text = self._create_fts()
+        self._db.commit()
+
+    def _create_fts(self) -> bool:
+        """
+        External-content FTS5 index kept in sync by triggers; False if
+        this SQLite has no FTS5
+        """
+        columns = ", ".join(TEXT_COLUMNS)
+        old = ", ".join(f"old.{column}" for column in TEXT_COLUMNS)
+        new = ", ".join(f"new.{column}" for column in TEXT_COLUMNS)
+        try:
+            self._db.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS results_fts USING fts5("
+                f"{columns}, content='results', content_rowid='id')"
+            )
+        except sqlite3.OperationalError:
+            return False
+        self._db.executescript(f"""
+            CREATE TRIGGER IF NOT EXISTS results_fts_insert AFTER INSERT ON results BEGIN
+                INSERT INTO results_fts (rowid, {columns}) VALUES (new.id, {new});
+            END;
+            CREATE TRIGGER IF NOT EXISTS results_fts_delete AFTER DELETE ON results BEGIN
+                INSERT INTO results_fts (results_fts, rowid, {columns}) VALUES ('delete', old.id, {old});
+            END;
+            CREATE TRIGGER IF NOT EXISTS results_fts_update AFTER UPDATE ON results BEGIN
+                INSERT INTO results_fts (results_fts, rowid, {columns}) VALUES ('delete', old.id, {old});
+                INSERT INTO results_fts (rowid, {columns}) VALUES (new.id, {new});
+            END;
+        """)
+        return True
+
+    @staticmethod
+    def _row(result: Dict) -> Tuple:
+        analysis = result.get("analysis") or {}
+        defects = analysis.get("defects") or []
+        return (
+            str(result["image"]),
+            result["status"],
+            analysis.get("product_type"),
+            analysis.get("category"),
+            analysis.get("condition"),
+            analysis.get("confidence_score"),
+            len(defects) if isinstance(defects, list) else int(bool(defects)),
+            analysis.get("suggested_title"),
+            analysis.get("suggested_description"),
+            result.get("alt_text"),
+            result.get("extracted_text"),
+            (result.get("answered_by") or {}).get("model"),
+            result.get("duplicate_of"),
+            result.get("error"),
+            json.dumps(result, ensure_ascii=False, default=str),
+            time.time(),
+        )
+
+    def add(self, result: Dict, replace: bool = True):
+        """
+        Queue a result (as yielded by iter_process_directory) for the next
+        batch. With replace=False an existing row for the image is kept.
+        """
+        with self._lock:
+            self._pending.append((self._row(result), replace))
+            if len(self._pending) >= self.batch_size:
+                self._flush()
+
+    def flush(self):
+        """
+        Write queued results in one transaction
+        """
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        names = ", ".join(COLUMNS)
+        placeholders = ", ".join("?" for _ in COLUMNS)
+        updates = ", ".join(f"{column} = excluded.{column}" for column in COLUMNS if column != "image")
+        upsert = f"INSERT INTO results ({names}) VALUES ({placeholders}) ON CONFLICT (image) DO UPDATE SET {updates}"
+        keep = f"INSERT OR IGNORE INTO results ({names}) VALUES ({placeholders})"
+        with self._db:
+            self._db.executemany(upsert, [row for row, replace in self._pending if replace])
+            self._db.executemany(keep, [row for row, replace in self._pending if not replace])
+        self._pending = []
+
+    def _where(
+        self,
+        text: Optional[str] = None,
+        status: Optional[str] = None,
+        category: Optional[str] = None,
+        product_type: Optional[str] = None,
+        condition: Optional[str] = None,
+        min_confidence: Optional[float] = None,
+        max_confidence: Optional[float] = None,
+        has_defects: Optional[bool] = None,
+        fts_query: Optional[str] = None,
+    ) -> Tuple[str, List]:
+        clauses, params = [], []
+        for column, value in (("status", status), ("category", category), ("product_type", product_type), ("condition", condition)):
+            if value is not None:
+                clauses.append(f"r.{column} = ? COLLATE NOCASE")
+                params.append(value)
+        if min_confidence is not None:
+            clauses.append("r.confidence >= ?")
+            params.append(min_confidence)
+        if max_confidence is not None:
+            clauses.append("r.confidence <= ?")
+            params.append(max_confidence)
+        if has_defects is not None:
+            clauses.append("r.defect_count > 0" if has_defects else "r.defect_count = 0")
+        if fts_query:
+            if not self.full_text:
+                raise ValueError("FTS5 query syntax needs SQLite built with FTS5; use text instead")
+            clauses.append("r.id IN (SELECT rowid FROM results_fts WHERE results_fts MATCH ?)")
+            params.append(fts_query)
+        if text:
+            if self.full_text:
+                # Plain text is one phrase, so "-", "'" and FTS5 keywords match literally
+                clauses.append("r.id IN (SELECT rowid FROM results_fts WHERE results_fts MATCH ?)")
+                params.append('"' + text.replace('"', '""') + '"')
+            else:
+                clauses.append("(" + " OR ".join(f"r.{column} LIKE ?" for column in TEXT_COLUMNS) + ")")
+                params.extend([f"%{text}%"] * len(TEXT_COLUMNS))
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(self, limit: Optional[int] = None, **filters) -> Iterator[Dict]:
+        """
+        Stored results matching every given filter, in image order:
+        text (a phrase searched in titles, descriptions, OCR and alt
+        text), fts_query (the same in FTS5 query syntax), status,
+        category, product_type, condition (case-insensitive),
+        min_confidence, max_confidence and has_defects.
+
+        Rows are read batch_size at a time on a separate connection, so
+        memory stays flat and writers are not blocked while the caller
+        iterates.
+        """
+        self.flush()
+        where, params = self._where(**filters)
+        sql = f"SELECT r.result FROM results r{where} ORDER BY r.image"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        reader = sqlite3.connect(self.path)
+        try:
+            cursor = reader.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(self.batch_size)
+                if not rows:
+                    return
+                for row in rows:
+                    yield json.loads(row[0])
+        finally:
+            reader.close()
+
+    def search(self, text: Optional[str] = None, limit: Optional[int] = 100, **filters) -> List[Dict]:
+        """
+        Full-text search for a phrase, e.g. search("gluten-free"); pass
+        fts_query for FTS5 syntax, e.g. fts_query="gluten OR soy"
+        """
+        return list(self.query(limit=limit, text=text, **filters))
+
+    def count(self, **filters) -> int:
+        self.flush()
+        where, params = self._where(**filters)
+        with self._lock:
+            return self._db.execute(f"SELECT COUNT(*) FROM results r{where}", params).fetchone()[0]
+
+    def stats(self) -> Dict:
+        """
+        Rows by status and by category
+        """
+        self.flush()
+        with self._lock:
+            statuses = dict(self._db.execute("SELECT status, COUNT(*) FROM results GROUP BY status").fetchall())
+            categories = dict(self._db.execute(
+                "SELECT category, COUNT(*) FROM results WHERE category IS NOT NULL GROUP BY category"
+            ).fetchall())
+        return {"results": sum(statuses.values()), "statuses": statuses, "categories": categories, "full_text": self.full_text}
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query or export a result store")
+    parser.add_argument("store", help="path to the SQLite result store")
+    parser.add_argument("--text", help="phrase to search for in titles, descriptions, OCR and alt text")
+    parser.add_argument("--fts", help="full-text query in FTS5 syntax, e.g. 'gluten OR soy'")
+    parser.add_argument("--status")
+    parser.add_argument("--category")
+    parser.add_argument("--product-type")
+    parser.add_argument("--condition")
+    parser.add_argument("--min-confidence", type=float)
+    parser.add_argument("--max-confidence", type=float)
+    parser.add_argument("--has-defects", action=argparse.BooleanOptionalAction)
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--export", metavar="DIR", help="write the matches as summary_report.csv, results.jsonl and JSON files")
+    args = parser.parse_args()
+
+    store = ResultStore(args.store)
+    filters = {
+        "text": args.text,
+        "status": args.status,
+        "category": args.category,
+        "product_type": args.product_type,
+        "condition": args.condition,
+        "min_confidence": args.min_confidence,
+        "max_confidence": args.max_confidence,
+        "has_defects": args.has_defects,
+        "fts_query": args.fts,
+    }
+    try:
+        if args.export:
+            from batch_image_processor import BatchImageProcessor
+
+            exported = BatchImageProcessor.export_results(store.query(limit=args.limit, **filters), args.export)
+            print(f"✅ Exported {exported} results to {args.export}")
+            return
+        for result in store.query(limit=args.limit, **filters):
+            analysis = result.get("analysis") or {}
+            print(f"{result['image']}\t{result['status']}\t{analysis.get('category', '')}\t{analysis.get('suggested_title', '')}")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import threading
+from typing import Dict, Optional
+
+
+# USD per million tokens, matched by model name prefix
+PRICING = {
+    "claude-opus-4": {"input": 15.0, "output": 75.0, "cache_write": 18.75, "cache_read": 1.50},
+    "claude-sonnet-4": {"input": 3.0, "output": 15.0, "cache_write": 3.75, "cache_read": 0.30},
+    "claude-3-7-sonnet": {"input": 3.0, "output": 15.0, "cache_write": 3.75, "cache_read": 0.30},
+    "claude-3-5-sonnet": {"input": 3.0, "output": 15.0, "cache_write": 3.75, "cache_read": 0.30},
+    "claude-3-5-haiku": {"input": 0.80, "output": 4.0, "cache_write": 1.0, "cache_read": 0.08},
+    "claude-3-haiku": {"input": 0.25, "output": 1.25, "cache_write": 0.30, "cache_read": 0.03},
+}
+DEFAULT_PRICING = PRICING["claude-sonnet-4"]
+
+# Token counts reported in message.usage, as taken by estimate_cost
+USAGE_FIELDS = ("input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens")
+
+# Typical output tokens per task, for projecting a run before it starts
+EXPECTED_OUTPUT_TOKENS = {
+    "analysis": 500,
+    "full_analysis": 900,
+    "ocr": 300,
+    "alt_text": 80,
+    "multilingual": 1200,
+    "comparison": 600,
+}
+
+# Lower-resolution profile a governed run switches to near its budget
+DOWNSCALE_PROFILE = {"max_edge": 768, "format": "WEBP", "quality": 80}
+
+
+def model_pricing(model: str) -> Dict[str, float]:
+    for prefix in sorted(PRICING, key=len, reverse=True):
+        if model.startswith(prefix):
+            return PRICING[prefix]
+    return DEFAULT_PRICING
+
+
+def estimate_cost(
+    model: str,
+    input_tokens: float = 0,
+    output_tokens: float = 0,
+    cache_creation_input_tokens: float = 0,
+    cache_read_input_tokens: float = 0,
+) -> float:
+    """
+    USD cost of a number of tokens at the model's list prices
+    """
+    prices = model_pricing(model)
+    return (
+        input_tokens * prices["input"]
+        + output_tokens * prices["output"]
+        + cache_creation_input_tokens * prices["cache_write"]
+        + cache_read_input_tokens * prices["cache_read"]
+    ) / 1e6
+
+
+def project_run(
+    model: str,
+    requests: int,
+    input_tokens: int,
+    output_tokens: int,
+    seconds_per_request: float,
+    concurrency: int,
+    rate_limits: Optional[Dict[str, Optional[float]]] = None,
+) -> Dict:
+    """
+    Projected cost and wall-clock time of a run. Time is the slower of
+    the concurrency bound and the per-minute rate limits (requests,
+    input_tokens, output_tokens) that are configured.
+    """
+    totals = {"requests": requests, "input_tokens": input_tokens, "output_tokens": output_tokens}
+    seconds = requests * seconds_per_request / max(1, concurrency)
+    for kind, per_minute in (rate_limits or {}).items():
+        if per_minute:
+            seconds = max(seconds, totals[kind] / per_minute * 60.0)
+    return {
+        **totals,
+        "cost": round(estimate_cost(model, input_tokens, output_tokens), 4),
+        "seconds": round(seconds, 1),
+    }
+
+
+def _tokens(usage: Dict) -> float:
+    return sum(usage.get(field, 0) for field in USAGE_FIELDS)
+
+
+class BudgetGovernor:
+    """
+    Per-run ceiling on tokens and/or dollars.
+
+    Each image is admitted against its projected usage before it is sent
+    and its actual usage is recorded when it finishes, so images in flight
+    count towards the ceiling. admit() refuses images that would cross a
+    ceiling: while other reservations are outstanding the image is only
+    deferred, since those may come in under their projection, and once
+    nothing is in flight the run is stopped. Once actual spend plus
+    in-flight reservations pass downscale_at (a fraction of the ceiling),
+    should_downscale() asks the caller, once, to switch to a
+    lower-resolution profile.
+    """
+
+    def __init__(
+        self,
+        max_tokens: Optional[float] = None,
+        max_cost: Optional[float] = None,
+        downscale_at: Optional[float] = None,
+        downscale_profile: Optional[Dict] = None,
+    ):
+        self.max_tokens = max_tokens
+        self.max_cost = max_cost
+        self.downscale_at = downscale_at
+        self.downscale_profile = downscale_profile or DOWNSCALE_PROFILE
+        self.downscaled = False
+        self.stopped = False
+        self._lock = threading.Lock()
+        self._spent = {"tokens": 0.0, "cost": 0.0}
+        self._reserved: Dict[str, Dict[str, float]] = {}
+
+    def _fraction_used(self, extra: Optional[Dict[str, float]] = None) -> float:
+        extra = extra or {"tokens": 0.0, "cost": 0.0}
+        fractions = []
+        for key, ceiling in (("tokens", self.max_tokens), ("cost", self.max_cost)):
+            if ceiling:
+                committed = self._spent[key] + sum(reserved[key] for reserved in self._reserved.values())
+                fractions.append((committed + extra[key]) / ceiling)
+        return max(fractions, default=0.0)
+
+    def admit(self, item: str, usage: Dict, model: str) -> bool:
+        """
+        Reserve the projected usage of an item (token counts named as in
+        message.usage), or refuse it if that would cross a ceiling. A
+        refused item may be admitted later unless stopped is set.
+        """
+        projected = {"tokens": _tokens(usage), "cost": estimate_cost(model, **usage)}
+        with self._lock:
+            if self.stopped:
+                return False
+            if self._fraction_used(projected) > 1.0:
+                # Defer while reservations may still be released under projection
+                self.stopped = not self._reserved
+                return False
+            self._reserved[item] = projected
+            return True
+
+    def record(self, item: str, usage: Dict, model: str):
+        """
+        Replace an item's reservation with its actual usage. A "cost" in
+        usage (the analyzer's call metrics price each call at its own
+        model's rates) is taken as is; otherwise the tokens are priced at
+        model's rates.
+        """
+        tokens = {field: usage.get(field, 0) for field in USAGE_FIELDS}
+        cost = usage["cost"] if "cost" in usage else estimate_cost(model, **tokens)
+        with self._lock:
+            self._reserved.pop(item, None)
+            self._spent["tokens"] += _tokens(tokens)
+            self._spent["cost"] += cost
+
+    def should_downscale(self) -> bool:
+        with self._lock:
+            if self.downscaled or self.downscale_at is None or not self._spent["tokens"]:
+                return False
+            if self._fraction_used() < self.downscale_at:
+                return False
+            self.downscaled = True
+            return True
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "tokens": int(self._spent["tokens"]),
+                "cost": round(self._spent["cost"], 4),
+                "max_tokens": self.max_tokens,
+                "max_cost": self.max_cost,
+                "fraction_used": round(self._fraction_used(), 4),
+                "downscaled": self.downscaled,
+                "stopped": self.stopped,
+            }
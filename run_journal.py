@@ -0,0 +1,116 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from result_cache import ResultCache
+
+
+class RunJournal:
+    """
+    Append-only JSONL journal of a batch run.
+
+    Each line records one attempt at one image: its content hash, status,
+    attempt count and output location. Replaying the journal gives the
+    latest state of every image, so a re-run can skip completed items,
+    retry failed ones and reprocess files whose content changed.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.latest: Dict[str, Dict] = {}
+        if self.path.exists():
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn final line from a crash mid-write
+                        continue
+                    self.latest[entry["image"]] = entry
+        self._file = open(self.path, "a")
+
+    def fingerprint(self, image_path: str) -> Dict:
+        """
+        Size, mtime and content hash of an image. The hash is reused from
+        the journal when size and mtime are unchanged.
+        """
+        stat = os.stat(image_path)
+        entry = self.latest.get(image_path)
+        if entry and entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns:
+            content_hash = entry["hash"]
+        else:
+            content_hash = ResultCache.hash_file(image_path)
+        return {"hash": content_hash, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def check(self, image_path: str, task: str) -> Tuple[bool, Dict]:
+        """
+        (needs_processing, fingerprint) for an image
+        """
+        fingerprint = self.fingerprint(image_path)
+        entry = self.latest.get(image_path)
+        done = (
+            entry is not None
+            and entry["status"] == "success"
+            and entry["hash"] == fingerprint["hash"]
+            and entry.get("task") == task
+            and entry.get("output") is not None
+            and Path(entry["output"]).exists()
+        )
+        return not done, fingerprint
+
+    def record(
+        self,
+        image_path: str,
+        fingerprint: Dict,
+        task: str,
+        status: str,
+        output: Optional[str] = None,
+        error: Optional[str] = None,
+        **extra,
+    ) -> Dict:
+        """
+        Append one attempt and flush it to disk. Extra keyword arguments
+        (e.g. a perceptual hash) are stored on the entry.
+        """
+        with self._lock:
+            previous = self.latest.get(image_path)
+            attempts = 1
+            if previous is not None and previous["hash"] == fingerprint["hash"]:
+                attempts = previous.get("attempts", 0) + 1
+            entry = {
+                "image": image_path,
+                **fingerprint,
+                "task": task,
+                "status": status,
+                "attempts": attempts,
+                "output": output,
+                "error": error,
+                **extra,
+                "time": time.time(),
+            }
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+            self.latest[image_path] = entry
+            return entry
+
+    def compact(self):
+        """
+        Rewrite the journal with only the latest entry per image
+        """
+        with self._lock:
+            self._file.close()
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "w") as f:
+                for entry in self.latest.values():
+                    f.write(json.dumps(entry) + "\n")
+            os.replace(tmp_path, self.path)
+            self._file = open(self.path, "a")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,199 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, Optional
+
+from batch_image_processor import BatchImageProcessor
+from image_scanner import scan_images
+from work_queue import WorkQueue
+
+
+def shard_dir(output_dir: str, shard: int) -> Path:
+    return Path(output_dir) / "shards" / f"{shard:04d}"
+
+
+def run_worker(
+    queue: WorkQueue,
+    output_dir: str,
+    shard: Optional[int] = None,
+    full_analysis: bool = False,
+    worker_id: Optional[str] = None,
+    processor: Optional[BatchImageProcessor] = None,
+    idle_poll: float = 5.0,
+) -> Dict:
+    """
+    Claim, process and acknowledge queued images until none are left.
+
+    A worker given a shard takes that shard's items first and then helps
+    with other shards, so the items of a crashed worker are picked up
+    once its leases expire. Leases are renewed by a heartbeat thread while
+    images are in flight. Each image's JSON output goes to
+    output_dir/shards/NNNN; results are kept in the queue for merge().
+    """
+    processor = processor if processor is not None else BatchImageProcessor()
+    worker = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    max_in_flight = processor.scheduler.max_concurrency * 2
+    counts = {"processed": 0, "failed": 0, "lost_leases": 0}
+    in_flight = {}
+    in_flight_lock = threading.Lock()
+    stop = threading.Event()
+
+    def heartbeat():
+        while not stop.wait(queue.lease_seconds / 3):
+            with in_flight_lock:
+                images = list(in_flight.values())
+            queue.heartbeat(worker, images)
+
+    def process(image_path: str, image_shard: int) -> Dict:
+        directory = shard_dir(output_dir, image_shard)
+        directory.mkdir(parents=True, exist_ok=True)
+        return processor.process_single_image(image_path, str(directory), full_analysis)
+
+    threading.Thread(target=heartbeat, name="lease-heartbeat", daemon=True).start()
+    executor = ThreadPoolExecutor(max_workers=processor.scheduler.max_concurrency)
+    try:
+        while True:
+            wanted = max_in_flight - len(in_flight)
+            claimed = queue.claim(worker, wanted, shard) if wanted else []
+            if wanted and not claimed and shard is not None:
+                claimed = queue.claim(worker, wanted)
+            for image_path, image_shard in claimed:
+                with in_flight_lock:
+                    in_flight[executor.submit(process, image_path, image_shard)] = image_path
+
+            if not in_flight:
+                if queue.outstanding() == 0:
+                    break
+                # Other workers hold the rest; wait in case their leases expire
+                time.sleep(idle_poll)
+                continue
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                with in_flight_lock:
+                    image_path = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"image": image_path, "status": "error", "error": str(e)}
+                if not queue.ack(worker, image_path, result):
+                    counts["lost_leases"] += 1
+                elif result["status"] == "success":
+                    counts["processed"] += 1
+                else:
+                    counts["failed"] += 1
+    finally:
+        stop.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+        queue.release(worker)
+    return counts
+
+
+def merge(queue: WorkQueue, output_dir: str) -> Dict:
+    """
+    Combine every shard's results into one summary_report.csv,
+    results.jsonl and set of per-image JSON files in output_dir
+    """
+    exported = BatchImageProcessor.export_results(queue.results(), output_dir)
+    stats = queue.stats()
+    with open(Path(output_dir) / "queue_stats.json", "w") as f:
+        json.dump(stats, f, indent=2)
+    return {"exported": exported, **stats}
+
+
+def run_local(
+    directory: str,
+    output_dir: str,
+    workers: int = 4,
+    full_analysis: bool = False,
+    lease_seconds: float = 300.0,
+    **scan_options,
+) -> Dict:
+    """
+    Enqueue a directory, process it with one worker process per shard on
+    this machine and merge the results. Re-running resumes: finished
+    images are not processed again.
+    """
+    queue_path = str(Path(output_dir) / "work_queue.sqlite")
+    queue = WorkQueue(queue_path, lease_seconds=lease_seconds)
+    counts = queue.enqueue(scan_images(directory, **scan_options), shards=workers)
+    print(f"📥 Queued {counts['added']} new, {counts['changed']} changed and {counts['retried']} failed images")
+
+    command = [sys.executable, os.path.abspath(__file__), "work", queue_path, output_dir, "--lease-seconds", str(lease_seconds)]
+    if full_analysis:
+        command.append("--full-analysis")
+    processes = [subprocess.Popen(command + ["--shard", str(shard)]) for shard in range(workers)]
+    for process in processes:
+        process.wait()
+
+    summary = merge(queue, output_dir)
+    queue.close()
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded batch processing through a SQLite work queue")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = commands.add_parser("enqueue", help="add a directory's images to the queue")
+    enqueue.add_argument("queue", help="path to the work queue database")
+    enqueue.add_argument("directory")
+    enqueue.add_argument("--shards", type=int, required=True)
+
+    work = commands.add_parser("work", help="process queued images until none are left")
+    work.add_argument("queue")
+    work.add_argument("output")
+    work.add_argument("--shard", type=int, help="shard to work on first")
+    work.add_argument("--full-analysis", action="store_true")
+    work.add_argument("--lease-seconds", type=float, default=300.0)
+    work.add_argument("--worker-id")
+
+    merge_command = commands.add_parser("merge", help="combine shard results into one summary report")
+    merge_command.add_argument("queue")
+    merge_command.add_argument("output")
+
+    status = commands.add_parser("status", help="show queue progress")
+    status.add_argument("queue")
+
+    local = commands.add_parser("run", help="enqueue, process with local worker processes and merge")
+    local.add_argument("directory")
+    local.add_argument("output")
+    local.add_argument("--workers", type=int, default=4)
+    local.add_argument("--full-analysis", action="store_true")
+    local.add_argument("--lease-seconds", type=float, default=300.0)
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        summary = run_local(args.directory, args.output, args.workers, args.full_analysis, args.lease_seconds)
+        print(f"✅ Merged {summary['exported']} results into {args.output} ({summary['done']} done, {summary['failed']} failed)")
+        return
+
+    queue = WorkQueue(args.queue, lease_seconds=getattr(args, "lease_seconds", 300.0))
+    try:
+        if args.command == "enqueue":
+            counts = queue.enqueue(scan_images(args.directory), shards=args.shards)
+            print(f"📥 Queued {counts['added']} new, {counts['changed']} changed and {counts['retried']} failed images")
+        elif args.command == "work":
+            counts = run_worker(queue, args.output, args.shard, args.full_analysis, args.worker_id)
+            print(f"✅ Worker finished: {counts['processed']} processed, {counts['failed']} failed, {counts['lost_leases']} leases lost")
+        elif args.command == "merge":
+            summary = merge(queue, args.output)
+            print(f"✅ Merged {summary['exported']} results into {args.output}")
+            if summary["pending"] or summary["leased"]:
+                print(f"⚠️  {summary['pending']} pending and {summary['leased']} leased images are not merged yet")
+        else:
+            print(json.dumps(queue.stats(), indent=2))
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()
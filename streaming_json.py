@@ -0,0 +1,127 @@
+import json
+from typing import Any, List, Optional
+
+
+class IncrementalJSONParser:
+    """
+    Best-effort parser for a JSON document that arrives in chunks.
+
+    feed() returns the most complete value parseable so far: containers
+    that are still open are closed, a trailing partial string value is
+    kept as a prefix, and anything else incomplete (a half-written key,
+    number or literal) is dropped. Text before the first brace or bracket,
+    such as a ```json fence, is skipped. Only new characters are scanned
+    on each call.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.value: Any = None
+        self.done = False
+        self._started = False
+        self._scanned = 0
+        self._stack: List[str] = []
+        # Per open object: True while the next string is a key
+        self._expect_key: List[bool] = []
+        self._in_string = False
+        self._string_is_value = False
+        self._string_start = 0
+        self._escape = False
+        # Longest prefix of text that is complete up to closing brackets
+        self._safe_end = 0
+        self._safe_stack: List[str] = []
+
+    def feed(self, chunk: str) -> Any:
+        self.text += chunk
+        if not self.done:
+            self._scan()
+            self.value = self._snapshot()
+        return self.value
+
+    def _mark_safe(self, end: int):
+        self._safe_end = end
+        self._safe_stack = list(self._stack)
+
+    def _value_expected(self) -> bool:
+        if not self._stack:
+            return True
+        return self._stack[-1] == "[" or not self._expect_key[-1]
+
+    def _scan(self):
+        text = self.text
+        i = self._scanned
+        while i < len(text) and not self.done:
+            ch = text[i]
+            if not self._started:
+                if ch in "{[":
+                    self.text = text = text[i:]
+                    i = 0
+                    self._started = True
+                else:
+                    i += 1
+                    continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._string_is_value:
+                        self._mark_safe(i + 1)
+            elif ch == '"':
+                self._in_string = True
+                self._string_is_value = self._value_expected()
+                self._string_start = i
+            elif ch in "{[":
+                self._stack.append(ch)
+                if ch == "{":
+                    self._expect_key.append(True)
+                self._mark_safe(i + 1)
+            elif ch in "}]":
+                if self._stack and self._stack.pop() == "{":
+                    self._expect_key.pop()
+                self._mark_safe(i + 1)
+                if not self._stack:
+                    self.done = True
+            elif ch == ":":
+                # Outside an object (e.g. stray prose) a colon means nothing
+                if self._stack and self._stack[-1] == "{":
+                    self._expect_key[-1] = False
+            elif ch == ",":
+                # Whatever preceded the comma is a complete value
+                self._mark_safe(i)
+                if self._stack and self._stack[-1] == "{":
+                    self._expect_key[-1] = True
+            i += 1
+        self._scanned = i
+
+    @staticmethod
+    def _closers(stack: List[str]) -> str:
+        return "".join("}" if opener == "{" else "]" for opener in reversed(stack))
+
+    def _snapshot(self) -> Any:
+        if not self._started:
+            return None
+        candidates = []
+        if self._in_string and self._string_is_value:
+            # Keep the partial string, minus any half-written escape sequence
+            partial = self.text[:self._scanned]
+            backslash = partial.rfind("\\", self._string_start + 1)
+            if backslash != -1 and len(partial) - backslash < 6:
+                partial = partial[:backslash]
+            candidates.append(partial + '"' + self._closers(self._stack))
+        candidates.append(self.text[:self._safe_end] + self._closers(self._safe_stack))
+        for candidate in candidates:
+            try:
+                return json.loads(candidate)
+            except json.JSONDecodeError:
+                continue
+        return self.value
+
+
+def parse_partial_json(text: str) -> Optional[Any]:
+    """
+    Most complete value parseable from a possibly truncated JSON document
+    """
+    return IncrementalJSONParser().feed(text)
@@ -0,0 +1,245 @@
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple, TypedDict
+
+from streaming_json import IncrementalJSONParser
+
+
+class StructuredOutputError(ValueError):
+    """
+    A response from which no structured result could be recovered.
+    Carries the raw text so it can be repaired without re-sending the image.
+    """
+
+    def __init__(self, message: str, text: str):
+        super().__init__(message)
+        self.text = text
+
+
+class ProductAnalysis(TypedDict):
+    product_type: str
+    category: str
+    features: List[str]
+    colors: List[str]
+    materials: List[str]
+    condition: str
+    defects: List[str]
+    suggested_title: str
+    suggested_description: str
+    key_selling_points: List[str]
+    target_audience: str
+    comparable_products: List[str]
+    confidence_score: float
+
+
+class ProductListing(TypedDict):
+    title: str
+    description: str
+    features: List[str]
+
+
+class FullAnalysis(TypedDict):
+    analysis: ProductAnalysis
+    alt_text: str
+    extracted_text: str
+
+
+STRING_LIST = {"type": "array", "items": {"type": "string"}}
+
+ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "product_type": {"type": "string"},
+        "category": {"type": "string"},
+        "features": STRING_LIST,
+        "colors": STRING_LIST,
+        "materials": STRING_LIST,
+        "condition": {"type": "string"},
+        "defects": STRING_LIST,
+        "suggested_title": {"type": "string"},
+        "suggested_description": {"type": "string"},
+        "key_selling_points": STRING_LIST,
+        "target_audience": {"type": "string"},
+        "comparable_products": STRING_LIST,
+        "confidence_score": {"type": "number", "minimum": 0, "maximum": 1},
+    },
+    "required": list(ProductAnalysis.__annotations__),
+}
+
+LISTING_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "description": {"type": "string"},
+        "features": STRING_LIST,
+    },
+    "required": ["title", "description", "features"],
+}
+
+FULL_ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "analysis": ANALYSIS_SCHEMA,
+        "alt_text": {"type": "string"},
+        "extracted_text": {"type": "string"},
+    },
+    "required": ["analysis", "alt_text", "extracted_text"],
+}
+
+# Keyed by language code, e.g. {"en": {...}, "es": {...}}
+MULTILINGUAL_SCHEMA = {
+    "type": "object",
+    "additionalProperties": LISTING_SCHEMA,
+}
+
+
+_OPENER = re.compile(r"[\[{]")
+
+# Bracket positions _decode_embedded tries before giving up; each failed
+# attempt can scan to the end of the text, so this bounds the work on
+# bracket-heavy prose at MAX_JSON_STARTS passes over it
+MAX_JSON_STARTS = 64
+
+
+def tool(name: str, description: str, schema: Dict) -> Dict:
+    return {"name": name, "description": description, "input_schema": schema}
+
+
+ANALYSIS_TOOL = tool("record_product_analysis", "Record the structured product analysis.", ANALYSIS_SCHEMA)
+FULL_ANALYSIS_TOOL = tool(
+    "record_full_analysis", "Record the product analysis, alt text and extracted text.", FULL_ANALYSIS_SCHEMA
+)
+MULTILINGUAL_TOOL = tool(
+    "record_multilingual_listings", "Record one product listing per language code.", MULTILINGUAL_SCHEMA
+)
+LISTING_TOOL = tool("record_product_listing", "Record the product listing.", LISTING_SCHEMA)
+
+
+def _decode_embedded(text: str) -> Tuple[bool, Any]:
+    """
+    (found, value) for the JSON embedded in text. Objects are preferred
+    over arrays, so a bracket in the prose before the JSON (e.g. "see [1]")
+    is skipped; an array is only taken when it holds objects or nothing
+    better follows. At most MAX_JSON_STARTS positions are tried.
+    """
+    decoder = json.JSONDecoder()
+    found, fallback = False, None
+    position = 0
+    for _ in range(MAX_JSON_STARTS):
+        match = _OPENER.search(text, position)
+        if match is None:
+            break
+        try:
+            value, end = decoder.raw_decode(text, match.start())
+        except (json.JSONDecodeError, RecursionError):
+            # RecursionError: nested too deeply to decode
+            position = match.start() + 1
+            continue
+        if isinstance(value, dict) or any(isinstance(item, dict) for item in value):
+            return True, value
+        if not found:
+            found, fallback = True, value
+        position = end
+    return found, fallback
+
+
+def repair_json(text: str) -> Optional[Any]:
+    """
+    Recover a JSON value from model text: code fences (with or without a
+    language tag), prose around the JSON, trailing commas, Python-style
+    literals and truncated output are all tolerated. None if nothing
+    usable is found.
+    """
+    fenced = re.search(r"```(?:[a-zA-Z]*)\n?(.*?)(?:```|$)", text, re.DOTALL)
+    if fenced and _OPENER.search(fenced.group(1)):
+        text = fenced.group(1)
+    cleaned = re.sub(r",\s*([}\]])", r"\1", text)
+    cleaned = re.sub(r"\bTrue\b", "true", re.sub(r"\bFalse\b", "false", re.sub(r"\bNone\b", "null", cleaned)))
+    for candidate in (text, cleaned):
+        found, value = _decode_embedded(candidate)
+        if found:
+            return value
+    # Truncated output: close whatever is still open, from the first object if any
+    start = cleaned.find("{")
+    if start == -1:
+        start = cleaned.find("[")
+    if start == -1:
+        return None
+    try:
+        value = IncrementalJSONParser().feed(cleaned[start:])
+    except (ValueError, RecursionError):
+        # Decode errors only (json.JSONDecodeError is a ValueError); anything
+        # else is a bug worth seeing
+        return None
+    return value if value else None
+
+
+def _text(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return "\n".join(_text(item) for item in value)
+    return value if isinstance(value, str) else str(value)
+
+
+def _text_list(value: Any) -> List[str]:
+    if value is None or value == "":
+        return []
+    if isinstance(value, list):
+        return [_text(item) for item in value if item not in (None, "")]
+    return [_text(value)]
+
+
+def _score(value: Any) -> float:
+    try:
+        return min(1.0, max(0.0, float(value)))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _require_object(data: Any, what: str) -> Dict:
+    if not isinstance(data, dict):
+        raise StructuredOutputError(f"Expected a JSON object for {what}", json.dumps(data) if data is not None else "")
+    # Tolerate keys like "Suggested Title"
+    return {str(key).strip().lower().replace(" ", "_"): value for key, value in data.items()}
+
+
+def validate_analysis(data: Any) -> ProductAnalysis:
+    """
+    Coerce a decoded analysis into ProductAnalysis: missing fields get
+    empty defaults, scalars become lists where lists are expected and the
+    confidence score is clamped to [0, 1]
+    """
+    data = _require_object(data, "product analysis")
+    result = {}
+    for field, field_type in ProductAnalysis.__annotations__.items():
+        if field_type is float:
+            result[field] = _score(data.get(field))
+        elif field_type == List[str]:
+            result[field] = _text_list(data.get(field))
+        else:
+            result[field] = _text(data.get(field))
+    return ProductAnalysis(**result)
+
+
+def validate_listing(data: Any) -> ProductListing:
+    data = _require_object(data, "product listing")
+    return ProductListing(
+        title=_text(data.get("title")),
+        description=_text(data.get("description")),
+        features=_text_list(data.get("features", data.get("key_features"))),
+    )
+
+
+def validate_multilingual(data: Any) -> Dict[str, ProductListing]:
+    data = _require_object(data, "multilingual listings")
+    return {code: validate_listing(listing) for code, listing in data.items() if isinstance(listing, dict)}
+
+
+def validate_full_analysis(data: Any) -> FullAnalysis:
+    data = _require_object(data, "full analysis")
+    return FullAnalysis(
+        analysis=validate_analysis(data.get("analysis") or {}),
+        alt_text=_text(data.get("alt_text")),
+        extracted_text=_text(data.get("extracted_text")),
+    )
@@ -0,0 +1,46 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture(scope="session")
+def mock_server():
+    """
+    Stub Messages API for the whole session; shared clients are built
+    from the environment, so every test talks to the same server
+    """
+    from mock_anthropic_server import MockAnthropicServer
+
+    saved = {name: os.environ.get(name) for name in ("ANTHROPIC_BASE_URL", "ANTHROPIC_API_KEY")}
+    with MockAnthropicServer() as server:
+        os.environ["ANTHROPIC_BASE_URL"] = server.base_url
+        os.environ["ANTHROPIC_API_KEY"] = "test-key"
+        yield server
+    for name, value in saved.items():
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
+
+
+@pytest.fixture
+def make_image():
+    """
+    Write a small JPEG with a colour/pattern seed and return its path
+    """
+    from PIL import Image, ImageDraw
+
+    def make(path: Path, seed: int = 0, size=(320, 240)) -> str:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        image = Image.new("RGB", size, ((seed * 67) % 256, (seed * 131) % 256, (seed * 29) % 256))
+        draw = ImageDraw.Draw(image)
+        for i in range(seed % 7 + 1):
+            draw.rectangle([i * 30, i * 20, i * 30 + 40, i * 20 + 60], fill=(255 - i * 30, i * 40, 90))
+        image.save(path, "JPEG", quality=90)
+        return str(path)
+
+    return make
@@ -0,0 +1,34 @@
+import asyncio
+
+from async_visual_product_analyzer import AsyncVisualProductAnalyzer
+from http_client import get_async_client
+from result_cache import ResultCache
+
+
+def test_async_client_is_shared_within_a_loop():
+    async def clients():
+        return get_async_client(), get_async_client(), get_async_client(max_connections=8)
+
+    first, same, other = asyncio.run(clients())
+    assert first is same
+    assert other is not first
+
+    # A new loop gets its own client
+    again, _, _ = asyncio.run(clients())
+    assert again is not first
+
+
+def test_async_client_outside_a_loop_is_not_shared():
+    assert get_async_client() is not get_async_client()
+
+
+def test_async_analyzer_works_across_event_loops(tmp_path, make_image, mock_server):
+    image = make_image(tmp_path / "a.jpg")
+    other = make_image(tmp_path / "b.jpg", seed=1)
+    analyzer = AsyncVisualProductAnalyzer(cache=ResultCache(path=None))
+    requests = len(mock_server.requests)
+
+    for path in (image, other):
+        result = asyncio.run(analyzer.analyze_product_image(path))
+        assert result["product_type"]
+    assert len(mock_server.requests) == requests + 2
@@ -0,0 +1,36 @@
+import json
+import os
+import shutil
+
+from batch_image_processor import BatchImageProcessor
+from image_dedupe import ImageDeduplicator
+from result_cache import ResultCache
+
+
+def test_same_named_duplicates_keep_separate_files(tmp_path, make_image, mock_server):
+    images = tmp_path / "images"
+    first = make_image(images / "shoes" / "001.jpg", seed=4)
+    (images / "bags").mkdir()
+    second = str(images / "bags" / "001.jpg")
+    shutil.copyfile(first, second)
+    output_dir = tmp_path / "out"
+
+    processor = BatchImageProcessor(
+        cache=ResultCache(path=None), deduplicator=ImageDeduplicator(threshold=6, wait_seconds=30)
+    )
+    requests = len(mock_server.requests)
+    results = processor.process_directory(str(images), str(output_dir))
+    assert len(mock_server.requests) == requests + 1
+
+    by_image = {result["image"]: result for result in results}
+    assert {result["status"] for result in results} == {"success"}
+    duplicate = next(result for result in results if result.get("duplicate_of"))
+    canonical = duplicate["duplicate_of"]
+    assert {duplicate["image"], canonical} == {first, second}
+
+    outputs = [BatchImageProcessor.output_file(image, str(output_dir)) for image in (first, second)]
+    assert outputs[0] != outputs[1]
+    assert all(os.path.exists(output) for output in outputs)
+    for image, output in zip((first, second), outputs):
+        with open(output) as f:
+            assert json.load(f) == by_image[image]["analysis"]
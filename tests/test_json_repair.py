@@ -0,0 +1,94 @@
+import pytest
+
+from streaming_json import IncrementalJSONParser, parse_partial_json
+import structured_output
+from structured_output import MAX_JSON_STARTS, repair_json
+
+
+def test_complete_object():
+    assert repair_json('{"a": 1, "b": [1, 2]}') == {"a": 1, "b": [1, 2]}
+
+
+def test_fenced_object():
+    assert repair_json('Here you go:\n```json\n{"a": 1}\n```\nThanks') == {"a": 1}
+
+
+def test_prose_wrapped_object():
+    assert repair_json('Sure! The analysis is {"a": 1, "b": "x"} as requested.') == {"a": 1, "b": "x"}
+
+
+def test_trailing_commas_and_python_literals():
+    assert repair_json('{"a": [1, 2,], "b": True, "c": None,}') == {"a": [1, 2], "b": True, "c": None}
+
+
+def test_truncated_object():
+    assert repair_json('{"title": "Mug", "tags": ["ceramic", "blu') == {"title": "Mug", "tags": ["ceramic", "blu"]}
+
+
+def test_truncated_object_after_prose():
+    # A trailing number may still be cut short, so it is left out
+    assert repair_json('Result: {"title": "Mug", "confidence_score": 0.9') == {"title": "Mug"}
+    assert repair_json('Result: {"confidence_score": 0.9, "title": "Mu') == {"confidence_score": 0.9, "title": "Mu"}
+
+
+def test_bracket_in_prose_before_object():
+    assert repair_json('see [1] then {"a": 2}') == {"a": 2}
+
+
+def test_array_of_objects():
+    assert repair_json('[{"a": 1}, {"b": 2}]') == [{"a": 1}, {"b": 2}]
+
+
+def test_plain_array_when_no_object():
+    assert repair_json("values: [1, 2, 3]") == [1, 2, 3]
+
+
+@pytest.mark.parametrize(
+    "text",
+    ["Sure [see note: here]", "a, b: c] }", "no json at all", "", "[: ,]", "{"],
+)
+def test_prose_without_json(text):
+    assert repair_json(text) is None
+
+
+@pytest.mark.parametrize("text", ["Sure [see note: here]", "] , : }", ":::,,,"])
+def test_parser_ignores_stray_punctuation(text):
+    IncrementalJSONParser().feed(text)
+    parse_partial_json(text)
+
+
+def test_parser_streams_chunks():
+    parser = IncrementalJSONParser()
+    for chunk in ['{"title": "Mu', 'g", "tags": ["a",', ' "b"]}']:
+        value = parser.feed(chunk)
+    assert parser.done
+    assert value == {"title": "Mug", "tags": ["a", "b"]}
+
+
+def test_bracket_heavy_prose_tries_a_bounded_number_of_starts(monkeypatch):
+    attempts = []
+
+    class CountingDecoder(structured_output.json.JSONDecoder):
+        def raw_decode(self, s, idx=0):
+            attempts.append(idx)
+            return super().raw_decode(s, idx)
+
+    monkeypatch.setattr(structured_output.json, "JSONDecoder", CountingDecoder)
+    text = "see [x] " * 1000 + '{"a": 1}'
+    # Falls through to the truncated-output parser, from the first object
+    assert repair_json(text) == {"a": 1}
+    # The raw and the cleaned-up text are tried, MAX_JSON_STARTS starts each
+    assert len(attempts) == 2 * MAX_JSON_STARTS
+
+
+def test_deeply_nested_text_is_not_json():
+    assert repair_json("[" * 20_000) is None
+
+
+def test_unexpected_parser_errors_are_not_swallowed(monkeypatch):
+    def broken(self, chunk):
+        raise TypeError("bug")
+
+    monkeypatch.setattr(IncrementalJSONParser, "feed", broken)
+    with pytest.raises(TypeError):
+        repair_json('{"title": "Mug", "tags": ["cer')
@@ -0,0 +1,40 @@
+import json
+
+from batch_image_processor import BatchImageProcessor
+from message_batches import MessageBatchRunner
+from result_cache import ResultCache
+
+
+def test_same_named_images_get_their_own_batch_results(tmp_path, make_image, mock_server):
+    first = make_image(tmp_path / "images" / "shoes" / "001.jpg", seed=1)
+    second = make_image(tmp_path / "images" / "bags" / "001.jpg", seed=2)
+    output_dir = tmp_path / "out"
+    state_path = output_dir / "batch_state.json"
+
+    processor = BatchImageProcessor(cache=ResultCache(path=None))
+    runner = MessageBatchRunner(processor.analyzer, str(state_path), poll_interval=0.05)
+    results = runner.run([first, second], str(output_dir))
+
+    assert [result["status"] for result in results] == ["success", "success"]
+    state = json.loads(state_path.read_text())
+    assert set(state["outputs"]) == {first, second}
+    assert state["outputs"][first] != state["outputs"][second]
+    for result in results:
+        with open(state["outputs"][result["image"]]) as f:
+            assert result["analysis"] == json.load(f)
+
+    # Rows come from the recorded files, not from re-derived names
+    with open(state["outputs"][second], "w") as f:
+        json.dump({"suggested_title": "bag"}, f)
+    resumed = MessageBatchRunner(processor.analyzer, str(state_path)).results([first, second], str(output_dir))
+    assert resumed[0]["analysis"] != resumed[1]["analysis"]
+    assert resumed[1]["analysis"] == {"suggested_title": "bag"}
+
+
+def test_image_without_a_recorded_result_is_reported(tmp_path, make_image, mock_server):
+    image = make_image(tmp_path / "a.jpg")
+    processor = BatchImageProcessor(cache=ResultCache(path=None))
+    runner = MessageBatchRunner(processor.analyzer, str(tmp_path / "state.json"))
+    assert runner.results([image], str(tmp_path)) == [
+        {"image": image, "status": "error", "error": "No batch result"}
+    ]
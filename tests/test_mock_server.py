@@ -0,0 +1,38 @@
+from mock_anthropic_server import build_message
+
+
+def request(model: str, system_chars: int):
+    return {
+        "model": model,
+        "max_tokens": 64,
+        "system": [{"type": "text", "text": "x" * system_chars, "cache_control": {"type": "ephemeral"}}],
+        "messages": [{"role": "user", "content": "Describe this product."}],
+    }
+
+
+def usage(body, prompt_cache):
+    return build_message(body, "msg_1", prompt_cache)["usage"]
+
+
+def test_prefix_under_the_minimum_is_not_cached():
+    prompt_cache = set()
+    for _ in range(2):
+        tokens = usage(request("claude-sonnet-4-20250514", 2000), prompt_cache)
+        assert tokens["cache_creation_input_tokens"] == 0
+        assert tokens["cache_read_input_tokens"] == 0
+    assert not prompt_cache
+
+
+def test_prefix_over_the_minimum_is_written_then_read():
+    prompt_cache = set()
+    first = usage(request("claude-sonnet-4-20250514", 5000), prompt_cache)
+    second = usage(request("claude-sonnet-4-20250514", 5000), prompt_cache)
+    assert first["cache_creation_input_tokens"] >= 1024
+    assert second["cache_read_input_tokens"] == first["cache_creation_input_tokens"]
+    assert second["input_tokens"] < first["cache_creation_input_tokens"]
+
+
+def test_haiku_needs_a_longer_prefix():
+    prompt_cache = set()
+    assert usage(request("claude-3-5-haiku-20241022", 5000), prompt_cache)["cache_creation_input_tokens"] == 0
+    assert usage(request("claude-3-5-haiku-20241022", 9000), prompt_cache)["cache_creation_input_tokens"] >= 2048
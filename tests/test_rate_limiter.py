@@ -0,0 +1,110 @@
+import socket
+import time
+
+import anthropic
+import pytest
+
+from mock_anthropic_server import MockAnthropicServer
+from rate_limiter import AdaptiveScheduler
+
+
+def client_for(base_url: str) -> anthropic.Anthropic:
+    # The scheduler does the retrying
+    return anthropic.Anthropic(base_url=base_url, api_key="test-key", max_retries=0)
+
+
+def ask(client: anthropic.Anthropic):
+    return client.messages.create(
+        model="claude-sonnet-4-20250514",
+        max_tokens=64,
+        messages=[{"role": "user", "content": "Describe this product."}],
+    )
+
+
+def test_concurrency_grows_by_one_per_window_of_successes(mock_server):
+    client = client_for(mock_server.base_url)
+    scheduler = AdaptiveScheduler(initial_concurrency=2, max_concurrency=4)
+    for expected in (2, 3):
+        for _ in range(expected):
+            assert scheduler.concurrency == expected
+            scheduler.call(lambda: ask(client), output_tokens=64)
+    assert scheduler.concurrency == 4
+
+    # Capped at max_concurrency
+    for _ in range(8):
+        scheduler.call(lambda: ask(client))
+    assert scheduler.stats()["concurrency"] == 4
+    assert scheduler.stats()["successes"] == 13
+
+
+def test_429_halves_concurrency_once_per_burst():
+    with MockAnthropicServer(rate_limits={"requests": 1}) as server:
+        client = client_for(server.base_url)
+        scheduler = AdaptiveScheduler(initial_concurrency=16, max_retries=0)
+        scheduler.call(lambda: ask(client))
+        for _ in range(3):
+            with pytest.raises(anthropic.RateLimitError):
+                scheduler.call(lambda: ask(client))
+
+    stats = scheduler.stats()
+    assert stats["throttled"] == 3
+    assert stats["failures"] == 3
+    # Rejections within the same second only halve once
+    assert stats["concurrency"] == 8
+    assert stats["in_flight"] == 0
+
+
+def test_retry_after_is_honoured():
+    with MockAnthropicServer(overloaded_rate=1.0, retry_after=0.4) as server:
+        client = client_for(server.base_url)
+        scheduler = AdaptiveScheduler(initial_concurrency=4, max_retries=1, base_backoff=0.0)
+        started = time.monotonic()
+        with pytest.raises(anthropic.APIStatusError) as raised:
+            scheduler.call(lambda: ask(client))
+        elapsed = time.monotonic() - started
+
+    assert raised.value.status_code == 529
+    assert elapsed >= 0.4
+    stats = scheduler.stats()
+    assert stats["requests"] == 2
+    assert stats["retries"] == 1
+    assert stats["concurrency"] == 2
+
+
+def test_transient_errors_are_retried_without_backing_off_concurrency(mock_server):
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        closed_port = probe.getsockname()[1]
+    unreachable = client_for(f"http://127.0.0.1:{closed_port}")
+    client = client_for(mock_server.base_url)
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        return ask(unreachable if len(calls) == 1 else client)
+
+    scheduler = AdaptiveScheduler(initial_concurrency=4, base_backoff=0.01)
+    message = scheduler.call(flaky)
+    assert message.content[0].text
+    stats = scheduler.stats()
+    assert stats["transient_errors"] == 1
+    assert stats["throttled"] == 0
+    assert stats["concurrency"] == 4
+
+
+def test_buckets_follow_rate_limit_headers():
+    with MockAnthropicServer(rate_limits={"requests": 50, "input_tokens": 40_000}) as server:
+        client = client_for(server.base_url)
+        scheduler = AdaptiveScheduler()
+        raw = client.messages.with_raw_response.create(
+            model="claude-sonnet-4-20250514",
+            max_tokens=64,
+            messages=[{"role": "user", "content": "Describe this product."}],
+        )
+        scheduler.observe_headers(raw.headers)
+
+    stats = scheduler.stats()
+    assert stats["requests_per_minute"] == 50
+    assert stats["input_tokens_per_minute"] == 40_000
+    assert stats["output_tokens_per_minute"] is None
+    assert scheduler.buckets["requests"].tokens <= 49
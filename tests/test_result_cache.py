@@ -0,0 +1,107 @@
+import json
+
+import pytest
+
+from result_cache import ResultCache
+
+
+class Clock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr("result_cache.time.time", clock)
+    return clock
+
+
+def entry_size(value) -> int:
+    return len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+
+def test_entries_expire_after_ttl(tmp_path, clock):
+    cache = ResultCache(path=str(tmp_path / "cache.sqlite"), ttl_seconds=60)
+    cache.put("a", {"title": "mug"})
+    clock.now += 59
+    assert cache.get("a") == {"title": "mug"}
+
+    clock.now += 2
+    assert not cache.contains("a")
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert stats["disk_entries"] == 0
+    assert cache._disk_bytes == 0
+
+    # A fresh cache on the same file does not resurrect it either
+    cache.close()
+    assert ResultCache(path=str(tmp_path / "cache.sqlite"), ttl_seconds=60).get("a") is None
+
+
+def test_expired_entries_are_swept_every_evict_interval(tmp_path, clock):
+    cache = ResultCache(path=str(tmp_path / "cache.sqlite"), ttl_seconds=10, evict_interval=30)
+    cache.put("old", {"n": 1})
+    clock.now += 20
+    cache.put("young", {"n": 2})
+    assert cache.stats()["disk_entries"] == 2
+
+    # The next write after evict_interval sweeps, without anyone reading "old"
+    clock.now += 11
+    cache.put("new", {"n": 3})
+    stats = cache.stats()
+    assert stats["disk_entries"] == 1
+    assert stats["evictions"] == 2
+    assert cache._disk_bytes == entry_size({"n": 3})
+
+
+def test_size_eviction_trims_lru_entries_to_low_water_mark(tmp_path, clock):
+    value = {"payload": "x" * 80}
+    size = entry_size(value)
+    cache = ResultCache(path=str(tmp_path / "cache.sqlite"), max_disk_bytes=size * 10, evict_to=0.5)
+    for i in range(10):
+        cache.put(f"k{i}", value)
+        clock.now += 1
+    # Touch the oldest entry, so it is the most recently used
+    assert cache.get("k0") == value
+    clock.now += 1
+    assert cache.stats()["evictions"] == 0
+
+    cache.put("k10", value)
+    stats = cache.stats()
+    assert stats["disk_bytes"] <= size * 5
+    assert stats["disk_bytes"] == cache._disk_bytes
+    assert stats["evictions"] == 11 - stats["disk_entries"]
+    assert cache.contains("k0")
+    assert cache.contains("k10")
+    assert not cache.contains("k1")
+
+
+def test_running_total_tracks_replacements(tmp_path, clock):
+    cache = ResultCache(path=str(tmp_path / "cache.sqlite"))
+    cache.put("a", {"v": "short"})
+    cache.put("a", {"v": "a much longer value"})
+    cache.put("b", {"v": 1})
+    assert cache._disk_bytes == entry_size({"v": "a much longer value"}) + entry_size({"v": 1})
+    assert cache._disk_bytes == cache.stats()["disk_bytes"]
+
+    cache.clear()
+    assert cache._disk_bytes == 0
+
+
+def test_memory_lru_is_bounded(clock):
+    cache = ResultCache(path=None, max_memory_items=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    stats = cache.stats()
+    assert stats["memory_entries"] == 2
+    assert stats["hits"] == 3
+    assert stats["misses"] == 1
@@ -0,0 +1,84 @@
+import pytest
+
+from batch_image_processor import BatchImageProcessor
+from model_cascade import FAST_MODEL, STRONG_MODEL, ModelCascade
+from result_cache import ResultCache
+from run_budget import BudgetGovernor, estimate_cost, model_pricing
+
+PROJECTED = {"input_tokens": 1000, "output_tokens": 500}
+
+
+def test_admits_until_the_projection_crosses_the_ceiling():
+    budget = BudgetGovernor(max_tokens=3500)
+    assert budget.admit("a", PROJECTED, STRONG_MODEL)
+    assert budget.admit("b", PROJECTED, STRONG_MODEL)
+    assert budget.stats()["fraction_used"] == round(3000 / 3500, 4)
+
+    # Over the ceiling while others are in flight: deferred, not stopped
+    assert not budget.admit("c", PROJECTED, STRONG_MODEL)
+    assert not budget.stopped
+
+    # "a" came in under its projection, which makes room for "c"
+    budget.record("a", {"input_tokens": 400, "output_tokens": 100}, STRONG_MODEL)
+    assert budget.admit("c", PROJECTED, STRONG_MODEL)
+
+
+def test_stops_once_nothing_in_flight_can_make_room():
+    budget = BudgetGovernor(max_tokens=2000)
+    assert budget.admit("a", PROJECTED, STRONG_MODEL)
+    budget.record("a", {"input_tokens": 1200, "output_tokens": 300}, STRONG_MODEL)
+
+    assert not budget.admit("b", PROJECTED, STRONG_MODEL)
+    assert budget.stopped
+    # A stopped run admits nothing, however small
+    assert not budget.admit("c", {"input_tokens": 1}, STRONG_MODEL)
+    assert budget.stats()["tokens"] == 1500
+
+
+def test_cost_ceiling_and_downscale_once():
+    cost = estimate_cost(STRONG_MODEL, **PROJECTED)
+    budget = BudgetGovernor(max_cost=cost * 4, downscale_at=0.5)
+    assert not budget.should_downscale()
+    for item in "ab":
+        assert budget.admit(item, PROJECTED, STRONG_MODEL)
+        budget.record(item, PROJECTED, STRONG_MODEL)
+    assert budget.should_downscale()
+    assert not budget.should_downscale()
+    assert budget.stats()["cost"] == round(cost * 2, 4)
+
+
+def test_cache_reads_are_charged_at_the_cache_read_rate():
+    prices = model_pricing(STRONG_MODEL)
+    budget = BudgetGovernor(max_cost=1.0)
+    budget.record(
+        "a",
+        {"input_tokens": 100, "cache_read_input_tokens": 10_000, "cache_creation_input_tokens": 1000},
+        STRONG_MODEL,
+    )
+    expected = (100 * prices["input"] + 10_000 * prices["cache_read"] + 1000 * prices["cache_write"]) / 1e6
+    assert budget.stats()["cost"] == pytest.approx(expected, abs=1e-4)
+    assert expected < 11_100 * prices["input"] / 1e6
+
+
+def test_usage_with_its_own_cost_is_not_repriced():
+    budget = BudgetGovernor(max_cost=1.0)
+    budget.record("a", {"input_tokens": 1000, "output_tokens": 100, "cost": 0.0012}, STRONG_MODEL)
+    assert budget.stats()["cost"] == 0.0012
+    assert budget.stats()["tokens"] == 1100
+
+
+def test_escalated_attempts_are_priced_at_their_own_model(tmp_path, make_image, mock_server):
+    images = tmp_path / "images"
+    make_image(images / "a.jpg", seed=5)
+    # The stub answers with confidence 0.91, so every fast-tier answer escalates
+    cascade = ModelCascade(min_confidence=0.95)
+    budget = BudgetGovernor(max_cost=10.0)
+    processor = BatchImageProcessor(cache=ResultCache(path=None), budget=budget, cascade=cascade)
+    [result] = processor.process_directory(str(images), str(tmp_path / "out"))
+
+    assert result["answered_by"]["model"] == STRONG_MODEL
+    models = cascade.stats()["models"]
+    assert set(models) == {FAST_MODEL, STRONG_MODEL}
+    paid = sum(model["cost"] for model in models.values())
+    assert budget.stats()["cost"] == pytest.approx(paid, abs=2e-4)
+    assert result["metrics"]["cost"] == pytest.approx(paid, abs=2e-4)
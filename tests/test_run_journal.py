@@ -0,0 +1,93 @@
+import json
+import os
+
+from batch_image_processor import BatchImageProcessor
+from result_cache import ResultCache
+from run_journal import RunJournal
+
+
+def test_completed_image_is_skipped_after_reopen(tmp_path, make_image):
+    image = make_image(tmp_path / "a.jpg")
+    output = tmp_path / "a.json"
+    output.write_text("{}")
+    journal = RunJournal(tmp_path / "journal.jsonl")
+    needs_processing, fingerprint = journal.check(image, "analysis")
+    assert needs_processing
+    journal.record(image, fingerprint, "analysis", "success", output=str(output))
+    journal.close()
+
+    journal = RunJournal(tmp_path / "journal.jsonl")
+    assert journal.check(image, "analysis")[0] is False
+    # Another task, or a missing output file, needs the work done again
+    assert journal.check(image, "full_analysis")[0] is True
+    output.unlink()
+    assert journal.check(image, "analysis")[0] is True
+
+
+def test_failed_and_changed_images_are_processed_again(tmp_path, make_image):
+    failed = make_image(tmp_path / "failed.jpg", seed=1)
+    changed = make_image(tmp_path / "changed.jpg", seed=2)
+    output = tmp_path / "changed.json"
+    output.write_text("{}")
+    journal = RunJournal(tmp_path / "journal.jsonl")
+    journal.record(failed, journal.fingerprint(failed), "analysis", "error", error="boom")
+    journal.record(changed, journal.fingerprint(changed), "analysis", "success", output=str(output))
+    journal.close()
+
+    make_image(tmp_path / "changed.jpg", seed=3)
+    journal = RunJournal(tmp_path / "journal.jsonl")
+    assert journal.check(failed, "analysis")[0] is True
+    assert journal.check(changed, "analysis")[0] is True
+
+
+def test_torn_final_line_is_ignored(tmp_path, make_image):
+    image = make_image(tmp_path / "a.jpg")
+    journal = RunJournal(tmp_path / "journal.jsonl")
+    journal.record(image, journal.fingerprint(image), "analysis", "error", error="boom")
+    journal.close()
+    with open(tmp_path / "journal.jsonl", "a") as f:
+        f.write('{"image": "b.jpg", "sta')
+
+    journal = RunJournal(tmp_path / "journal.jsonl")
+    assert list(journal.latest) == [image]
+
+
+def test_same_named_images_keep_separate_outputs(tmp_path, make_image, mock_server):
+    images = tmp_path / "images"
+    first = make_image(images / "shoes" / "001.jpg", seed=1)
+    second = make_image(images / "bags" / "001.jpg", seed=2)
+    output_dir = tmp_path / "out"
+
+    processor = BatchImageProcessor(cache=ResultCache(path=None))
+    results = processor.process_directory(str(images), str(output_dir))
+    assert sorted(result["status"] for result in results) == ["success", "success"]
+
+    journal = RunJournal(output_dir / "journal.jsonl")
+    outputs = {journal.latest[image]["output"] for image in (first, second)}
+    journal.close()
+    assert len(outputs) == 2
+    assert all(os.path.exists(output) for output in outputs)
+
+    # A re-run resumes from the journal, reading each image's own output
+    requests = len(mock_server.requests)
+    resumed = BatchImageProcessor(cache=ResultCache(path=None)).process_directory(str(images), str(output_dir))
+    assert len(mock_server.requests) == requests
+    assert {result["image"] for result in resumed} == {first, second}
+    for result in resumed:
+        with open(BatchImageProcessor.output_file(result["image"], str(output_dir))) as f:
+            assert result["analysis"] == json.load(f)
+
+
+def test_stem_only_outputs_from_older_runs_are_redone(tmp_path, make_image, mock_server):
+    images = tmp_path / "images"
+    image = make_image(images / "001.jpg")
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    legacy = output_dir / "001.json"
+    legacy.write_text(json.dumps({"suggested_title": "another image"}))
+    journal = RunJournal(output_dir / "journal.jsonl")
+    journal.record(image, journal.fingerprint(image), "analysis", "success", output=str(legacy))
+    journal.close()
+
+    results = BatchImageProcessor(cache=ResultCache(path=None)).process_directory(str(images), str(output_dir))
+    assert results[0]["analysis"]["suggested_title"] != "another image"
@@ -0,0 +1,84 @@
+import time
+
+from work_queue import WorkQueue
+
+
+def make_queue(tmp_path, make_image, count=1, **options):
+    images = [make_image(tmp_path / f"{i:03d}.jpg", seed=i) for i in range(count)]
+    queue = WorkQueue(str(tmp_path / "queue.db"), **options)
+    queue.enqueue(images, shards=2)
+    return queue, images
+
+
+def test_claimed_item_is_acked_once(tmp_path, make_image):
+    queue, images = make_queue(tmp_path, make_image, count=2)
+    claimed = queue.claim("w1", limit=5)
+    assert sorted(image for image, _ in claimed) == images
+    assert queue.claim("w2", limit=5) == []
+
+    assert queue.ack("w1", images[0], {"image": images[0], "status": "success"})
+    assert not queue.ack("w2", images[1], {"image": images[1], "status": "success"})
+    assert queue.stats()["done"] == 1
+    assert queue.outstanding() == 1
+    queue.close()
+
+
+def test_expired_lease_is_claimed_again(tmp_path, make_image):
+    queue, [image] = make_queue(tmp_path, make_image, lease_seconds=0.05)
+    assert [item for item, _ in queue.claim("w1")] == [image]
+    time.sleep(0.1)
+
+    assert [item for item, _ in queue.claim("w2")] == [image]
+    # The first worker lost its lease, so its late result is dropped
+    assert not queue.ack("w1", image, {"image": image, "status": "success"})
+    assert queue.heartbeat("w1", [image]) == 0
+    assert queue.ack("w2", image, {"image": image, "status": "success"})
+    assert list(queue.results()) == [{"image": image, "status": "success"}]
+    queue.close()
+
+
+def test_heartbeat_keeps_the_lease(tmp_path, make_image):
+    queue, [image] = make_queue(tmp_path, make_image, lease_seconds=0.2)
+    queue.claim("w1")
+    for _ in range(3):
+        time.sleep(0.1)
+        assert queue.heartbeat("w1", [image]) == 1
+    assert queue.claim("w2") == []
+    queue.close()
+
+
+def test_item_fails_after_max_attempts_of_expired_leases(tmp_path, make_image):
+    queue, [image] = make_queue(tmp_path, make_image, lease_seconds=0.05, max_attempts=2)
+    for worker in ("w1", "w2"):
+        assert [item for item, _ in queue.claim(worker)] == [image]
+        time.sleep(0.1)
+
+    assert queue.claim("w3") == []
+    stats = queue.stats()
+    assert stats["failed"] == 1
+    assert stats["leased"] == 0
+    assert queue.outstanding() == 0
+    assert list(queue.results()) == [
+        {"image": image, "status": "error", "error": "Lease expired too many times"}
+    ]
+    queue.close()
+
+
+def test_failed_ack_is_retried_until_max_attempts(tmp_path, make_image):
+    queue, [image] = make_queue(tmp_path, make_image, max_attempts=2)
+    queue.claim("w1")
+    queue.ack("w1", image, {"image": image, "status": "error", "error": "boom"})
+    assert queue.stats()["pending"] == 1
+    queue.claim("w1")
+    queue.ack("w1", image, {"image": image, "status": "error", "error": "boom"})
+    assert queue.stats()["failed"] == 1
+    assert queue.claim("w1") == []
+    queue.close()
+
+
+def test_results_are_streamed_in_image_order(tmp_path, make_image):
+    queue, images = make_queue(tmp_path, make_image, count=5)
+    for image, _ in queue.claim("w1", limit=5):
+        queue.ack("w1", image, {"image": image, "status": "success"})
+    assert [row["image"] for row in queue.results(fetch_size=2)] == sorted(images)
+    queue.close()
@@ -1,57 +1,44 @@
 import anthropic
-import base64
+import argparse
+import functools
 import os
+import threading
+import time
 from dotenv import load_dotenv
 from pathlib import Path
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import json
-from typing import Dict, List
+from typing import Callable, Dict, Iterator, List, Optional, Union
+from result_cache import ResultCache, default_cache_path
+from image_preprocessor import ImagePreprocessor, estimate_image_tokens
+from image_asset import ImageAsset
+from rate_limiter import AdaptiveScheduler
+from http_client import get_client
+from metrics import REGISTRY, MetricsRegistry
+from model_cascade import ModelCascade
+from run_budget import USAGE_FIELDS, estimate_cost
+from request_hedging import HedgingPolicy, output_text
+from streaming_json import IncrementalJSONParser
+from structured_output import (
+    ANALYSIS_TOOL,
+    FULL_ANALYSIS_TOOL,
+    LISTING_TOOL,
+    MULTILINGUAL_TOOL,
+    ProductListing,
+    StructuredOutputError,
+    repair_json,
+    validate_analysis,
+    validate_full_analysis,
+    validate_listing,
+    validate_multilingual,
+)
 load_dotenv()
-class VisualProductAnalyzer:
-    def __init__(self):
-        self.client = anthropic.Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
-        self.model = "claude-sonnet-4-20250514"
-    
-    def encode_image(self, image_path: str) -> tuple:
-        """
-        Encode image to base64 and detect media type
-        """
-        with open(image_path, "rb") as image_file:
-            image_data = base64.standard_b64encode(image_file.read()).decode("utf-8")
-        
-        # Detect media type
-        suffix = Path(image_path).suffix.lower()
-        media_types = {
-            '.jpg': 'image/jpeg',
-            '.jpeg': 'image/jpeg',
-            '.png': 'image/png',
-            '.gif': 'image/gif',
-            '.webp': 'image/webp'
-        }
-        media_type = media_types.get(suffix, 'image/jpeg')
-        
-        return image_data, media_type
-    
-    def analyze_product_image(self, image_path: str, product_category: str = None) -> Dict:
-        """
-        Analyze a product image and extract structured information
-        """
-        image_data, media_type = self.encode_image(image_path)
-        
-        prompt = f"""Analyze this product image and provide detailed information in JSON format.
-Product Category: {product_category or "Unknown"}
-Extract:
-1. Product Type and Category
-2. Key Features (visible attributes)
-3. Colors (all visible colors)
-4. Materials (if identifiable)
-5. Condition Assessment (new/used, any defects)
-6. Suggested Title (engaging product title)
-7. Suggested Description (2-3 sentences)
-8. Key Selling Points (3-5 bullet points)
-9. Target Audience
-10. Comparable Products
-Format as valid JSON with these fields:
-{{
+
+# Every analyzer method accepts a path or an ImageAsset
+ImageInput = Union[str, ImageAsset]
+
+ANALYSIS_JSON_FIELDS = """{
   "product_type": "",
   "category": "",
   "features": [],
@@ -65,102 +52,393 @@ Format as valid JSON with these fields:
   "target_audience": "",
   "comparable_products": [],
   "confidence_score": 0.0
+}"""
+
+# Static instructions are sent as a cacheable system prefix ahead of the
+# images; only the short per-call details go in the user turn
+ANALYSIS_SYSTEM_PROMPT = f"""Analyze the product image and provide detailed information in JSON format.
+Use the product category given with the image as a hint when it is known.
+Extract:
+1. Product Type and Category
+2. Key Features (visible attributes)
+3. Colors (all visible colors)
+4. Materials (if identifiable)
+5. Condition Assessment (new/used, any defects)
+6. Suggested Title (engaging product title)
+7. Suggested Description (2-3 sentences)
+8. Key Selling Points (3-5 bullet points)
+9. Target Audience
+10. Comparable Products
+Format as valid JSON with these fields:
+{ANALYSIS_JSON_FIELDS}"""
+
+FULL_ANALYSIS_SYSTEM_PROMPT = f"""Analyze the product image and complete three tasks in one JSON response.
+The product category and alt text context are given with the image.
+
+Task "analysis": extract
+1. Product Type and Category
+2. Key Features (visible attributes)
+3. Colors (all visible colors)
+4. Materials (if identifiable)
+5. Condition Assessment (new/used, any defects)
+6. Suggested Title (engaging product title)
+7. Suggested Description (2-3 sentences)
+8. Key Selling Points (3-5 bullet points)
+9. Target Audience
+10. Comparable Products
+
+Task "alt_text": accessibility alt text, concise (50-125 characters), descriptive of
+key visual elements, useful for screen readers and SEO-friendly. Provide 3 options
+as plain text: 1. Short (for quick scanning) 2. Medium (balanced) 3. Long (detailed)
+
+Task "extracted_text": ALL text visible in the image (product names, brand names,
+instructions, warnings, specifications, any other text) as plain text, maintaining
+structure with newlines. Use an empty string if there is no text.
+
+Format as valid JSON with these fields:
+{{
+  "analysis": {ANALYSIS_JSON_FIELDS},
+  "alt_text": "",
+  "extracted_text": ""
 }}"""
-        message = self.client.messages.create(
-            model=self.model,
-            max_tokens=2000,
-            messages=[
+
+MULTILINGUAL_SYSTEM_PROMPT = """Analyze the product image and provide information in each language requested with the image.
+For EACH language, provide:
+1. Product Title (optimized for that market)
+2. Product Description (2-3 sentences, culturally appropriate)
+3. Key Features (3-5 bullet points)
+Format as JSON keyed by language code:
+{
+  "en": {
+    "title": "",
+    "description": "",
+    "features": []
+  },
+  "es": {...},
+  "fr": {...}
+}
+Ensure cultural appropriateness and natural phrasing for each language."""
+
+LANGUAGE_SYSTEM_PROMPT = """Write a product listing in the language given with the request, for the product in the
+image or, when no image is attached, the product described by the given analysis.
+Provide:
+1. Product Title (optimized for that market)
+2. Product Description (2-3 sentences, culturally appropriate)
+3. Key Features (3-5 bullet points)
+Format as JSON:
+{
+  "title": "",
+  "description": "",
+  "features": []
+}
+Ensure cultural appropriateness and natural phrasing for the language."""
+
+# How JSON results were obtained: from a tool call, by repairing text, via a
+# text-only repair request, or not at all
+PARSE_FIELDS = ("structured_results", "repaired_results", "repair_requests", "parse_failures")
+
+# Single-image tasks and the analyzer method that runs each one
+TASK_METHODS = {
+    "analysis": "analyze_product_image",
+    "ocr": "extract_text_from_image",
+    "alt_text": "generate_alt_text",
+    "full_analysis": "full_analysis",
+    "multilingual": "analyze_product_multilingual",
+}
+
+
+class BaseVisualProductAnalyzer:
+    """
+    Prompts, request construction, caching and response parsing shared by
+    the sync and async analyzers. Each task is described by a request spec:
+    {"task", "images", "labels", "system", "prompt", "max_tokens", "tool", "validate"}.
+    
+    JSON tasks name a tool whose input schema the model must fill in;
+    "validate" turns the decoded input into a typed result.
+    """
+
+    def __init__(
+        self,
+        cache: Optional[ResultCache] = None,
+        preprocessor: Optional[ImagePreprocessor] = None,
+        metrics: Optional[MetricsRegistry] = None,
+    ):
+        self.model = "claude-sonnet-4-20250514"
+        self.cache = cache
+        self.preprocessor = preprocessor
+        # Per-call timings, tokens and bytes, by task and model
+        self.metrics = metrics if metrics is not None else REGISTRY
+        # Per-task model tiers; None sends everything to self.model
+        self.cascade = None
+        self._call_local = threading.local()
+        self._usage = {"requests": 0, **{field: 0 for field in USAGE_FIELDS}, **{field: 0 for field in PARSE_FIELDS}}
+        self._usage_lock = threading.Lock()
+        # (seconds to first streamed text, seconds to completion) of recent streams
+        self._stream_timings = deque(maxlen=1000)
+    
+    @staticmethod
+    def _full_prompt(spec: Dict) -> str:
+        return "\n\n".join(part for part in (spec.get("system"), spec["prompt"]) if part)
+    
+    def _cache_key(self, spec: Dict) -> Optional[str]:
+        """
+        Cache key for a request spec, or None when caching is disabled
+        """
+        if self.cache is None:
+            return None
+        params = {"max_tokens": spec["max_tokens"]}
+        if spec.get("tool"):
+            params["tool"] = spec["tool"]["name"]
+        if self.preprocessor is not None and self.preprocessor.enabled:
+            # What is uploaded depends on the preprocessing profile
+            params["preprocess"] = self.preprocessor.profile_for(spec["task"])
+        # A cascaded result may come from any of the task's models
+        model = ",".join(self.cascade.models_for(spec["task"])) if self.cascade is not None else self.model
+        return ResultCache.make_key(
+            [image.content_hash for image in spec["images"]], spec["task"], self._full_prompt(spec), model, params
+        )
+    
+    def is_cached(self, spec: Dict) -> bool:
+        """
+        Whether a request spec would be answered from the cache
+        """
+        key = self._cache_key(spec)
+        return key is not None and self.cache.contains(key)
+    
+    def _observe(self, spec: Dict, **values):
+        """
+        Record per-call measurements (see metrics.CALL_METRICS) in the
+        registry and in the calling thread's pending call metrics
+        """
+        self.metrics.record_call(values, task=spec["task"], model=spec.get("model") or self.model)
+        pending = getattr(self._call_local, "metrics", None)
+        if pending is None:
+            pending = self._call_local.metrics = {}
+        for field, value in values.items():
+            if value is not None:
+                pending[field] = pending.get(field, 0) + value
+    
+    def pop_call_metrics(self) -> Dict:
+        """
+        Measurements summed over the calls made on the calling thread since
+        the last pop, e.g. everything spent on one image
+        """
+        pending = getattr(self._call_local, "metrics", None) or {}
+        self._call_local.metrics = {}
+        return pending
+    
+    def encode_image(self, image: ImageInput, task: str = None) -> tuple:
+        """
+        Encode image to base64 and detect media type.
+        If a preprocessor is configured, the image is first resized and
+        re-encoded with the profile for the given task.
+        """
+        return ImageAsset.coerce(image).encoded(task, self.preprocessor)
+    
+    def _build_request(self, spec: Dict) -> Dict:
+        """
+        Keyword arguments for messages.create, with the images encoded
+        """
+        content = []
+        # Text-only specs keep their images for the cache key but don't upload them
+        images = [] if spec.get("text_only") else [ImageAsset.coerce(image) for image in spec["images"]]
+        read_seconds = encode_seconds = 0.0
+        for index, image in enumerate(images):
+            if spec.get("labels"):
+                content.append({
+                    "type": "text",
+                    "text": spec["labels"][index]
+                })
+            start = time.perf_counter()
+            # Images are read lazily; time the read apart from the encode
+            len(image.raw_bytes)
+            read = time.perf_counter()
+            image_data, media_type = self.encode_image(image, spec["task"])
+            read_seconds += read - start
+            encode_seconds += time.perf_counter() - read
+            content.append({
+                "type": "image",
+                "source": {
+                    "type": "base64",
+                    "media_type": media_type,
+                    "data": image_data,
+                },
+            })
+        content.append({
+            "type": "text",
+            "text": spec["prompt"]
+        })
+        request = {
+            "model": spec.get("model") or self.model,
+            "max_tokens": spec["max_tokens"],
+            "messages": [
                 {
                     "role": "user",
-                    "content": [
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": media_type,
-                                "data": image_data,
-                            },
-                        },
-                        {
-                            "type": "text",
-                            "text": prompt
-                        }
-                    ],
+                    "content": content,
                 }
             ],
+        }
+        if spec.get("system"):
+            # Static instructions first, marked cacheable; must stay byte-identical across calls
+            request["system"] = [{
+                "type": "text",
+                "text": spec["system"],
+                "cache_control": {"type": "ephemeral"},
+            }]
+        if spec.get("tool"):
+            # Tools precede the system prompt in the cached prefix and never change
+            request["tools"] = [spec["tool"]]
+            request["tool_choice"] = {"type": "tool", "name": spec["tool"]["name"]}
+        self._observe(
+            spec,
+            read_seconds=read_seconds if images else None,
+            encode_seconds=encode_seconds if images else None,
+            payload_bytes=len(json.dumps(request)),
         )
-        
-        # Parse JSON response
-        response_text = message.content[0].text
-        # Extract JSON from markdown code blocks if present
-        if "```json" in response_text:
-            response_text = response_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in response_text:
-            response_text = response_text.split("```")[1].split("```")[0].strip()
-        
-        return json.loads(response_text)
+        return request
     
-    def compare_product_images(self, image1_path: str, image2_path: str) -> str:
+    def estimate_input_tokens(self, spec: Dict) -> int:
         """
-        Compare two product images (useful for A/B testing, quality control)
+        Up-front input token estimate: image tokens from the image header
+        dimensions (after preprocessing) plus ~4 characters per text token
         """
-        image1_data, media_type1 = self.encode_image(image1_path)
-        image2_data, media_type2 = self.encode_image(image2_path)
-        
+        tokens = len(self._full_prompt(spec)) // 4 + len(json.dumps(spec.get("tool") or "")) // 4 + sum(len(label) // 4 for label in spec.get("labels") or [])
+        for image in [] if spec.get("text_only") else spec["images"]:
+            width, height = image.dimensions
+            if self.preprocessor is not None and self.preprocessor.enabled:
+                max_edge = self.preprocessor.profile_for(spec["task"]).get("max_edge")
+                if max_edge and max(width, height) > max_edge:
+                    scale = max_edge / max(width, height)
+                    width, height = int(width * scale), int(height * scale)
+            tokens += estimate_image_tokens(width, height)
+        return tokens
+    
+    def _record_usage(self, spec: Dict, message):
+        usage = getattr(message, "usage", None)
+        if usage is None:
+            return
+        tokens = {field: getattr(usage, field, None) or 0 for field in USAGE_FIELDS}
+        with self._usage_lock:
+            self._usage["requests"] += 1
+            for field in USAGE_FIELDS:
+                self._usage[field] += tokens[field]
+        # Priced per call, since a cascade's attempts run on different models
+        self._observe(spec, cost=estimate_cost(spec.get("model") or self.model, **tokens), **tokens)
+    
+    def _count(self, field: str):
+        with self._usage_lock:
+            self._usage[field] += 1
+    
+    def usage_stats(self) -> Dict:
+        """
+        Token usage summed over every response, including prompt cache
+        reads and writes, and how JSON results were parsed
+        """
+        with self._usage_lock:
+            stats = dict(self._usage)
+        parsed = sum(stats[field] for field in PARSE_FIELDS if field != "repair_requests")
+        stats["parse_failure_rate"] = stats["parse_failures"] / parsed if parsed else 0.0
+        cached = stats["cache_read_input_tokens"]
+        total_input = stats["input_tokens"] + stats["cache_creation_input_tokens"] + cached
+        stats["cache_read_ratio"] = cached / total_input if total_input else 0.0
+        return stats
+    
+    def _record_stream_timing(self, first_output: Optional[float], total: float):
+        with self._usage_lock:
+            self._stream_timings.append((total if first_output is None else first_output, total))
+    
+    def latency_stats(self) -> Dict:
+        """
+        Time to first visible output and to completion of streamed
+        requests (seconds, over the most recent streams)
+        """
+        with self._usage_lock:
+            timings = list(self._stream_timings)
+        stats = {"streams": len(timings)}
+        for index, name in enumerate(("first_output", "total")):
+            values = sorted(timing[index] for timing in timings)
+            for label, fraction in (("p50", 0.5), ("p95", 0.95)):
+                stats[f"{name}_{label}"] = values[min(len(values) - 1, int(fraction * len(values)))] if values else None
+        return stats
+    
+    def _parse_response(self, spec: Dict, message):
+        """
+        Result for a response: the validated tool input for JSON tasks
+        (falling back to repairing JSON from any text), otherwise the text.
+        Raises StructuredOutputError if no JSON can be recovered.
+        """
+        self._record_usage(spec, message)
+        start = time.perf_counter()
+        try:
+            return self._parse_message(spec, message)
+        finally:
+            self._observe(spec, parse_seconds=time.perf_counter() - start)
+    
+    def _parse_message(self, spec: Dict, message):
+        response_text = "".join(block.text for block in message.content if block.type == "text")
+        if spec.get("validate") is None:
+            return response_text
+        for block in message.content:
+            if block.type == "tool_use" and block.input:
+                self._count("structured_results")
+                return spec["validate"](block.input)
+        data = repair_json(response_text)
+        if data is None:
+            self._count("parse_failures")
+            raise StructuredOutputError("No JSON found in response", response_text)
+        self._count("repaired_results")
+        return spec["validate"](data)
+    
+    def _repair_spec(self, spec: Dict, response_text: str) -> Dict:
+        """
+        Text-only follow-up asking for an unparseable response as a tool
+        call, so the image is not sent (or paid for) again
+        """
+        self._count("repair_requests")
+        return {
+            "task": spec["task"],
+            "model": spec.get("model"),
+            "images": [],
+            "prompt": f"Convert this response into a call to the {spec['tool']['name']} tool:\n\n{response_text}",
+            "max_tokens": spec["max_tokens"],
+            "tool": spec["tool"],
+            "validate": spec["validate"],
+        }
+    
+    @staticmethod
+    def _validate_language(data: Dict, language: str) -> ProductListing:
+        # Tolerate the listing coming back keyed by its language code
+        if isinstance(data, dict) and isinstance(data.get(language), dict):
+            data = data[language]
+        return validate_listing(data)
+    
+    def _analysis_spec(self, image_path: ImageInput, product_category: str = None) -> Dict:
+        return {
+            "task": "analysis",
+            "images": [ImageAsset.coerce(image_path)],
+            "system": ANALYSIS_SYSTEM_PROMPT,
+            "prompt": f"Product Category: {product_category or 'Unknown'}",
+            "max_tokens": 2000,
+            "tool": ANALYSIS_TOOL,
+            "validate": validate_analysis,
+        }
+    
+    def _comparison_spec(self, image1_path: ImageInput, image2_path: ImageInput) -> Dict:
         prompt = """Compare these two product images and provide:
 1. Similarities (what's the same)
 2. Differences (what's different)
 3. Quality Assessment (which image is better for e-commerce and why)
 4. Recommendations (suggested improvements)
 Be specific and detailed."""
-        message = self.client.messages.create(
-            model=self.model,
-            max_tokens=1500,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "Image 1:"
-                        },
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": media_type1,
-                                "data": image1_data,
-                            },
-                        },
-                        {
-                            "type": "text",
-                            "text": "Image 2:"
-                        },
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": media_type2,
-                                "data": image2_data,
-                            },
-                        },
-                        {
-                            "type": "text",
-                            "text": prompt
-                        }
-                    ],
-                }
-            ],
-        )
-        
-        return message.content[0].text
+        return {
+            "task": "comparison",
+            "images": [ImageAsset.coerce(image1_path), ImageAsset.coerce(image2_path)],
+            "labels": ["Image 1:", "Image 2:"],
+            "prompt": prompt,
+            "max_tokens": 1500,
+        }
     
-    def extract_text_from_image(self, image_path: str) -> str:
-        """
-        OCR - Extract text from product packaging, labels, etc.
-        """
-        image_data, media_type = self.encode_image(image_path)
-        
+    def _ocr_spec(self, image_path: ImageInput) -> Dict:
         prompt = """Extract ALL text visible in this image.
 Maintain formatting where possible.
 Include:
@@ -171,38 +449,14 @@ Include:
 - Specifications
 - Any other text
 Output as plain text, maintaining structure."""
-        message = self.client.messages.create(
-            model=self.model,
-            max_tokens=2000,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": media_type,
-                                "data": image_data,
-                            },
-                        },
-                        {
-                            "type": "text",
-                            "text": prompt
-                        }
-                    ],
-                }
-            ],
-        )
-        
-        return message.content[0].text
+        return {
+            "task": "ocr",
+            "images": [ImageAsset.coerce(image_path)],
+            "prompt": prompt,
+            "max_tokens": 2000,
+        }
     
-    def generate_alt_text(self, image_path: str, context: str = None) -> str:
-        """
-        Generate accessibility alt text for images
-        """
-        image_data, media_type = self.encode_image(image_path)
-        
+    def _alt_text_spec(self, image_path: ImageInput, context: str = None) -> Dict:
         prompt = f"""Generate accessibility alt text for this image.
 Context: {context or "Product image for e-commerce"}
 Requirements:
@@ -214,96 +468,365 @@ Provide 3 options:
 1. Short (for quick scanning)
 2. Medium (balanced)
 3. Long (detailed)"""
-        message = self.client.messages.create(
-            model=self.model,
-            max_tokens=500,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": media_type,
-                                "data": image_data,
-                            },
-                        },
-                        {
-                            "type": "text",
-                            "text": prompt
-                        }
-                    ],
-                }
-            ],
-        )
-        
-        return message.content[0].text
+        return {
+            "task": "alt_text",
+            "images": [ImageAsset.coerce(image_path)],
+            "prompt": prompt,
+            "max_tokens": 500,
+        }
+    
+    def _full_analysis_spec(self, image_path: ImageInput, product_category: str = None, context: str = None) -> Dict:
+        prompt = f"""Product Category: {product_category or "Unknown"}
+Alt Text Context: {context or "Product image for e-commerce"}"""
+        return {
+            "task": "full_analysis",
+            "images": [ImageAsset.coerce(image_path)],
+            "system": FULL_ANALYSIS_SYSTEM_PROMPT,
+            "prompt": prompt,
+            "max_tokens": 4000,
+            "tool": FULL_ANALYSIS_TOOL,
+            "validate": validate_full_analysis,
+        }
+    
+    def _multilingual_spec(self, image_path: ImageInput, target_languages: List[str]) -> Dict:
+        return {
+            "task": "multilingual",
+            "images": [ImageAsset.coerce(image_path)],
+            "system": MULTILINGUAL_SYSTEM_PROMPT,
+            "prompt": f"Languages: {', '.join(target_languages)}",
+            "max_tokens": 3000,
+            "tool": MULTILINGUAL_TOOL,
+            "validate": validate_multilingual,
+        }
+    
+    def _language_spec(self, image_path: ImageInput, language: str, base_analysis: Dict = None) -> Dict:
+        """
+        One language of a multilingual listing. With base_analysis the
+        request is text-only and derived from that analysis.
+        """
+        prompt = f"Language: {language}"
+        if base_analysis is not None:
+            prompt += "\nProduct analysis:\n" + json.dumps(base_analysis, ensure_ascii=False, sort_keys=True)
+        return {
+            "task": "multilingual",
+            "images": [ImageAsset.coerce(image_path)],
+            "text_only": base_analysis is not None,
+            "system": LANGUAGE_SYSTEM_PROMPT,
+            "prompt": prompt,
+            "max_tokens": 800,
+            "tool": LISTING_TOOL,
+            "validate": functools.partial(self._validate_language, language=language),
+        }
+
 
-    def analyze_product_multilingual(self, image_path: str, target_languages: List[str]) -> Dict:
+class VisualProductAnalyzer(BaseVisualProductAnalyzer):
+    def __init__(
+        self,
+        cache: Optional[ResultCache] = None,
+        preprocessor: Optional[ImagePreprocessor] = None,
+        scheduler: Optional[AdaptiveScheduler] = None,
+        client: Optional[anthropic.Anthropic] = None,
+        hedging: Optional[HedgingPolicy] = None,
+        metrics: Optional[MetricsRegistry] = None,
+        cascade: Optional[ModelCascade] = None,
+    ):
+        super().__init__(cache=cache, preprocessor=preprocessor, metrics=metrics)
+        # Try a fast model first and escalate only when its answer doesn't hold up
+        self.cascade = cascade
+        # Duplicate requests slower than usual to reach a first token; for interactive use
+        self.hedging = hedging
+        # Shared keep-alive pool sized to the scheduler's concurrency ceiling
+        self.client = client or get_client(max_connections=scheduler.max_concurrency if scheduler else 32)
+        self.scheduler = scheduler
+        if scheduler is not None:
+            # The scheduler owns retries and backoff
+            self.client = self.client.with_options(max_retries=0)
+    
+    def _send_once(self, spec: Dict, attempts: List[int]):
+        """
+        One attempt at a request, hedged if a policy is set. Appends the
+        SDK's own retries of the attempt to attempts and feeds rate-limit
+        headers to the scheduler.
+        """
+        attempts.append(0)
+        if self.hedging is not None:
+            return self._send_hedged(spec)
+        raw = self.client.messages.with_raw_response.create(**self._build_request(spec))
+        attempts[-1] = getattr(raw, "retries_taken", 0)
+        if self.scheduler is not None:
+            self.scheduler.observe_headers(raw.headers)
+        return raw.parse()
+    
+    def _events(self, spec: Dict) -> Iterator:
+        """
+        Yield the events of a streamed request, hedged if a policy is set,
+        and return the final message
+        """
+        request = self._build_request(spec)
+        open_stream = lambda: self.client.messages.stream(**request)
+        on_open = self.scheduler.observe_headers if self.scheduler is not None else None
+        if self.hedging is not None:
+            return (yield from self.hedging.stream(open_stream, on_open))
+        with open_stream() as stream:
+            if on_open is not None:
+                on_open(stream.response.headers)
+            yield from stream
+            return stream.get_final_message()
+    
+    def _send_hedged(self, spec: Dict):
+        start = time.perf_counter()
+        first_token = None
+        events = self._events(spec)
+        while True:
+            try:
+                event = next(events)
+            except StopIteration as stop:
+                self._observe(spec, first_token_seconds=first_token)
+                return stop.value
+            if first_token is None and output_text(event):
+                first_token = time.perf_counter() - start
+    
+    def _send(self, spec: Dict):
+        attempts = []
+        errors = 0
+        start = time.perf_counter()
+        try:
+            if self.scheduler is None:
+                return self._send_once(spec, attempts)
+            return self.scheduler.call(
+                lambda: self._send_once(spec, attempts),
+                input_tokens=self.estimate_input_tokens(spec),
+                output_tokens=spec["max_tokens"],
+            )
+        except Exception:
+            errors = 1
+            raise
+        finally:
+            self._observe(
+                spec,
+                requests=1,
+                errors=errors,
+                retries=max(0, len(attempts) - 1) + sum(attempts),
+                request_seconds=time.perf_counter() - start,
+            )
+    
+    def _parse_with_repair(self, spec: Dict, message):
+        """
+        Parse a response; if no JSON can be recovered, ask for it again as
+        a text-only tool call instead of re-sending the image
+        """
+        try:
+            return self._parse_response(spec, message)
+        except StructuredOutputError as e:
+            repair = self._repair_spec(spec, e.text)
+            return self._parse_response(repair, self._send(repair))
+    
+    def _run(self, spec: Dict):
         """
-        Analyze product and generate descriptions in multiple languages
+        Serve a request from the cache, or send it and store the result on a miss
         """
-        image_data, media_type = self.encode_image(image_path)
+        def request():
+            if self.cascade is not None:
+                return self._run_cascade(spec)
+            return self._parse_with_repair(spec, self._send(spec))
         
-        languages_str = ", ".join(target_languages)
+        key = self._cache_key(spec)
+        if key is None:
+            return request()
+        return self.cache.get_or_compute(key, request)
+    
+    def _run_cascade(self, spec: Dict):
+        """
+        Send a request to each of the task's models in turn until one
+        answers acceptably; the last model's answer is always used
+        """
+        models = self.cascade.models_for(spec["task"])
+        escalations, attempts = [], []
+        for tier, model in enumerate(models):
+            tier_spec = dict(spec, model=model)
+            last = tier == len(models) - 1
+            start = time.perf_counter()
+            try:
+                message = self._send(tier_spec)
+            except anthropic.APIError:
+                if last:
+                    raise
+                attempts.append(self.cascade.record_call(model, time.perf_counter() - start))
+                escalations.append("error")
+                continue
+            attempts.append(self.cascade.record_call(model, time.perf_counter() - start, message))
+            if last:
+                result = self._parse_with_repair(tier_spec, message)
+            else:
+                try:
+                    result = self._parse_response(tier_spec, message)
+                except StructuredOutputError:
+                    escalations.append("invalid")
+                    continue
+                reason = self.cascade.escalation_reason(tier_spec, message, result)
+                if reason is not None:
+                    escalations.append(reason)
+                    continue
+            self.cascade.record_answer(spec["task"], model, tier, escalations, attempts)
+            return result
+    
+    def _stream(self, spec: Dict) -> Iterator[str]:
+        """
+        Yield response text as it is generated, then parse, cache and
+        return the full result. A cached result is yielded as one piece of
+        text. Streams are meant for interactive use and bypass the
+        scheduler's pacing and retries; with a hedging policy, a stream slow
+        to start is raced against a duplicate. Streams always use
+        self.model, since a cascade would have to discard visible output.
+        """
+        key = self._cache_key(spec)
+        cached = self.cache.get(key) if key is not None else None
+        if cached is not None:
+            yield cached if isinstance(cached, str) else json.dumps(cached, ensure_ascii=False)
+            return cached
         
-        prompt = f"""Analyze this product image and provide information in these languages: {languages_str}
-For EACH language, provide:
-1. Product Title (optimized for that market)
-2. Product Description (2-3 sentences, culturally appropriate)
-3. Key Features (3-5 bullet points)
-Languages: {languages_str}
-Format as JSON:
-{{
-  "en": {{
-    "title": "",
-    "description": "",
-    "features": []
-  }},
-  "es": {{...}},
-  "fr": {{...}}
-}}
-Ensure cultural appropriateness and natural phrasing for each language."""
-        message = self.client.messages.create(
-            model=self.model,
-            max_tokens=3000,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": media_type,
-                                "data": image_data,
-                            },
-                        },
-                        {
-                            "type": "text",
-                            "text": prompt
-                        }
-                    ],
-                }
-            ],
-        )
+        start = time.perf_counter()
+        first_output = None
+        events = self._events(spec)
+        while True:
+            try:
+                event = next(events)
+            except StopIteration as stop:
+                message = stop.value
+                break
+            # Text, or the tool input JSON for JSON tasks
+            text = output_text(event)
+            if not text:
+                continue
+            if first_output is None:
+                first_output = time.perf_counter() - start
+            yield text
+        total = time.perf_counter() - start
+        self._record_stream_timing(first_output, total)
+        self._observe(spec, requests=1, request_seconds=total, first_token_seconds=first_output)
         
-        response_text = message.content[0].text
-        if "```json" in response_text:
-            response_text = response_text.split("```json")[1].split("```")[0].strip()
+        result = self._parse_with_repair(spec, message)
+        if key is not None:
+            self.cache.put(key, result)
+        return result
+    
+    def _stream_json(self, spec: Dict) -> Iterator[Dict]:
+        """
+        Yield the JSON result parsed so far each time it grows; the last
+        snapshot is the complete, validated result
+        """
+        parser = IncrementalJSONParser()
+        previous = None
+        stream = self._stream(spec)
+        while True:
+            try:
+                text = next(stream)
+            except StopIteration as finished:
+                result = finished.value
+                break
+            value = parser.feed(text)
+            if isinstance(value, dict) and value != previous:
+                previous = value
+                yield value
+        if result != previous:
+            yield result
+    
+    def analyze_product_image(self, image_path: ImageInput, product_category: str = None) -> Dict:
+        """
+        Analyze a product image and extract structured information
+        """
+        return self._run(self._analysis_spec(image_path, product_category))
+    
+    def stream_analyze_product_image(self, image_path: ImageInput, product_category: str = None) -> Iterator[Dict]:
+        """
+        Streaming analyze_product_image: yields the analysis field by field
+        as it is generated
+        """
+        return self._stream_json(self._analysis_spec(image_path, product_category))
+    
+    def compare_product_images(self, image1_path: ImageInput, image2_path: ImageInput) -> str:
+        """
+        Compare two product images (useful for A/B testing, quality control)
+        """
+        return self._run(self._comparison_spec(image1_path, image2_path))
+    
+    def stream_compare_product_images(self, image1_path: ImageInput, image2_path: ImageInput) -> Iterator[str]:
+        """
+        Streaming compare_product_images: yields text chunks as they are generated
+        """
+        return self._stream(self._comparison_spec(image1_path, image2_path))
+    
+    def extract_text_from_image(self, image_path: ImageInput) -> str:
+        """
+        OCR - Extract text from product packaging, labels, etc.
+        """
+        return self._run(self._ocr_spec(image_path))
+    
+    def stream_extract_text_from_image(self, image_path: ImageInput) -> Iterator[str]:
+        """
+        Streaming extract_text_from_image: yields text chunks as they are generated
+        """
+        return self._stream(self._ocr_spec(image_path))
+    
+    def generate_alt_text(self, image_path: ImageInput, context: str = None) -> str:
+        """
+        Generate accessibility alt text for images
+        """
+        return self._run(self._alt_text_spec(image_path, context))
+    
+    def full_analysis(self, image_path: ImageInput, product_category: str = None, context: str = None) -> Dict:
+        """
+        Product analysis, alt text and OCR from a single request.
+        Returns {"analysis": ..., "alt_text": ..., "extracted_text": ...} with
+        the same shapes as analyze_product_image, generate_alt_text and
+        extract_text_from_image.
+        """
+        return self._run(self._full_analysis_spec(image_path, product_category, context))
+
+    def analyze_product_multilingual(
+        self,
+        image_path: ImageInput,
+        target_languages: List[str],
+        per_language: bool = False,
+        from_analysis: bool = False,
+    ) -> Dict:
+        """
+        Analyze product and generate descriptions in multiple languages.
         
-        return json.loads(response_text)
+        With per_language=True each language is its own request, sent in
+        parallel and cached per (image, language), so adding a language
+        only pays for that language. from_analysis=True additionally makes
+        those requests text-only, derived from the (cached) product analysis.
+        """
+        if not per_language:
+            return self._run(self._multilingual_spec(image_path, target_languages))
+        image = ImageAsset.coerce(image_path)
+        base_analysis = self.analyze_product_image(image) if from_analysis else None
+        specs = {language: self._language_spec(image, language, base_analysis) for language in target_languages}
+        with ThreadPoolExecutor(max_workers=max(1, len(specs))) as executor:
+            futures = {language: executor.submit(self._run, spec) for language, spec in specs.items()}
+            return {language: future.result() for language, future in futures.items()}
 
 
 def main():
-    analyzer = VisualProductAnalyzer()
+    parser = argparse.ArgumentParser(description="Visual Product Analyzer")
+    parser.add_argument("image", nargs="?", help="path to product image (prompted if omitted)")
+    parser.add_argument(
+        "--fused", action="store_true",
+        help="get analysis, alt text and OCR from a single request"
+    )
+    args = parser.parse_args()
+    
+    analyzer = VisualProductAnalyzer(
+        cache=ResultCache(default_cache_path()),
+        preprocessor=ImagePreprocessor(),
+    )
     
     print("Visual Product Analyzer")
     print("=" * 60)
     
     # Example: Analyze a product image
-    image_path = input("Enter path to product image: ")
+    image_path = args.image or input("Enter path to product image: ")
     
     if not os.path.exists(image_path):
         print("❌ Image not found!")
@@ -311,9 +834,19 @@ def main():
     
     print("\n🔍 Analyzing product image...")
     
+    # Read and encode the image once for all three tasks
+    image = ImageAsset(image_path)
+    
     try:
-        # Full analysis
-        analysis = analyzer.analyze_product_image(image_path)
+        if args.fused:
+            # One request for analysis, alt text and OCR
+            fused = analyzer.full_analysis(image)
+            analysis = fused["analysis"]
+            alt_text = fused["alt_text"]
+            text = fused["extracted_text"]
+        else:
+            # Full analysis
+            analysis = analyzer.analyze_product_image(image)
         
         print("\n" + "=" * 60)
         print("PRODUCT ANALYSIS")
@@ -324,14 +857,16 @@ def main():
         print("\n" + "=" * 60)
         print("ACCESSIBILITY ALT TEXT")
         print("=" * 60)
-        alt_text = analyzer.generate_alt_text(image_path)
+        if not args.fused:
+            alt_text = analyzer.generate_alt_text(image)
         print(alt_text)
         
         # Extract text (if any)
         print("\n" + "=" * 60)
         print("TEXT EXTRACTION (OCR)")
         print("=" * 60)
-        text = analyzer.extract_text_from_image(image_path)
+        if not args.fused:
+            text = analyzer.extract_text_from_image(image)
         print(text)
         
         # Save results
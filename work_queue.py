@@ -0,0 +1,271 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from result_cache import ResultCache
+
+
+def shard_for(content_hash: str, shards: int) -> int:
+    """
+    Shard of an image, from its SHA-256 content hash
+    """
+    return int(content_hash[:16], 16) % shards
+
+
+class WorkQueue:
+    """
+    SQLite-file work queue of images with lease and heartbeat semantics.
+
+    Every image is assigned a shard from its content hash. Workers claim
+    pending items, which leases them for lease_seconds; heartbeat()
+    extends a worker's leases while it works, and ack() records the
+    outcome. Items whose lease expires (a crashed or stalled worker) can
+    be claimed again, up to max_attempts. The database can be shared by
+    processes on one host, or on several hosts through a file system with
+    working locks.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = 300.0, max_attempts: int = 3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        # Autocommit mode, so claims can take the write lock with BEGIN IMMEDIATE
+        self._db = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS items (
+                image TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                shard INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                worker TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                updated_at REAL NOT NULL
+            )"""
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_items_claim ON items (status, shard, lease_expires)")
+
+    def enqueue(self, image_paths: Iterable[str], shards: int, batch_size: int = 1000) -> Dict:
+        """
+        Add images, sharded by content hash. Safe to repeat: completed
+        items stay completed unless their content changed, and failed
+        items are queued again with fresh attempts. Files whose size and
+        mtime are unchanged are not hashed again.
+        """
+        counts = {"added": 0, "changed": 0, "retried": 0, "unchanged": 0}
+        rows = []
+        for image_path in image_paths:
+            image_path = str(image_path)
+            stat = os.stat(image_path)
+            with self._lock:
+                known = self._db.execute(
+                    "SELECT content_hash, size, mtime_ns, status FROM items WHERE image = ?", (image_path,)
+                ).fetchone()
+            if known is not None and known[1] == stat.st_size and known[2] == stat.st_mtime_ns:
+                content_hash = known[0]
+            else:
+                content_hash = ResultCache.hash_file(image_path)
+
+            if known is None:
+                counts["added"] += 1
+            elif known[0] != content_hash:
+                counts["changed"] += 1
+            elif known[3] == "failed":
+                counts["retried"] += 1
+            else:
+                counts["unchanged"] += 1
+            rows.append((image_path, content_hash, stat.st_size, stat.st_mtime_ns, shard_for(content_hash, shards), time.time()))
+            if len(rows) >= batch_size:
+                self._insert(rows)
+                rows = []
+        self._insert(rows)
+        return counts
+
+    def _insert(self, rows: List[Tuple]):
+        if not rows:
+            return
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.executemany(
+                    """INSERT INTO items (image, content_hash, size, mtime_ns, shard, status, updated_at)
+                    VALUES (?, ?, ?, ?, ?, 'pending', ?)
+                    ON CONFLICT (image) DO UPDATE SET
+                        size = excluded.size,
+                        mtime_ns = excluded.mtime_ns,
+                        shard = excluded.shard,
+                        attempts = CASE WHEN items.content_hash != excluded.content_hash OR items.status = 'failed'
+                            THEN 0 ELSE items.attempts END,
+                        status = CASE WHEN items.content_hash != excluded.content_hash OR items.status = 'failed'
+                            THEN 'pending' ELSE items.status END,
+                        content_hash = excluded.content_hash,
+                        updated_at = excluded.updated_at""",
+                    rows,
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def claim(self, worker: str, limit: int = 1, shard: Optional[int] = None) -> List[Tuple[str, int]]:
+        """
+        Lease up to limit pending or expired items to a worker, optionally
+        from one shard only; returns (image, shard) pairs
+        """
+        now = time.time()
+        params = [now, self.max_attempts]
+        shard_clause = ""
+        if shard is not None:
+            shard_clause = " AND shard = ?"
+            params.append(shard)
+        params.append(limit)
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                items = self._db.execute(
+                    f"""SELECT image, shard FROM items
+                    WHERE (status = 'pending' OR (status = 'leased' AND lease_expires < ?))
+                    AND attempts < ?{shard_clause}
+                    ORDER BY shard, image LIMIT ?""",
+                    params,
+                ).fetchall()
+                self._db.executemany(
+                    """UPDATE items SET status = 'leased', worker = ?, lease_expires = ?,
+                    attempts = attempts + 1, updated_at = ? WHERE image = ?""",
+                    [(worker, now + self.lease_seconds, now, image) for image, _ in items],
+                )
+                # Expired leases that used their last attempt
+                self._db.execute(
+                    """UPDATE items SET status = 'failed', error = 'Lease expired too many times', updated_at = ?
+                    WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?""",
+                    (now, now, self.max_attempts),
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return [tuple(item) for item in items]
+
+    def outstanding(self) -> int:
+        """
+        Items pending or leased, i.e. not yet finished by anyone
+        """
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM items WHERE status IN ('pending', 'leased')").fetchone()[0]
+
+    def heartbeat(self, worker: str, images: Iterable[str]) -> int:
+        """
+        Extend a worker's leases; returns how many it still holds
+        """
+        images = list(images)
+        if not images:
+            return 0
+        now = time.time()
+        with self._lock:
+            cursor = self._db.executemany(
+                "UPDATE items SET lease_expires = ? WHERE image = ? AND worker = ? AND status = 'leased'",
+                [(now + self.lease_seconds, image, worker) for image in images],
+            )
+            return cursor.rowcount
+
+    def ack(self, worker: str, image: str, result: Dict) -> bool:
+        """
+        Record a worker's result for an item. A failed item goes back to
+        pending until it has used max_attempts. Returns False if the
+        worker no longer holds the lease, in which case nothing changes.
+        """
+        now = time.time()
+        success = result.get("status") == "success"
+        with self._lock:
+            cursor = self._db.execute(
+                """UPDATE items SET
+                    status = CASE WHEN ? THEN 'done' WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                    worker = NULL, lease_expires = NULL, result = ?, error = ?, updated_at = ?
+                WHERE image = ? AND worker = ? AND status = 'leased'""",
+                (
+                    success,
+                    self.max_attempts,
+                    json.dumps(result, ensure_ascii=False, default=str),
+                    result.get("error"),
+                    now,
+                    image,
+                    worker,
+                ),
+            )
+            return cursor.rowcount == 1
+
+    def release(self, worker: str):
+        """
+        Return a worker's leased items to the queue, e.g. on shutdown
+        """
+        with self._lock:
+            self._db.execute(
+                """UPDATE items SET status = 'pending', worker = NULL, lease_expires = NULL,
+                attempts = MAX(0, attempts - 1), updated_at = ?
+                WHERE worker = ? AND status = 'leased'""",
+                (time.time(), worker),
+            )
+
+    def results(self, fetch_size: int = 500) -> Iterator[Dict]:
+        """
+        The latest result of every finished item, in image order. Rows are
+        streamed in chunks of fetch_size through a dedicated read
+        connection, so a large merge neither holds every row in memory nor
+        blocks workers on the queue's lock.
+        """
+        db = sqlite3.connect(self.path, timeout=60)
+        try:
+            cursor = db.execute(
+                """SELECT image, result, error FROM items
+                WHERE status = 'done' OR status = 'failed' ORDER BY image"""
+            )
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    return
+                for image, result, error in rows:
+                    if result is not None:
+                        yield json.loads(result)
+                    else:
+                        # Failed without an ack, e.g. its leases kept expiring
+                        yield {"image": image, "status": "error", "error": error}
+        finally:
+            db.close()
+
+    def stats(self) -> Dict:
+        """
+        Items by status, items by shard and live leases by worker
+        """
+        now = time.time()
+        with self._lock:
+            statuses = dict(self._db.execute("SELECT status, COUNT(*) FROM items GROUP BY status").fetchall())
+            shards = dict(self._db.execute("SELECT shard, COUNT(*) FROM items GROUP BY shard").fetchall())
+            workers = dict(self._db.execute(
+                "SELECT worker, COUNT(*) FROM items WHERE status = 'leased' AND lease_expires >= ? GROUP BY worker",
+                (now,),
+            ).fetchall())
+        return {
+            "items": sum(statuses.values()),
+            "pending": statuses.get("pending", 0),
+            "leased": statuses.get("leased", 0),
+            "done": statuses.get("done", 0),
+            "failed": statuses.get("failed", 0),
+            "shards": shards,
+            "workers": workers,
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()